@@ -5,6 +5,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scada_backend.settings')
 django.setup()
 
 from scada.models import ObjectType, PipelineObject, TagTemplate, Tag
+from scada.provisioning import provision_tags
 
 def create_pipeline_system():
     print("Создание нефтепроводной системы...")
@@ -80,44 +81,23 @@ def create_pipeline_system():
         ('Клапан', '001', 'Задвижка 1000мм', 124.8),
     ]
 
-    for obj_type_name, index, name, km_mark in PIPELINE_OBJECTS:
-        obj_type = ObjectType.objects.get(name=obj_type_name)
-        pipeline_obj, created = PipelineObject.objects.get_or_create(
-            object_type=obj_type,
+    types_by_name = {obj_type.name: obj_type for obj_type in ObjectType.objects.all()}
+    created_objects = PipelineObject.objects.bulk_create([
+        PipelineObject(
+            object_type=types_by_name[obj_type_name],
             index=index,
-            defaults={
-                'name': name,
-                'km_mark': km_mark,
-                'location': f'Километр {km_mark}'
-            }
+            name=name,
+            km_mark=km_mark,
+            location=f'Километр {km_mark}'
         )
-        if created:
-            print(f'✓ Создан объект: {name}')
+        for obj_type_name, index, name, km_mark in PIPELINE_OBJECTS
+    ], ignore_conflicts=True)
+    print(f'✓ Объектов обработано: {len(created_objects)}')
 
-    # Автоматически создаем теги для всех объектов
+    # Теги для всех объектов по шаблонам их типа — одной транзакцией
     print("Создание тегов...")
-    for pipeline_obj in PipelineObject.objects.all():
-        # Находим все шаблоны для этого типа объекта
-        templates = TagTemplate.objects.filter(object_type=pipeline_obj.object_type)
-        
-        for template in templates:
-            tag_name = template.name_template.replace('{index}', pipeline_obj.index)
-            tag_description = template.description_template.replace('{index}', pipeline_obj.index)
-            
-            tag, created = Tag.objects.get_or_create(
-                tag_template=template,
-                pipeline_object=pipeline_obj,
-                defaults={
-                    'name': tag_name,
-                    'description': tag_description,
-                    'data_type': template.data_type,
-                    'engineering_units': template.engineering_units,
-                    'min_value': template.min_value,
-                    'max_value': template.max_value,
-                }
-            )
-            if created:
-                print(f'✓ Создан тег: {tag_name}')
+    result = provision_tags(archive_missing=False)
+    print(f"✓ Создано тегов: {result['created']}, обновлено: {result['updated']}")
 
     print("\n✅ Нефтепроводная система успешно создана!")
     print(f"   - Типов объектов: {ObjectType.objects.count()}")
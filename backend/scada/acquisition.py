@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import math
+import time
+from collections import namedtuple
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .ingest import ingest_values
+from .modbus import BIT_TYPES, MAX_BITS, MAX_REGISTERS, WIDTHS, ConnectionPool, ModbusError, decode
+from .models import ModbusDevice, ModbusPoint
+
+logger = logging.getLogger('scada.acquisition')
+
+GOOD_QUALITY = 100
+BAD_QUALITY = 0
+
+# Точка внутри блока: смещение от начала блока и параметры преобразования
+BlockPoint = namedtuple('BlockPoint', 'tag_id index data_type word_swap scale offset')
+Block = namedtuple('Block', 'register_type address count points')
+
+
+def plan_blocks(points, max_gap=None):
+    """
+    Группирует точки (ModbusPoint) одного устройства и класса опроса в
+    блочные чтения подряд идущих регистров: блок не длиннее ограничения
+    протокола (125 регистров, 2000 битов), разрыв между соседними точками
+    внутри блока не больше max_gap адресов (лишние адреса читаются вместе
+    с блоком — это дешевле отдельного запроса).
+    """
+    if max_gap is None:
+        max_gap = settings.MODBUS_MAX_GAP
+    blocks = []
+    by_type = {}
+    for point in points:
+        by_type.setdefault(point.register_type, []).append(point)
+    for register_type, typed in sorted(by_type.items()):
+        limit = MAX_BITS if register_type in BIT_TYPES else MAX_REGISTERS
+        typed.sort(key=lambda point: point.address)
+        start = end = None
+        members = []
+        for point in typed:
+            width = 1 if register_type in BIT_TYPES else WIDTHS[point.data_type]
+            if members and (point.address - end > max_gap or point.address + width - start > limit):
+                blocks.append(_block(register_type, start, end, members))
+                members = []
+            if not members:
+                start = point.address
+                end = point.address
+            members.append(point)
+            end = max(end, point.address + width)
+        if members:
+            blocks.append(_block(register_type, start, end, members))
+    return blocks
+
+
+def _block(register_type, start, end, points):
+    return Block(register_type, start, end - start, tuple(
+        BlockPoint(
+            point.tag_id, point.address - start,
+            'BOOL' if register_type in BIT_TYPES else point.data_type,
+            point.word_swap, point.scale, point.offset,
+        )
+        for point in points
+    ))
+
+
+def load_plan(device_names=None):
+    """
+    План опроса: список (устройство, {класс опроса, мс: [Block, ...]})
+    по включённым устройствам и точкам неархивных тегов.
+    """
+    devices = ModbusDevice.objects.filter(is_enabled=True)
+    if device_names:
+        devices = devices.filter(name__in=device_names)
+    points = {}
+    for point in ModbusPoint.objects.filter(
+        device__in=devices, is_enabled=True, tag__is_archived=False
+    ).order_by():
+        points.setdefault(point.device_id, {}).setdefault(point.scan_class, []).append(point)
+    return [
+        (device, {scan_class: plan_blocks(items) for scan_class, items in points[device.pk].items()})
+        for device in devices
+        if device.pk in points
+    ]
+
+
+class AcquisitionService:
+    """
+    Служба сбора данных: опрос устройств Modbus TCP по классам опроса.
+
+    Для каждого устройства открывается пул соединений; каждый класс опроса
+    устройства — отдельная задача asyncio, которая раз в период читает все
+    свои блоки параллельно (в пределах пула). Цикл, не уложившийся в период,
+    засчитывается как перерасход, пропущенные такты не навёрстываются.
+    Значения копятся и отдаются ingest_values пакетами раз в
+    ACQUISITION_FLUSH_SECONDS или по достижении ACQUISITION_BATCH_ROWS строк;
+    запись идёт в отдельном потоке и не задерживает опрос. При ошибке
+    чтения блока его точки один раз пишутся с плохим качеством (последнее
+    значение), до восстановления связи.
+    """
+
+    def __init__(self, plan, flush_seconds=None, batch_rows=None, writer=ingest_values):
+        self.plan = plan
+        self.flush_seconds = settings.ACQUISITION_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self.batch_rows = settings.ACQUISITION_BATCH_ROWS if batch_rows is None else batch_rows
+        self._write = database_sync_to_async(writer)
+        self._pending = []
+        self._flush_now = None
+        self._stopping = False
+        self._last_values = {}
+        self._failed_blocks = set()
+        self.stats = {
+            'points': 0, 'reads': 0, 'errors': 0, 'overruns': 0,
+            'written': 0, 'batches': 0, 'write_seconds': 0.0,
+        }
+
+    @property
+    def point_count(self):
+        return sum(
+            len(block.points) for _, scan_classes in self.plan
+            for blocks in scan_classes.values() for block in blocks
+        )
+
+    async def run(self, duration=None):
+        """Опрашивает устройства duration секунд (None — до отмены)"""
+        self._flush_now = asyncio.Event()
+        self._stopping = False
+        pools = []
+        scans = []
+        for device, scan_classes in self.plan:
+            pool = ConnectionPool(device.host, device.port, device.connections, device.timeout)
+            pools.append(pool)
+            for scan_class, blocks in scan_classes.items():
+                scans.append(asyncio.create_task(self._scan(device, pool, scan_class / 1000.0, blocks)))
+        writer = asyncio.create_task(self._writer())
+        try:
+            if duration is None:
+                await asyncio.gather(*scans)
+            else:
+                await asyncio.sleep(duration)
+        finally:
+            for task in scans:
+                task.cancel()
+            await asyncio.gather(*scans, return_exceptions=True)
+            # Запись не прерывается: дописываются все накопленные значения
+            self._stopping = True
+            self._flush_now.set()
+            await writer
+            for pool in pools:
+                pool.close()
+
+    async def _scan(self, device, pool, period, blocks):
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+        while True:
+            timestamp = timezone.now()
+            results = await asyncio.gather(
+                *(self._read_block(device, pool, block, timestamp) for block in blocks), return_exceptions=True,
+            )
+            # Непредвиденная ошибка блока не должна останавливать опрос устройства
+            for block, result in zip(blocks, results):
+                if isinstance(result, Exception):
+                    self._block_failed(device, block, timestamp, result, unexpected=True)
+            if len(self._pending) >= self.batch_rows:
+                self._flush_now.set()
+            next_at += period
+            delay = next_at - loop.time()
+            if delay < 0:
+                self.stats['overruns'] += 1
+                next_at += math.ceil(-delay / period) * period
+                delay = next_at - loop.time()
+            await asyncio.sleep(delay)
+
+    async def _read_block(self, device, pool, block, timestamp):
+        key = (device.pk, block.register_type, block.address)
+        try:
+            registers = await pool.read(device.unit_id, block.register_type, block.address, block.count)
+        except ModbusError as exc:
+            self._block_failed(device, block, timestamp, exc)
+            return
+        if key in self._failed_blocks:
+            self._failed_blocks.discard(key)
+            logger.info('Устройство %s, блок %s:%d: связь восстановлена', device.name, block.register_type, block.address)
+        self.stats['reads'] += 1
+        self.stats['points'] += len(block.points)
+        last_values = self._last_values
+        rows = self._pending
+        for point in block.points:
+            value = decode(registers, point.index, point.data_type, point.word_swap) * point.scale + point.offset
+            if math.isfinite(value):
+                last_values[point.tag_id] = value
+                rows.append((point.tag_id, value, GOOD_QUALITY, timestamp))
+
+    def _block_failed(self, device, block, timestamp, exc, unexpected=False):
+        """Ошибка блока: при первой подряд — запись в журнал и плохое качество точек"""
+        self.stats['errors'] += 1
+        key = (device.pk, block.register_type, block.address)
+        if key in self._failed_blocks:
+            return
+        self._failed_blocks.add(key)
+        if unexpected:
+            logger.error(
+                'Устройство %s, блок %s:%d: ошибка обработки', device.name, block.register_type, block.address,
+                exc_info=exc,
+            )
+        else:
+            logger.warning('Устройство %s, блок %s:%d: %s', device.name, block.register_type, block.address, exc)
+        self._pending.extend(
+            (point.tag_id, self._last_values[point.tag_id], BAD_QUALITY, timestamp)
+            for point in block.points if point.tag_id in self._last_values
+        )
+
+    async def _writer(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self._flush()
+        await self._flush()
+
+    async def _flush(self):
+        rows, self._pending = self._pending, []
+        for start in range(0, len(rows), self.batch_rows):
+            await self._write_batch(rows[start:start + self.batch_rows])
+
+    async def _write_batch(self, rows):
+        began = time.perf_counter()
+        try:
+            values, _, rejected = await self._write(rows)
+        except Exception:
+            logger.exception('Ошибка записи пакета из %d значений', len(rows))
+            return
+        self.stats['write_seconds'] += time.perf_counter() - began
+        self.stats['written'] += len(values)
+        self.stats['batches'] += 1
+        if rejected:
+            logger.warning('Пакет сбора: отклонено строк %d, первая ошибка: %s', len(rejected), rejected[0]['error'])
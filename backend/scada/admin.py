@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ObjectType, PipelineObject, TagTemplate, Tag, TagValue, AlarmDefinition, Alarm
+from .models import ObjectType, PipelineObject, TagTemplate, Tag, TagCurrentValue, TagRollup, TagValue, AlarmDefinition, Alarm, ModbusDevice, ModbusPoint
 
 @admin.register(ObjectType)
 class ObjectTypeAdmin(admin.ModelAdmin):
@@ -16,16 +16,16 @@ class PipelineObjectAdmin(admin.ModelAdmin):
 
 @admin.register(TagTemplate)
 class TagTemplateAdmin(admin.ModelAdmin):
-    list_display = ['object_type', 'name_template', 'data_type', 'engineering_units']
-    list_filter = ['object_type', 'data_type']
+    list_display = ['object_type', 'name_template', 'data_type', 'engineering_units', 'compression']
+    list_filter = ['object_type', 'data_type', 'compression']
     search_fields = ['name_template', 'description_template']
     list_per_page = 20
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ['name', 'pipeline_object', 'data_type', 'engineering_units', 'is_archived']
-    list_filter = ['pipeline_object__object_type', 'data_type', 'is_archived']
-    search_fields = ['name', 'description', 'pipeline_object__name']
+    list_display = ['name', 'pipeline_object', 'data_type', 'engineering_units', 'compression', 'is_archived']
+    list_filter = ['pipeline_object__object_type', 'data_type', 'compression', 'is_archived']
+    search_fields = ['name', 'description', 'pipeline_object__name', 'expression']
     list_editable = ['is_archived']
     list_per_page = 50
 
@@ -35,11 +35,26 @@ class TagValueAdmin(admin.ModelAdmin):
     list_filter = ['tag', 'timestamp', 'quality']
     search_fields = ['tag__name']
     readonly_fields = ['timestamp']
+    ordering = ['-timestamp']
+    list_per_page = 100
+
+@admin.register(TagCurrentValue)
+class TagCurrentValueAdmin(admin.ModelAdmin):
+    list_display = ['tag', 'value', 'quality', 'timestamp', 'updated_at']
+    search_fields = ['tag__name']
+    readonly_fields = ['updated_at']
+    list_per_page = 100
+
+@admin.register(TagRollup)
+class TagRollupAdmin(admin.ModelAdmin):
+    list_display = ['tag', 'interval', 'bucket', 'min', 'max', 'avg', 'count', 'last']
+    list_filter = ['interval']
+    search_fields = ['tag__name']
     list_per_page = 100
 
 @admin.register(AlarmDefinition)
 class AlarmDefinitionAdmin(admin.ModelAdmin):
-    list_display = ['name', 'tag', 'condition', 'trigger_value', 'severity', 'is_enabled']
+    list_display = ['name', 'tag', 'condition', 'trigger_value', 'deadband', 'severity', 'is_enabled', 'shelved_until']
     list_filter = ['severity', 'is_enabled', 'condition']
     search_fields = ['name', 'message', 'tag__name']
     list_editable = ['is_enabled']
@@ -51,4 +66,20 @@ class AlarmAdmin(admin.ModelAdmin):
     list_filter = ['state', 'triggered_at', 'alarm_definition__severity']
     search_fields = ['alarm_definition__name', 'alarm_definition__message']
     readonly_fields = ['triggered_at']
-    list_per_page = 50
\ No newline at end of file
+    list_per_page = 50
+
+@admin.register(ModbusDevice)
+class ModbusDeviceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'host', 'port', 'unit_id', 'connections', 'timeout', 'is_enabled']
+    list_filter = ['is_enabled']
+    search_fields = ['name', 'host']
+    list_editable = ['is_enabled']
+    list_per_page = 20
+
+@admin.register(ModbusPoint)
+class ModbusPointAdmin(admin.ModelAdmin):
+    list_display = ['tag', 'device', 'register_type', 'address', 'data_type', 'scale', 'offset', 'scan_class', 'is_enabled']
+    list_filter = ['device', 'register_type', 'scan_class', 'is_enabled']
+    search_fields = ['tag__name', 'device__name']
+    raw_id_fields = ['tag']
+    list_per_page = 100
@@ -0,0 +1,358 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .cache import bump_config_version, metadata
+from .models import Alarm, AlarmDefinition, AlarmEvent, TagCurrentValue
+from .realtime import publish_alarm_events
+
+OPEN_STATES = ('ACTIVE', 'ACKNOWLEDGED')
+EQ_TOLERANCE = 1e-9
+# Ключ advisory-блокировки PostgreSQL, упорядочивающей номера событий аварий
+EVENT_SEQUENCE_LOCK = 730001
+
+# Коды условий в скомпилированных правилах
+GT, LT, EQ, CHANGE = range(4)
+CONDITION_CODES = {'GT': GT, 'LT': LT, 'EQ': EQ, 'CHANGE': CHANGE}
+
+
+class AlarmEngine:
+    """
+    Инкрементальная проверка определений аварий по пакетам значений.
+
+    Включённые AlarmDefinition компилируются в индекс tag_id -> кортеж правил
+    (definition_id, код условия, порог, гистерезис, задержки, параметры
+    дребезга). Пакет проверяется только по тегам, у которых есть правила.
+    Для условия CHANGE хранится последнее значение тега.
+    Определения берутся из кэша метаданных; индекс перестраивается при
+    изменении версии конфигурации (см. cache.bump_config_version),
+    перезапуск не нужен.
+
+    Защита от лавины аварий (время — метки значений, таймеры проверяются при
+    поступлении значений):
+    - гистерезис: открытая авария GT сбрасывается, только когда значение
+      опустится ниже trigger - deadband (LT — выше trigger + deadband,
+      EQ — отклонится больше чем на deadband);
+    - on_delay/off_delay: условие должно непрерывно держаться (отсутствовать)
+      заданное время, прежде чем авария откроется (сбросится);
+    - дребезг: если за chatter_window секунд авария открылась chatter_count раз,
+      определение отключается (shelved_until) на shelve_duration секунд,
+      новые аварии по нему не открываются. Срабатывания считаются по
+      таблице Alarm (после окончания прошлого отключения), поэтому счёт
+      общий для всех процессов записи.
+
+    Состояние таймеров и последние значения меняются в копии на пакет и
+    применяются после фиксации транзакции записи: откат пакета их не
+    сдвигает. Открытая авария по определению одна (уникальный частичный
+    индекс alarm_one_open_idx); если её успел открыть другой процесс, своя
+    не создаётся.
+
+    Таймеры on_delay/off_delay — в памяти процесса: если значения тега с
+    задержками пишут несколько процессов, каждый видит только свою часть
+    ряда. Такие теги должен писать один процесс (служба сбора данных или
+    один клиент REST с привязкой к воркеру), см. docs/api.md.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = None
+        self._version = None
+        self._last_values = {}
+        self._shelved = {}
+        self._pending = {}
+        self._clearing = {}
+
+    def _ensure_index(self):
+        version = metadata.version
+        if self._rules is not None and version == self._version:
+            return
+        rules = {}
+        shelved = {}
+        for tag_id, definitions in metadata.definitions_by_tag().items():
+            rules[tag_id] = tuple(
+                (
+                    d.id, CONDITION_CODES[d.condition], d.trigger_value, abs(d.deadband),
+                    timedelta(seconds=d.on_delay), timedelta(seconds=d.off_delay),
+                    d.chatter_count, timedelta(seconds=d.chatter_window), timedelta(seconds=d.shelve_duration),
+                )
+                for d in definitions
+            )
+            for d in definitions:
+                if d.shelved_until is not None:
+                    shelved[d.id] = d.shelved_until
+        self._rules = rules
+        self._shelved = shelved
+        self._version = version
+
+        change_tags = [
+            tag_id for tag_id, tag_rules in self._rules.items()
+            if any(rule[1] == CHANGE for rule in tag_rules) and tag_id not in self._last_values
+        ]
+        if change_tags:
+            self._last_values.update(
+                TagCurrentValue.objects.filter(tag_id__in=change_tags).values_list('tag_id', 'value')
+            )
+
+    def evaluate(self, values):
+        """
+        Проверяет пакет TagValue и открывает/сбрасывает аварии пачками.
+        Возвращает кортеж (открытые Alarm, сброшенные Alarm, переходы);
+        события по переходам записывает вызывающий (record_transitions) —
+        последним шагом своей транзакции, см. lock_event_sequence.
+        """
+        with self._lock:
+            self._ensure_index()
+            rules = self._rules
+            hits = [tv for tv in values if tv.tag_id in rules]
+            if not hits:
+                return [], [], []
+            hits.sort(key=lambda tv: tv.timestamp)
+            return self._apply(hits, rules)
+
+    def _apply(self, hits, rules):
+        # Открытые аварии читаются на каждый пакет: их могли квитировать,
+        # сбросить или открыть другие процессы. Только по определениям тегов
+        # пакета (индекс по alarm_definition) — не все открытые аварии системы
+        tag_ids = {tv.tag_id for tv in hits}
+        definition_ids = {rule[0] for tag_id in tag_ids for rule in rules[tag_id]}
+        open_alarms = {
+            alarm.alarm_definition_id: alarm
+            for alarm in Alarm.objects.filter(alarm_definition_id__in=definition_ids, state__in=OPEN_STATES).only(
+                'id', 'alarm_definition_id', 'state', 'triggered_at'
+            )
+        }
+
+        opened = []
+        resolved = []
+        transitions = []
+        shelve = {}
+        # Копии состояния определений и тегов пакета; применяются после фиксации
+        last_values = {tag_id: self._last_values[tag_id] for tag_id in tag_ids if tag_id in self._last_values}
+        pending = {d: self._pending[d] for d in definition_ids if d in self._pending}
+        clearing = {d: self._clearing[d] for d in definition_ids if d in self._clearing}
+        shelved = {d: self._shelved[d] for d in definition_ids if d in self._shelved}
+        raised = {}
+        for tv in hits:
+            value = tv.value
+            timestamp = tv.timestamp
+            last = last_values.get(tv.tag_id)
+            for (definition_id, code, trigger, deadband, on_delay, off_delay,
+                 chatter_count, chatter_window, shelve_duration) in rules[tv.tag_id]:
+                alarm = open_alarms.get(definition_id)
+                # Для открытой аварии порог сброса смещён на гистерезис
+                band = deadband if alarm is not None else 0.0
+                if code == GT:
+                    active = value > trigger - band
+                elif code == LT:
+                    active = value < trigger + band
+                elif code == EQ:
+                    active = abs(value - trigger) <= max(EQ_TOLERANCE, band)
+                else:
+                    active = last is not None and abs(value - last) > trigger
+
+                if active:
+                    clearing.pop(definition_id, None)
+                    if alarm is not None:
+                        continue
+                    until = shelved.get(definition_id)
+                    if until is not None and timestamp < until:
+                        pending.pop(definition_id, None)
+                        continue
+                    since = pending.setdefault(definition_id, timestamp)
+                    if timestamp - since < on_delay:
+                        continue
+                    del pending[definition_id]
+                    alarm = Alarm(alarm_definition_id=definition_id, triggered_at=timestamp, state='ACTIVE')
+                    open_alarms[definition_id] = alarm
+                    opened.append(alarm)
+                    transitions.append((alarm, 'RAISED'))
+                    raised.setdefault(definition_id, []).append(timestamp)
+                    if chatter_count and self._chattering(
+                        definition_id, timestamp, chatter_count, chatter_window, until, raised[definition_id],
+                    ):
+                        shelved[definition_id] = shelve[definition_id] = timestamp + shelve_duration
+                else:
+                    pending.pop(definition_id, None)
+                    if alarm is None:
+                        continue
+                    since = clearing.setdefault(definition_id, timestamp)
+                    if timestamp - since < off_delay:
+                        continue
+                    del clearing[definition_id]
+                    alarm.state = 'RESOLVED'
+                    alarm.resolved_at = timestamp
+                    del open_alarms[definition_id]
+                    resolved.append(alarm)
+                    transitions.append((alarm, 'RESOLVED'))
+            last_values[tv.tag_id] = value
+
+        stored = [alarm for alarm in resolved if alarm.pk is not None]
+        with transaction.atomic():
+            if opened:
+                opened, transitions = self._create(opened, transitions)
+            if stored:
+                Alarm.objects.bulk_update(stored, ['state', 'resolved_at'], batch_size=1000)
+            if shelve:
+                for definition_id, until in shelve.items():
+                    AlarmDefinition.objects.filter(pk=definition_id).update(shelved_until=until)
+                transaction.on_commit(bump_config_version, robust=True)
+            transaction.on_commit(lambda: self._commit(definition_ids, last_values, pending, clearing, shelve))
+        return opened, resolved, transitions
+
+    @staticmethod
+    def _create(opened, transitions):
+        """
+        Вставляет открытые аварии. Если по определению аварию уже открыл
+        другой процесс (нарушен alarm_one_open_idx), своя отбрасывается вместе
+        с её переходами. Возвращает пару (созданные аварии, переходы).
+        """
+        try:
+            with transaction.atomic():
+                Alarm.objects.bulk_create(opened)
+            return opened, transitions
+        except IntegrityError:
+            taken = set(Alarm.objects.filter(
+                alarm_definition_id__in={alarm.alarm_definition_id for alarm in opened}, state__in=OPEN_STATES,
+            ).values_list('alarm_definition_id', flat=True))
+            dropped = {id(alarm) for alarm in opened if alarm.alarm_definition_id in taken and alarm.state != 'RESOLVED'}
+            opened = [alarm for alarm in opened if id(alarm) not in dropped]
+            Alarm.objects.bulk_create(opened)
+            return opened, [item for item in transitions if id(item[0]) not in dropped]
+
+    def _commit(self, definition_ids, last_values, pending, clearing, shelve):
+        """Применяет состояние пакета после фиксации записи"""
+        with self._lock:
+            self._last_values.update(last_values)
+            self._shelved.update(shelve)
+            for definition_id in definition_ids:
+                for state, changed in ((self._pending, pending), (self._clearing, clearing)):
+                    if definition_id in changed:
+                        state[definition_id] = changed[definition_id]
+                    else:
+                        state.pop(definition_id, None)
+
+    @staticmethod
+    def _chattering(definition_id, timestamp, chatter_count, chatter_window, shelved_until, raised):
+        """
+        True, если за окно chatter_window до timestamp (и после окончания
+        прошлого отключения shelved_until) авария открылась chatter_count
+        раз: записанные аварии — запросом к Alarm, raised — открытые в этом
+        пакете, ещё не записанные
+        """
+        since = timestamp - chatter_window
+        if shelved_until is not None and shelved_until > since:
+            since = shelved_until
+        recent = sum(1 for moment in raised if moment > since)
+        if recent >= chatter_count:
+            return True
+        stored = Alarm.objects.filter(
+            alarm_definition_id=definition_id, triggered_at__gt=since, triggered_at__lte=timestamp,
+        ).count()
+        return stored + recent >= chatter_count
+
+
+def _isoformat(moment):
+    return moment.isoformat() if moment else None
+
+
+def alarm_payload(alarm, definition):
+    return {
+        'id': alarm.pk,
+        'name': definition.name,
+        'message': definition.message,
+        'severity': definition.severity,
+        'tag_name': definition.tag.name,
+        'state': alarm.state,
+        'triggered_at': _isoformat(alarm.triggered_at),
+        'acknowledged_at': _isoformat(alarm.acknowledged_at),
+        'resolved_at': _isoformat(alarm.resolved_at),
+    }
+
+
+def lock_event_sequence():
+    """
+    Блокирует выдачу номеров событий аварий до конца текущей транзакции.
+
+    id AlarmEvent выделяется при INSERT, а виден после фиксации: без
+    блокировки параллельные транзакции (запись значений, квитирование,
+    службы сбора и обнаружения утечек) фиксируются не в порядке id, и
+    меньший seq становится видимым позже большего. С блокировкой номера
+    видны строго по возрастанию. SQLite и так допускает одну пишущую
+    транзакцию.
+
+    Цена: блокировка держится до фиксации, и транзакции, записывающие
+    события, фиксируются по одной. Поэтому её берут как можно позже —
+    record_transitions вызывается последним шагом транзакции (запись
+    значений — после вставки архива и текущих значений), и сериализуется
+    только хвост транзакции: INSERT событий и COMMIT. Пакеты без переходов
+    аварий блокировку не берут.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [EVENT_SEQUENCE_LOCK])
+
+
+def record_transitions(transitions):
+    """
+    Записывает переходы состояний аварий (список пар (Alarm, переход)) одним
+    bulk_create в AlarmEvent и после фиксации транзакции публикует их в поток
+    изменений (ошибка публикации только логируется). Порядковый номер
+    события — его id; номера выдаются под lock_event_sequence, поэтому
+    вызывать её нужно последним шагом транзакции.
+    """
+    if not transitions:
+        return []
+    with transaction.atomic():
+        lock_event_sequence()
+        events = AlarmEvent.objects.bulk_create([
+            AlarmEvent(alarm_id=alarm.pk, transition=transition) for alarm, transition in transitions
+        ])
+    definitions = AlarmDefinition.objects.select_related('tag').in_bulk(
+        {alarm.alarm_definition_id for alarm, _ in transitions}
+    )
+    payloads = [
+        {
+            'seq': event.pk,
+            'transition': transition,
+            'alarm': alarm_payload(alarm, definitions[alarm.alarm_definition_id]),
+        }
+        for event, (alarm, transition) in zip(events, transitions)
+    ]
+    transaction.on_commit(lambda: publish_alarm_events(payloads), robust=True)
+    return payloads
+
+
+def prune_alarm_events(now=None):
+    """
+    Удаляет события аварий старше ALARM_EVENT_RETENTION_DAYS (0 — хранить
+    бессрочно) порциями по ALARM_EVENT_DELETE_BATCH по возрастанию id.
+    Клиент, переподключившийся с last_seq раньше первого оставшегося
+    события, получает снимок. Возвращает число удалённых событий.
+    """
+    days = settings.ALARM_EVENT_RETENTION_DAYS
+    if days <= 0:
+        return 0
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    deleted = 0
+    while True:
+        ids = list(
+            AlarmEvent.objects.filter(created_at__lt=cutoff).order_by('id')
+            .values_list('id', flat=True)[:settings.ALARM_EVENT_DELETE_BATCH]
+        )
+        if not ids:
+            return deleted
+        deleted += AlarmEvent.objects.filter(id__in=ids).delete()[0]
+
+
+engine = AlarmEngine()
+
+
+def evaluate_values(values):
+    """
+    Проверяет пакет записанных значений по определениям аварий. Возвращает
+    переходы для record_transitions в конце транзакции записи.
+    """
+    return engine.evaluate(values)[2]
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def create_tagvalue_partitions(sender, **kwargs):
+    from .partitions import ensure_partitions
+    ensure_partitions()
+
 
 class ScadaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scada'
-    verbose_name = 'SCADA Система'
\ No newline at end of file
+    verbose_name = 'SCADA Система'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .cache import collect_metrics as collect_cache_metrics
+        from .calculations import collect_metrics as collect_calculation_metrics
+        from .metrics import install_sql_wrapper, registry
+        from .writebuffer import collect_metrics as collect_buffer_metrics
+        registry.add_collector(collect_cache_metrics)
+        registry.add_collector(collect_buffer_metrics)
+        registry.add_collector(collect_calculation_metrics)
+        post_migrate.connect(create_tagvalue_partitions, sender=self)
+        connection_created.connect(install_sql_wrapper)
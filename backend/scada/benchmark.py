@@ -0,0 +1,211 @@
+import json
+import random
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .alarms import evaluate_values
+from .ingest import ingest_values
+from .leaks import MassBalance, Segment
+from .models import Tag, TagCurrentValue, TagValue
+from .realtime import tag_value_payload
+from .renderers import MessagePackRenderer, ORJSONRenderer
+from .serialization import dumps_json, dumps_msgpack
+from .rollups import HOUR, MINUTE, build_rollups
+from .serializers import TagSerializer
+from .simulation import PlantSimulator
+from .trends import aggregate_buckets, lttb_series, range_statistics
+
+
+def percentiles(samples):
+    """Сводка латентностей в миллисекундах"""
+    data = np.array(samples, dtype=np.float64) * 1000
+    if not len(data):
+        return {'count': 0}
+    p50, p95, p99 = np.percentile(data, [50, 95, 99])
+    return {
+        'count': len(data),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'max_ms': round(float(data.max()), 2),
+    }
+
+
+def bench_ingest(tags, start, ticks, interval, batch_rows, seed=None):
+    """
+    Запись синтетической истории пакетами через ingest_values (сжатие,
+    аварии, текущие значения — как в API). Возвращает пропускную способность.
+    """
+    simulator = PlantSimulator.for_tags(tags, seed=seed)
+    durations = []
+    accepted = stored = 0
+    pending = []
+
+    def flush():
+        nonlocal accepted, stored
+        began = time.perf_counter()
+        values, stored_values, _ = ingest_values(pending)
+        durations.append(time.perf_counter() - began)
+        accepted += len(values)
+        stored += len(stored_values)
+        pending.clear()
+
+    for _, rows in simulator.run(start, ticks, interval):
+        pending.extend(rows)
+        if len(pending) >= batch_rows:
+            flush()
+    if pending:
+        flush()
+
+    total = sum(durations)
+    return {
+        'rows': accepted,
+        'stored': stored,
+        'seconds': round(total, 3),
+        'rows_per_second': round(accepted / total) if total else None,
+        'batch_latency': percentiles(durations),
+    }
+
+
+def bench_alarms(tags, start, ticks, interval, seed=None):
+    """Латентность проверки аварий на отсчёт всех тегов (без записи истории)"""
+    simulator = PlantSimulator.for_tags(tags, seed=seed)
+    durations = []
+    for _, rows in simulator.run(start, ticks, interval):
+        values = [
+            TagValue(tag_id=tag_id, value=value, quality=quality, timestamp=timestamp)
+            for tag_id, value, quality, timestamp in rows
+        ]
+        began = time.perf_counter()
+        evaluate_values(values)
+        durations.append(time.perf_counter() - began)
+    result = percentiles(durations)
+    result['values_per_tick'] = len(tags)
+    return result
+
+
+def bench_rollups(now):
+    began = time.perf_counter()
+    written = build_rollups(MINUTE, now=now) + build_rollups(HOUR, now=now)
+    return {'rows': written, 'seconds': round(time.perf_counter() - began, 3)}
+
+
+def bench_queries(tag_ids, start, end, queries, buckets=500, max_tags=5, seed=None):
+    """
+    Латентность трендов (aggregate, lttb) и статистики на случайных окнах:
+    от минут до всего интервала, 1..max_tags случайных тегов.
+    """
+    rng = random.Random(seed)
+    span = (end - start).total_seconds()
+    timings = {'aggregate': [], 'lttb': [], 'statistics': []}
+    for _ in range(queries):
+        selected = rng.sample(tag_ids, min(len(tag_ids), rng.randint(1, max_tags)))
+        width = span * rng.choice([0.01, 0.1, 0.5, 1.0])
+        window_start = start + timedelta(seconds=rng.uniform(0, span - width))
+        window_end = window_start + timedelta(seconds=width)
+        for name, query in (
+            ('aggregate', lambda: aggregate_buckets(selected, window_start, window_end, buckets)),
+            ('lttb', lambda: lttb_series(selected, window_start, window_end, buckets)),
+            ('statistics', lambda: range_statistics(selected, window_start, window_end)),
+        ):
+            began = time.perf_counter()
+            query()
+            timings[name].append(time.perf_counter() - began)
+    return {name: percentiles(samples) for name, samples in timings.items()}
+
+
+def bench_serialization(repeats=20):
+    """
+    Кодирование ответов: список тегов TagSerializer (как /api/tags/ без
+    пагинации) рендерерами DRF JSON, orjson и MessagePack и кадр tag_updates
+    WebSocket со всеми текущими значениями через json.dumps, orjson и
+    MessagePack. Время сериализатора (в объекты Python) — отдельно.
+    """
+    tags = list(Tag.objects.filter(is_archived=False).select_related('pipeline_object__object_type', 'current'))
+    began = time.perf_counter()
+    for _ in range(repeats):
+        data = TagSerializer(tags, many=True).data
+    result = {'tags': len(tags), 'serializer_ms': round((time.perf_counter() - began) / repeats * 1000, 2)}
+    frame = {'type': 'tag_updates', 'data': [
+        dict(tag_value_payload(current), tag_name=current.tag.name)
+        for current in TagCurrentValue.objects.select_related('tag')
+    ]}
+    cases = (
+        ('rest_json', lambda: JSONRenderer().render(data)),
+        ('rest_orjson', lambda: ORJSONRenderer().render(data)),
+        ('rest_msgpack', lambda: MessagePackRenderer().render(data)),
+        ('ws_json', lambda: json.dumps(frame)),
+        ('ws_orjson', lambda: dumps_json(frame).decode()),
+        ('ws_msgpack', lambda: dumps_msgpack(frame)),
+    )
+    for name, encode in cases:
+        began = time.perf_counter()
+        for _ in range(repeats):
+            encoded = encode()
+        result[name] = {
+            'ms': round((time.perf_counter() - began) / repeats * 1000, 3),
+            'bytes': len(encoded),
+        }
+    return result
+
+
+def bench_mass_balance(segments=500, seconds=600, window=300, seed=None):
+    """
+    Баланс расхода (scada/leaks.py) без БД: segments участков цепочкой
+    станций, отсчёт каждой станции раз в секунду за seconds секунд, расчёт
+    небаланса каждую секунду. Утечка 5% на среднем участке со второй
+    половины прогона. Возвращает скорость приёма отсчётов, время расчёта
+    и небаланс участка с утечкой.
+    """
+    rng = random.Random(seed)
+    chain = [Segment((i, ''), (i + 1, ''), i, i + 1, -i) for i in range(segments)]
+    balance = MassBalance(chain, window)
+    leak = segments // 2
+    start = time.time() - seconds
+    add_seconds = evaluate_seconds = 0.0
+    for second in range(seconds):
+        timestamp = start + second
+        samples = [
+            (station, 1000.0 * (1 + rng.gauss(0, 0.003)) - (50.0 if second >= seconds // 2 and station > leak else 0.0))
+            for station in range(segments + 1)
+        ]
+        began = time.perf_counter()
+        for station, value in samples:
+            balance.add(station, value, 100, timestamp)
+        add_seconds += time.perf_counter() - began
+        began = time.perf_counter()
+        imbalance = balance.evaluate()
+        evaluate_seconds += time.perf_counter() - began
+    others = np.delete(imbalance, leak)
+    return {
+        'segments': segments,
+        'samples': balance.samples,
+        'samples_per_second': round(balance.samples / add_seconds),
+        'evaluate_ms': round(evaluate_seconds / seconds * 1000, 3),
+        'leak_imbalance_pct': round(float(imbalance[leak]), 2),
+        'other_max_pct': round(float(np.nanmax(np.abs(others))), 2),
+    }
+
+
+def run_benchmark(tags, ticks, interval, batch_rows, queries, alarm_ticks, seed=None):
+    """
+    Полный прогон: запись истории, построение агрегатов, проверка аварий,
+    запросы трендов. История пишется в прошлое, заканчиваясь текущим моментом.
+    """
+    now = timezone.now()
+    start = now - timedelta(seconds=ticks * interval)
+    tag_ids = [tag_id for tag_id, _, _, _ in tags]
+    return {
+        'tags': len(tags),
+        'ingest': bench_ingest(tags, start, ticks, interval, batch_rows, seed=seed),
+        'rollups': bench_rollups(now + timedelta(seconds=settings.ROLLUP_DELAY_SECONDS)),
+        'alarms': bench_alarms(tags, now, alarm_ticks, interval, seed=seed),
+        'queries': bench_queries(tag_ids, start, now, queries, seed=seed),
+        'serialization': bench_serialization(),
+        'mass_balance': bench_mass_balance(seed=seed),
+    }
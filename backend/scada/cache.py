@@ -0,0 +1,303 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import AlarmDefinition, Tag
+
+logger = logging.getLogger('scada.cache')
+
+# Общий для всех процессов счётчик версии конфигурации (Django cache, в
+# production — Redis). Любое изменение тегов, шаблонов, объектов или
+# определений аварий увеличивает его.
+VERSION_KEY = 'scada:config_version'
+# Сколько отсутствующих ключей помнить, чтобы не запрашивать их повторно
+NEGATIVE_CACHE_MAX = 10000
+
+TagMeta = namedtuple('TagMeta', [
+    'id', 'name', 'pipeline_object_id', 'object_type_id', 'tag_template_id',
+    'data_type', 'engineering_units', 'min_value', 'max_value', 'is_archived',
+    # Настройки сжатия с учётом шаблона
+    'compression', 'deadband_abs', 'deadband_pct', 'swinging_door_tolerance', 'compression_max_seconds',
+    # Выражение вычисляемого тега (пусто у обычных)
+    'expression',
+])
+
+DefinitionMeta = namedtuple('DefinitionMeta', [
+    'id', 'tag_id', 'condition', 'trigger_value', 'deadband', 'on_delay', 'off_delay',
+    'chatter_count', 'chatter_window', 'shelve_duration', 'shelved_until',
+])
+
+_TAG_FIELDS = (
+    'id', 'name', 'pipeline_object_id', 'pipeline_object__object_type_id', 'tag_template_id',
+    'data_type', 'engineering_units', 'min_value', 'max_value', 'is_archived',
+    'compression', 'deadband_abs', 'deadband_pct', 'swinging_door_tolerance', 'compression_max_seconds',
+    'tag_template__compression', 'tag_template__deadband_abs', 'tag_template__deadband_pct',
+    'tag_template__swinging_door_tolerance', 'tag_template__compression_max_seconds', 'expression',
+)
+
+
+def _tag_meta(row):
+    (tag_id, name, object_id, object_type_id, template_id, data_type, units, min_value, max_value,
+     is_archived, mode, db_abs, db_pct, sdt, max_seconds,
+     tpl_mode, tpl_db_abs, tpl_db_pct, tpl_sdt, tpl_max_seconds, expression) = row
+    return TagMeta(
+        tag_id, name, object_id, object_type_id, template_id, data_type, units, min_value, max_value,
+        is_archived,
+        mode or tpl_mode,
+        tpl_db_abs if db_abs is None else db_abs,
+        tpl_db_pct if db_pct is None else db_pct,
+        tpl_sdt if sdt is None else sdt,
+        tpl_max_seconds if max_seconds is None else max_seconds,
+        expression,
+    )
+
+
+def _increment_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+        return 1
+
+
+def bump_config_version():
+    """
+    Помечает кэш метаданных устаревшим во всех процессах. Если общий кэш
+    недоступен, сбрасывается кэш своего процесса, а увеличение версии
+    повторяется при следующей успешной сверке (MetadataCache._check).
+    """
+    try:
+        version = _increment_version()
+    except Exception as exc:
+        logger.error('Общий кэш недоступен (%s): версия конфигурации будет увеличена позже', exc)
+        # Локальная версия (отрицательная, своя у процесса) сбрасывает кэши,
+        # привязанные к версии: дерево активов, настройки сжатия, граф вычислений
+        metadata.invalidate(-time.time_ns(), pending=True)
+        return
+    metadata.invalidate(version)
+
+
+class MetadataCache:
+    """
+    Кэш метаданных процесса: id -> TagMeta, имя -> id, объект -> теги,
+    тег -> определения аварий.
+
+    Заполняется лениво: недостающие ключи читаются одним запросом на вызов,
+    отсутствующие в БД запоминаются. Весь кэш сбрасывается при смене общей
+    версии конфигурации; версия проверяется не чаще раза в
+    METADATA_CACHE_CHECK_SECONDS, изменение в своём процессе видно сразу.
+
+    Недоступность общего кэша (Redis) не останавливает запись: остаётся
+    последняя известная версия (0, если её ещё не было), сверка повторяется
+    через METADATA_CACHE_RETRY_SECONDS, ошибка пишется в журнал один раз до
+    восстановления.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._checked = 0.0
+        self._retry_at = 0.0
+        self._unavailable = False
+        # Увеличение общей версии, не выполненное из-за недоступности кэша
+        self._pending = False
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.invalidations = 0
+        self._reset()
+
+    def _reset(self):
+        self._tags = {}
+        self._names = {}
+        self._object_tags = {}
+        self._negatives = 0
+        self._definitions = None
+
+    @property
+    def version(self):
+        self._check()
+        return self._version
+
+    def _check(self):
+        now = time.monotonic()
+        if self._version is not None and (
+                now - self._checked < settings.METADATA_CACHE_CHECK_SECONDS or now < self._retry_at):
+            return
+        try:
+            if self._pending:
+                _increment_version()
+                self._pending = False
+            version = cache.get(VERSION_KEY, 0)
+        except Exception as exc:
+            with self._lock:
+                if self._version is None:
+                    self._version = 0
+                if not self._unavailable:
+                    logger.error('Общий кэш недоступен (%s): используется версия конфигурации %s', exc, self._version)
+                self._unavailable = True
+                self._retry_at = now + settings.METADATA_CACHE_RETRY_SECONDS
+            return
+        if self._unavailable:
+            logger.warning('Общий кэш снова доступен')
+            self._unavailable = False
+        with self._lock:
+            self._checked = now
+            if version != self._version:
+                if self._version is not None:
+                    self.invalidations += 1
+                self._reset()
+                self._version = version
+
+    def invalidate(self, version=None, pending=False):
+        """
+        Сбрасывает кэш; version — уже известная новая версия, pending —
+        общую версию нужно увеличить при следующей сверке
+        """
+        with self._lock:
+            self.invalidations += 1
+            self._reset()
+            self._version = version
+            self._checked = time.monotonic() if version is not None else 0.0
+            self._pending = self._pending or pending
+
+    def _remember_missing(self, mapping, keys):
+        for key in keys:
+            if self._negatives >= NEGATIVE_CACHE_MAX:
+                return
+            mapping[key] = None
+            self._negatives += 1
+
+    def tags(self, tag_ids):
+        """Словарь id -> TagMeta для существующих тегов (включая архивные)"""
+        self._check()
+        with self._lock:
+            result = {}
+            missing = []
+            for tag_id in tag_ids:
+                if tag_id in self._tags:
+                    meta = self._tags[tag_id]
+                    if meta is not None:
+                        result[tag_id] = meta
+                else:
+                    missing.append(tag_id)
+            self.hits += len(tag_ids) - len(missing)
+            if missing:
+                self.misses += len(missing)
+                self.loads += 1
+                for row in Tag.objects.filter(id__in=missing).values_list(*_TAG_FIELDS):
+                    meta = self._store(_tag_meta(row))
+                    result[meta.id] = meta
+                self._remember_missing(self._tags, [tag_id for tag_id in missing if tag_id not in result])
+            return result
+
+    def _store(self, meta):
+        self._tags[meta.id] = meta
+        self._names[meta.name] = meta.id
+        return meta
+
+    def resolve(self, keys):
+        """
+        Разрешает идентификаторы и имена тегов (как в пакете записи).
+        Возвращает словарь ключ -> id для неархивных тегов.
+        """
+        ids = set()
+        names = set()
+        for key in keys:
+            if isinstance(key, int) and not isinstance(key, bool):
+                ids.add(key)
+            elif isinstance(key, str):
+                if key.isdigit():
+                    ids.add(int(key))
+                names.add(key)
+
+        found = self.tags(ids)
+        with self._lock:
+            missing = [name for name in names if name not in self._names]
+            self.hits += len(names) - len(missing)
+            if missing:
+                self.misses += len(missing)
+                self.loads += 1
+                for row in Tag.objects.filter(name__in=missing).values_list(*_TAG_FIELDS):
+                    self._store(_tag_meta(row))
+                self._remember_missing(self._names, [name for name in missing if name not in self._names])
+            for name in names:
+                tag_id = self._names.get(name)
+                if tag_id is not None:
+                    found.setdefault(tag_id, self._tags[tag_id])
+
+        resolved = {}
+        for meta in found.values():
+            if meta.is_archived:
+                continue
+            resolved[meta.id] = meta.id
+            resolved[str(meta.id)] = meta.id
+            resolved[meta.name] = meta.id
+        return resolved
+
+    def object_tags(self, object_ids):
+        """Множество id неархивных тегов объектов"""
+        self._check()
+        with self._lock:
+            missing = [object_id for object_id in object_ids if object_id not in self._object_tags]
+            self.hits += len(object_ids) - len(missing)
+            if missing:
+                self.misses += len(missing)
+                self.loads += 1
+                loaded = {object_id: [] for object_id in missing}
+                for row in Tag.objects.filter(pipeline_object_id__in=missing).values_list(*_TAG_FIELDS):
+                    meta = self._store(_tag_meta(row))
+                    if not meta.is_archived:
+                        loaded[meta.pipeline_object_id].append(meta.id)
+                for object_id, tag_ids in loaded.items():
+                    self._object_tags[object_id] = tuple(tag_ids)
+            return {tag_id for object_id in object_ids for tag_id in self._object_tags[object_id]}
+
+    def definitions_by_tag(self):
+        """Словарь tag_id -> кортеж DefinitionMeta включённых определений неархивных тегов"""
+        self._check()
+        with self._lock:
+            if self._definitions is not None:
+                self.hits += 1
+                return self._definitions
+            self.misses += 1
+            self.loads += 1
+            definitions = {}
+            rows = AlarmDefinition.objects.filter(
+                is_enabled=True, tag__is_archived=False
+            ).values_list(*DefinitionMeta._fields)
+            for row in rows:
+                meta = DefinitionMeta(*row)
+                definitions.setdefault(meta.tag_id, []).append(meta)
+            self._definitions = {tag_id: tuple(items) for tag_id, items in definitions.items()}
+            return self._definitions
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'loads': self.loads,
+                'invalidations': self.invalidations,
+                'tags': sum(1 for meta in self._tags.values() if meta is not None),
+            }
+
+
+metadata = MetadataCache()
+
+
+def collect_metrics():
+    """Статистика кэша метаданных для /metrics"""
+    stats = metadata.stats()
+    return [
+        ('scada_metadata_cache_hits_total', 'counter', 'Попадания в кэш метаданных', stats['hits']),
+        ('scada_metadata_cache_misses_total', 'counter', 'Промахи кэша метаданных', stats['misses']),
+        ('scada_metadata_cache_loads_total', 'counter', 'Запросы к БД для заполнения кэша', stats['loads']),
+        ('scada_metadata_cache_invalidations_total', 'counter', 'Сбросы кэша метаданных', stats['invalidations']),
+        ('scada_metadata_cache_tags', 'gauge', 'Тегов в кэше метаданных', stats['tags']),
+    ]
@@ -0,0 +1,382 @@
+"""
+Вычисляемые теги.
+
+Тег с непустым Tag.expression получает значения не из пакетов записи, а по
+выражению над другими тегами, например
+
+    PRESSURE_OUT_001 - PRESSURE_IN_001
+    sum(VOLUME_001, VOLUME_002, VOLUME_003)
+    max(0, tag("T-1.FLOW") * 0.85) if STATUS_001 > 0 else 0
+
+Выражение — арифметика Python над числами: + - * / // % **, сравнения,
+and/or/not, x if условие else y, функции FUNCTIONS и константа pi. Имя тега,
+не являющееся идентификатором Python, записывается как tag("имя").
+Выражение разбирается модулем ast, проверяется по белому списку узлов и
+компилируется один раз; ссылки на теги заменяются обращениями к словарю
+значений по id.
+
+Все вычисляемые теги образуют граф зависимостей (graphlib), который строится
+заново при смене версии конфигурации (см. cache.py). На пакет записи
+пересчитываются только теги ниже по графу от тегов пакета, в
+топологическом порядке; значения — как обычные TagValue (сжатие, архив,
+аварии, текущие значения, WebSocket).
+"""
+import ast
+import graphlib
+import logging
+import math
+import threading
+from collections import namedtuple
+from itertools import groupby
+from operator import attrgetter
+
+from .cache import metadata
+from .models import Tag, TagCurrentValue, TagValue
+
+logger = logging.getLogger('scada.calculations')
+
+
+def _sum(*values):
+    return math.fsum(values)
+
+
+def _avg(*values):
+    return math.fsum(values) / len(values)
+
+
+def _clamp(value, low, high):
+    return min(max(value, low), high)
+
+
+def _round(value, digits=0):
+    # Числовые константы выражения — float (см. _Rewriter): round(x, 2.0)
+    if digits != int(digits):
+        raise ValueError('Число знаков round должно быть целым')
+    return round(value, int(digits))
+
+
+FUNCTIONS = {
+    'abs': abs, 'min': min, 'max': max, 'round': _round,
+    'sqrt': math.sqrt, 'exp': math.exp, 'log': math.log, 'log10': math.log10,
+    'sum': _sum, 'avg': _avg, 'clamp': _clamp,
+}
+CONSTANTS = {'pi': math.pi}
+
+_BINARY = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+_UNARY = (ast.UAdd, ast.USub, ast.Not)
+_COMPARE = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+# Словарь значений входов в пространстве имён выражения
+_VALUES = '_v'
+# Длина выражения и глубина дерева разбора: разбор и компиляция рекурсивны,
+# глубоко вложенное выражение иначе даёт RecursionError
+MAX_EXPRESSION_LENGTH = 2000
+MAX_EXPRESSION_DEPTH = 200
+
+Calculation = namedtuple('Calculation', 'tag_id code inputs')
+Graph = namedtuple('Graph', 'calculations dependents rank')
+
+
+class ExpressionError(ValueError):
+    """Выражение вычисляемого тега некорректно"""
+
+
+def _tag_reference(node):
+    """Имя тега, на которое ссылается узел (NAME или tag("name")), либо None"""
+    if isinstance(node, ast.Name) and node.id not in CONSTANTS:
+        return node.id
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'tag'
+            and len(node.args) == 1 and not node.keywords
+            and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+        return node.args[0].value
+    return None
+
+
+def _depth(tree):
+    """Глубина дерева разбора (обход без рекурсии)"""
+    deepest = 0
+    stack = [(tree, 1)]
+    while stack:
+        node, depth = stack.pop()
+        deepest = max(deepest, depth)
+        stack.extend((child, depth + 1) for child in ast.iter_child_nodes(node))
+    return deepest
+
+
+def _collect(node, names):
+    """Проверка узлов по белому списку; имена тегов собираются в names"""
+    reference = _tag_reference(node)
+    if reference is not None:
+        names.add(reference)
+    elif isinstance(node, ast.Expression):
+        _collect(node.body, names)
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, _BINARY):
+        _collect(node.left, names)
+        _collect(node.right, names)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, _UNARY):
+        _collect(node.operand, names)
+    elif isinstance(node, ast.BoolOp):
+        for value in node.values:
+            _collect(value, names)
+    elif isinstance(node, ast.Compare) and all(isinstance(op, _COMPARE) for op in node.ops):
+        for child in (node.left, *node.comparators):
+            _collect(child, names)
+    elif isinstance(node, ast.IfExp):
+        for child in (node.test, node.body, node.orelse):
+            _collect(child, names)
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            raise ExpressionError('Допустимы функции: ' + ', '.join(sorted(FUNCTIONS)) + ', tag("имя")')
+        for arg in node.args:
+            _collect(arg, names)
+    elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        pass
+    elif not isinstance(node, ast.Name):  # имя здесь — только константа из CONSTANTS
+        raise ExpressionError(f'Недопустимая конструкция: {ast.unparse(node)}')
+
+
+class _Rewriter(ast.NodeTransformer):
+    """Ссылки на теги -> _v[id], числовые константы -> float"""
+
+    def __init__(self, tag_ids):
+        self.tag_ids = tag_ids
+
+    def _value(self, node):
+        return ast.copy_location(ast.Subscript(
+            value=ast.Name(id=_VALUES, ctx=ast.Load()),
+            slice=ast.Constant(value=self.tag_ids[_tag_reference(node)]),
+            ctx=ast.Load(),
+        ), node)
+
+    def visit_Name(self, node):
+        return node if _tag_reference(node) is None else self._value(node)
+
+    def visit_Call(self, node):
+        if _tag_reference(node) is not None:
+            return self._value(node)
+        # Имя функции не трогаем, только аргументы
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+    def visit_Constant(self, node):
+        # Целые в float: 10 ** 10 ** 10 переполняется, а не вычисляется часами
+        return ast.copy_location(ast.Constant(value=float(node.value)), node)
+
+
+def compile_expression(expression, resolve=None):
+    """
+    Проверяет и компилирует выражение. resolve — функция {имя: id} по
+    множеству имён (по умолчанию кэш метаданных, только неархивные теги).
+    Возвращает пару (объект кода, множество id входных тегов);
+    ошибки — ExpressionError, в том числе для выражения длиннее
+    MAX_EXPRESSION_LENGTH или глубже MAX_EXPRESSION_DEPTH.
+    """
+    expression = expression.strip()
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError(f'Выражение длиннее {MAX_EXPRESSION_LENGTH} символов')
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as exc:
+        raise ExpressionError(f'Синтаксическая ошибка: {exc.msg}')
+    except (RecursionError, MemoryError):
+        raise ExpressionError('Выражение слишком сложное')
+    if _depth(tree) > MAX_EXPRESSION_DEPTH:
+        raise ExpressionError(f'Вложенность выражения больше {MAX_EXPRESSION_DEPTH}')
+    names = set()
+    _collect(tree, names)
+    if not names:
+        raise ExpressionError('Выражение не ссылается ни на один тег')
+    tag_ids = (resolve or metadata.resolve)(names)
+    unknown = sorted(names - tag_ids.keys())
+    if unknown:
+        raise ExpressionError(f"Неизвестные теги: {', '.join(unknown)}")
+    try:
+        code = compile(ast.fix_missing_locations(_Rewriter(tag_ids).visit(tree)), '<expression>', 'eval')
+    except (RecursionError, MemoryError):
+        raise ExpressionError('Выражение слишком сложное')
+    return code, set(tag_ids.values())
+
+
+def namespace(values):
+    """Глобальные имена для eval: функции, константы и словарь {id тега: значение}"""
+    return {'__builtins__': {}, **FUNCTIONS, **CONSTANTS, _VALUES: values}
+
+
+def evaluate(code, values):
+    """Значение скомпилированного выражения на словаре {id тега: значение}"""
+    return float(eval(code, namespace(values)))
+
+
+def build_graph(rows, resolve=None):
+    """
+    Граф вычисляемых тегов по строкам (id, имя, выражение): компиляция,
+    проверка циклов, топологический порядок. Теги с ошибкой в выражении,
+    в цикле и зависящие от них исключаются с записью в журнал.
+    """
+    calculated = {tag_id for tag_id, _, _ in rows}
+    calculations = {}
+    for tag_id, name, expression in rows:
+        try:
+            code, inputs = compile_expression(expression, resolve)
+        except ExpressionError as exc:
+            logger.error('Вычисляемый тег %s: %s', name, exc)
+            continue
+        calculations[tag_id] = Calculation(tag_id, code, frozenset(inputs))
+
+    while True:
+        sorter = graphlib.TopologicalSorter({
+            tag_id: calculation.inputs & calculated for tag_id, calculation in calculations.items()
+        })
+        try:
+            order = list(sorter.static_order())
+            break
+        except graphlib.CycleError as exc:
+            cycle = set(exc.args[1])
+            logger.error('Вычисляемые теги образуют цикл: %s', sorted(cycle))
+            for tag_id in cycle:
+                calculations.pop(tag_id, None)
+
+    rank = {}
+    dependents = {}
+    for tag_id in order:
+        calculation = calculations.get(tag_id)
+        if calculation is None:
+            continue
+        broken = (calculation.inputs & calculated) - calculations.keys()
+        if broken:
+            logger.error('Вычисляемый тег %s не считается: входы %s исключены', tag_id, sorted(broken))
+            del calculations[tag_id]
+            continue
+        rank[tag_id] = len(rank)
+        for input_id in calculation.inputs:
+            dependents.setdefault(input_id, []).append(tag_id)
+    return Graph(calculations, dependents, rank)
+
+
+def check_graph(tag_id, inputs, graph):
+    """
+    Проверка перед сохранением выражения тега tag_id (None — новый тег):
+    не образует ли оно цикл с существующими вычисляемыми тегами.
+    """
+    if tag_id is None:
+        return
+    if tag_id in inputs:
+        raise ExpressionError('Выражение ссылается на сам тег')
+    edges = {other: set(calculation.inputs) for other, calculation in graph.calculations.items()}
+    edges[tag_id] = set(inputs)
+    try:
+        tuple(graphlib.TopologicalSorter(edges).static_order())
+    except graphlib.CycleError as exc:
+        names = metadata.tags(set(exc.args[1]))
+        cycle = ' -> '.join(names[item].name if item in names else str(item) for item in exc.args[1])
+        raise ExpressionError(f'Цикл зависимостей: {cycle}')
+
+
+class CalculationEngine:
+    """
+    Пересчёт вычисляемых тегов по пакетам записи.
+
+    Граф строится лениво и заново при смене версии конфигурации. На пакет:
+    значения группируются по метке времени (по возрастанию); для каждой
+    метки пересчитываются теги ниже по графу от тегов этой метки, в
+    топологическом порядке. Значения остальных входов — последние
+    известные: из пакета или из текущих значений (один запрос на пакет).
+    Качество результата — минимальное качество входов. Тег, у которого
+    нет значения какого-либо входа или выражение не вычислилось (деление
+    на ноль, вне области определения), на этой метке пропускается.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._graph = None
+        self.evaluations = 0
+        self.errors = 0
+
+    def graph(self):
+        version = metadata.version
+        with self._lock:
+            if self._version == version and self._graph is not None:
+                return self._graph
+        rows = list(Tag.objects.filter(is_archived=False).exclude(expression='').values_list('id', 'name', 'expression'))
+        graph = build_graph(rows)
+        with self._lock:
+            self._version, self._graph = version, graph
+        return graph
+
+    def downstream(self, graph, tag_ids):
+        """Вычисляемые теги, зависящие (транзитивно) от tag_ids, в порядке пересчёта"""
+        found = set()
+        stack = [tag_id for tag_id in tag_ids if tag_id in graph.dependents]
+        while stack:
+            for dependent in graph.dependents.get(stack.pop(), ()):
+                if dependent not in found:
+                    found.add(dependent)
+                    stack.append(dependent)
+        return sorted(found, key=graph.rank.__getitem__)
+
+    def calculate(self, values):
+        """Значения вычисляемых тегов (список TagValue) по пакету values"""
+        graph = self.graph()
+        relevant = [tag_value for tag_value in values if tag_value.tag_id in graph.dependents]
+        if not relevant:
+            return []
+        affected = self.downstream(graph, {tag_value.tag_id for tag_value in relevant})
+        inputs = set().union(*(graph.calculations[tag_id].inputs for tag_id in affected))
+        current = {}
+        qualities = {}
+        for tag_id, value, quality in TagCurrentValue.objects.filter(tag_id__in=inputs).values_list(
+            'tag_id', 'value', 'quality'
+        ):
+            current[tag_id] = value
+            qualities[tag_id] = quality
+
+        results = []
+        plans = {}
+        names = namespace(current)
+        relevant.sort(key=attrgetter('timestamp'))
+        for timestamp, group in groupby(relevant, key=attrgetter('timestamp')):
+            changed = set()
+            for tag_value in group:
+                current[tag_value.tag_id] = tag_value.value
+                qualities[tag_value.tag_id] = tag_value.quality
+                changed.add(tag_value.tag_id)
+            key = frozenset(changed)
+            if key not in plans:
+                plans[key] = [graph.calculations[tag_id] for tag_id in self.downstream(graph, changed)]
+            for calculation in plans[key]:
+                if not calculation.inputs <= current.keys():
+                    continue
+                self.evaluations += 1
+                try:
+                    value = float(eval(calculation.code, names))
+                except (ArithmeticError, ValueError, TypeError):
+                    value = math.nan
+                if not math.isfinite(value):
+                    self.errors += 1
+                    continue
+                quality = min(qualities[input_id] for input_id in calculation.inputs)
+                current[calculation.tag_id] = value
+                qualities[calculation.tag_id] = quality
+                results.append(TagValue(tag_id=calculation.tag_id, value=value, quality=quality, timestamp=timestamp))
+        return results
+
+    def stats(self):
+        graph = self._graph
+        return {
+            'tags': len(graph.calculations) if graph else 0,
+            'evaluations': self.evaluations,
+            'errors': self.errors,
+        }
+
+
+calculations = CalculationEngine()
+
+
+def collect_metrics():
+    """Показатели вычисляемых тегов для /metrics"""
+    stats = calculations.stats()
+    return [
+        ('scada_calculated_tags', 'gauge', 'Вычисляемых тегов в графе', stats['tags']),
+        ('scada_calculation_evaluations_total', 'counter', 'Вычислений выражений', stats['evaluations']),
+        ('scada_calculation_errors_total', 'counter', 'Выражений, не давших конечного значения', stats['errors']),
+    ]
@@ -0,0 +1,36 @@
+"""
+Проверки настроек при запуске (manage.py check, runserver, migrate).
+
+Сроки хранения уровней истории должны расти от точного к грубому: сырые
+значения <= минутные агрегаты <= часовые (0 — бессрочно). Тренды и
+статистика читают до отметки построения агрегатов из TagRollup; если
+уровень удалён раньше более точного, старые интервалы возвращаются
+пустыми, хотя данные ещё хранятся.
+"""
+import math
+
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+def _days(value):
+    return math.inf if value <= 0 else value
+
+
+@register()
+def check_retention_order(app_configs, **kwargs):
+    levels = [
+        ('TAGVALUE_RETENTION_DAYS', settings.TAGVALUE_RETENTION_DAYS),
+        ('ROLLUP_1M_RETENTION_DAYS', settings.ROLLUP_1M_RETENTION_DAYS),
+        ('ROLLUP_1H_RETENTION_DAYS', settings.ROLLUP_1H_RETENTION_DAYS),
+    ]
+    errors = []
+    for number, ((finer, finer_days), (coarser, coarser_days)) in enumerate(zip(levels, levels[1:]), 1):
+        if _days(coarser_days) < _days(finer_days):
+            errors.append(Error(
+                f'{coarser}={coarser_days} меньше {finer}={finer_days or "0 (бессрочно)"}',
+                hint=f'Задайте {coarser} не меньше {finer} (0 — бессрочно): '
+                     'иначе старые интервалы трендов и статистики будут пустыми',
+                id=f'scada.E00{number}',
+            ))
+    return errors
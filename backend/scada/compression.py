@@ -0,0 +1,194 @@
+import threading
+from functools import partial
+
+from .cache import metadata
+
+NONE, DEADBAND, SWINGING_DOOR = 'NONE', 'DEADBAND', 'SWINGING_DOOR'
+
+
+class _TagState:
+    """Состояние сжатия тега: последняя архивная точка и отложенная точка"""
+    __slots__ = ('archived', 'held', 'slope_low', 'slope_high')
+
+    def __init__(self, archived):
+        self.archived = archived
+        self.held = None
+        self.slope_low = float('-inf')
+        self.slope_high = float('inf')
+
+    def copy(self):
+        state = _TagState(self.archived)
+        state.held, state.slope_low, state.slope_high = self.held, self.slope_low, self.slope_high
+        return state
+
+
+class ArchiveCompressor:
+    """
+    Сжатие архива перед записью в TagValue.
+
+    DEADBAND: значение пишется, если отличается от последнего записанного
+    больше чем на max(deadband_abs, deadband_pct% диапазона тега); восстановление
+    ступенькой даёт ошибку не больше зоны нечувствительности.
+
+    SWINGING_DOOR: точка откладывается, пока прямая от последней записанной
+    точки до неё проходит через коридоры ±допуск всех промежуточных значений;
+    иначе записывается предыдущая отложенная точка. Линейная интерполяция
+    между записанными точками отклоняется от исходных данных не больше допуска.
+
+    Смена качества всегда записывается. Если с последней записанной точки
+    прошло compression_max_seconds, значение записывается (вместе с
+    отложенной точкой) независимо от отклонения.
+
+    Состояние хранится в памяти процесса. compress не меняет его, а
+    возвращает функцию применения: её вызывают после фиксации записи
+    пакета (или добавления в буфер записи), так что откат не оставляет
+    состояния, ссылающегося на незаписанные точки. После перезапуска первое
+    значение каждого тега записывается, отложенная точка теряется — поэтому
+    её возраст ограничен compression_max_seconds.
+
+    При смене версии конфигурации перечитываются только настройки тегов:
+    состояние тега с прежними настройками сохраняется, при изменившихся
+    отложенная точка записывается со следующим значением тега и коридор
+    начинается заново. Состояние своё в каждом процессе: если значения
+    одного тега пишут несколько процессов (пакеты REST на разные воркеры
+    Gunicorn), каждый сжимает свою часть ряда, и в архив попадает больше
+    точек. Для сжатия ряда целиком значения тега должен писать один процесс
+    (служба сбора, один источник REST на тег).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._settings = {}
+        self._states = {}
+        # Теги, настройки которых изменились: состояние сбрасывается при следующем значении
+        self._changed = set()
+        self._version = None
+
+    def _load_settings(self, tag_ids):
+        version = metadata.version
+        previous = {}
+        if version != self._version:
+            previous, self._settings = self._settings, {}
+            self._version = version
+        missing = [tag_id for tag_id in tag_ids if tag_id not in self._settings]
+        if not missing:
+            return
+        for tag_id, meta in metadata.tags(missing).items():
+            deadband = max(meta.deadband_abs, meta.deadband_pct / 100.0 * abs(meta.max_value - meta.min_value))
+            max_seconds = meta.compression_max_seconds or 0.0
+            if meta.compression == SWINGING_DOOR:
+                self._settings[tag_id] = (SWINGING_DOOR, meta.swinging_door_tolerance or deadband, max_seconds)
+            elif meta.compression == DEADBAND:
+                self._settings[tag_id] = (DEADBAND, deadband, max_seconds)
+            else:
+                self._settings[tag_id] = (NONE, 0.0, 0.0)
+            if tag_id in previous and previous[tag_id] != self._settings[tag_id]:
+                self._changed.add(tag_id)
+
+    def compress(self, values):
+        """
+        Возвращает пару (значения пакета, которые нужно записать в архив,
+        функция применения нового состояния сжатия)
+        """
+        with self._lock:
+            self._load_settings({tv.tag_id for tv in values})
+            states = {}
+            stored = []
+            for tv in sorted(values, key=lambda item: item.timestamp):
+                mode, tolerance, max_seconds = self._settings.get(tv.tag_id, (NONE, 0.0, 0.0))
+                # Изменения — в копии состояния тега, общее состояние не трогаем
+                if tv.tag_id in states:
+                    state = states[tv.tag_id]
+                else:
+                    state = self._states.get(tv.tag_id)
+                    state = state.copy() if state is not None else None
+                    if state is not None and tv.tag_id in self._changed:
+                        # Настройки изменились: отложенная точка записывается, коридор — заново
+                        if state.held is not None:
+                            stored.append(state.held)
+                        state = None
+                if mode == NONE or tolerance <= 0:
+                    stored.append(tv)
+                    if tv.tag_id in self._changed:
+                        states[tv.tag_id] = None
+                    continue
+                if mode == DEADBAND:
+                    state = self._deadband(state, tv, tolerance, max_seconds, stored)
+                else:
+                    state = self._swinging_door(state, tv, tolerance, max_seconds, stored)
+                states[tv.tag_id] = state
+            return stored, partial(self._apply, states)
+
+    def _apply(self, states):
+        with self._lock:
+            for tag_id, state in states.items():
+                self._changed.discard(tag_id)
+                if state is None:
+                    self._states.pop(tag_id, None)
+                else:
+                    self._states[tag_id] = state
+
+    @staticmethod
+    def _expired(tv, archived, max_seconds):
+        return max_seconds > 0 and (tv.timestamp - archived.timestamp).total_seconds() >= max_seconds
+
+    def _deadband(self, state, tv, deadband, max_seconds, stored):
+        if state is None:
+            stored.append(tv)
+            return _TagState(tv)
+        archived = state.archived
+        if tv.timestamp < archived.timestamp:
+            stored.append(tv)
+            return state
+        if (abs(tv.value - archived.value) > deadband or tv.quality != archived.quality
+                or self._expired(tv, archived, max_seconds)):
+            state.archived = tv
+            stored.append(tv)
+        return state
+
+    def _swinging_door(self, state, tv, tolerance, max_seconds, stored):
+        if state is None:
+            stored.append(tv)
+            return _TagState(tv)
+
+        archived = state.archived
+        held = state.held
+        last = held or archived
+        if tv.timestamp <= last.timestamp:
+            # Значение не по порядку пишется как есть, состояние не меняется
+            stored.append(tv)
+            return state
+        if tv.quality != last.quality or self._expired(tv, archived, max_seconds):
+            if held is not None:
+                stored.append(held)
+            stored.append(tv)
+            return _TagState(tv)
+
+        dt = (tv.timestamp - archived.timestamp).total_seconds()
+        if state.slope_low <= (tv.value - archived.value) / dt <= state.slope_high:
+            # Прямая до новой точки проходит через коридоры всех промежуточных
+            state.slope_low = max(state.slope_low, (tv.value - archived.value - tolerance) / dt)
+            state.slope_high = min(state.slope_high, (tv.value - archived.value + tolerance) / dt)
+            state.held = tv
+            return state
+
+        # Коридор закрылся: записываем отложенную точку и начинаем новый коридор от неё
+        stored.append(held)
+        state.archived = archived = held
+        dt = (tv.timestamp - archived.timestamp).total_seconds()
+        state.slope_low = (tv.value - archived.value - tolerance) / dt
+        state.slope_high = (tv.value - archived.value + tolerance) / dt
+        state.held = tv
+        return state
+
+
+compressor = ArchiveCompressor()
+
+
+def compress_values(values):
+    """
+    Отбирает значения пакета для записи в архив согласно настройкам тегов.
+    Возвращает пару (значения для архива, функция применения состояния
+    сжатия — вызвать после того, как пакет записан).
+    """
+    return compressor.compress(values)
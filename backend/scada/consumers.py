@@ -1,81 +1,288 @@
-import json
+import asyncio
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Tag, TagValue, Alarm
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from .alarms import OPEN_STATES, alarm_payload, lock_event_sequence
+from .cache import metadata
+from .metrics import ConsumerMetricsMixin
+from .models import TagCurrentValue, Alarm, AlarmEvent
+from .realtime import ALARMS_GROUP, ALL_TAGS_GROUP, tag_group, tag_value_payload
+from .serialization import MSGPACK, dumps_json, dumps_msgpack, loads_json, loads_msgpack
+
+class FrameCodecMixin:
+    """
+    Кодирование кадров WebSocket. По умолчанию — текстовые кадры JSON
+    (orjson); клиент, запросивший подпротокол msgpack
+    (new WebSocket(url, ['msgpack'])), получает бинарные кадры MessagePack
+    той же структуры. Входящие сообщения принимаются в обоих видах.
+    """
+
+    async def accept_codec(self):
+        self.binary = MSGPACK in self.scope.get('subprotocols', ())
+        await self.accept(subprotocol=MSGPACK if self.binary else None)
+
+    async def send_message(self, message):
+        if self.binary:
+            await self.send(bytes_data=dumps_msgpack(message))
+        else:
+            await self.send(text_data=dumps_json(message).decode())
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Кадр, который не разбирается или не является объектом, не закрывает
+        # соединение: клиент получает сообщение об ошибке
+        try:
+            if bytes_data is not None:
+                data = loads_msgpack(bytes_data)
+            else:
+                data = loads_json(text_data)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await self.send_message({
+                'type': 'error',
+                'message': 'Сообщение должно быть объектом JSON или MessagePack'
+            })
+            return
+        await self.receive_message(data)
+
+class TagConsumer(FrameCodecMixin, ConsumerMetricsMixin, AsyncWebsocketConsumer):
+    """
+    Поток значений тегов.
+
+    Клиент подписывается сообщением
+    {"action": "subscribe_tags", "tags": [id, ...], "objects": [id, ...]};
+    без tags и objects — подписка на все теги. Подписка на объект означает
+    подписку на группы всех его тегов. Обновления копятся и отправляются
+    кадром tag_updates раз в TAG_PUSH_INTERVAL секунд. Начальный снимок и
+    обновления делятся на кадры не больше TAG_UPDATES_CHUNK значений.
+    """
+
+    # Значения до connect: disconnect вызывается и без успешного connect
+    flush_task = None
+    subscribed_all = False
+    subscribed_tags = frozenset()
 
-class TagConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        await self.accept()
-        await self.send(json.dumps({
+        self.subscribed_tags = set()
+        self.subscribed_all = False
+        self.pending = {}
+        self.tag_names = {}
+        await self.accept_codec()
+        self.flush_task = asyncio.create_task(self.flush_loop())
+        await self.send_message({
             'type': 'connection_established',
             'message': 'WebSocket connection established for tags'
-        }))
+        })
 
     async def disconnect(self, close_code):
-        pass
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        await self.leave_groups()
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive_message(self, data):
+        action = data.get('action')
         
-        if data.get('action') == 'subscribe_tags':
-            # Здесь можно добавить логику подписки на конкретные теги
-            await self.send(json.dumps({
+        if action == 'subscribe_tags':
+            try:
+                tag_ids = await self.resolve_subscription(data.get('tags') or [], data.get('objects') or [])
+            except (TypeError, ValueError):
+                await self.send_message({
+                    'type': 'error',
+                    'message': 'tags и objects должны быть списками id'
+                })
+                return
+            if tag_ids is None:
+                self.subscribed_all = True
+                await self.channel_layer.group_add(ALL_TAGS_GROUP, self.channel_name)
+            else:
+                for tag_id in tag_ids - self.subscribed_tags:
+                    await self.channel_layer.group_add(tag_group(tag_id), self.channel_name)
+                self.subscribed_tags |= tag_ids
+            
+            await self.send_message({
                 'type': 'subscription_confirmed',
-                'message': 'Subscribed to tag updates'
-            }))
+                'message': 'Subscribed to tag updates',
+                'tags': None if self.subscribed_all else sorted(self.subscribed_tags)
+            })
+            await self.send_updates(await self.get_current_values(tag_ids))
+        
+        elif action == 'unsubscribe_tags':
+            await self.leave_groups()
+            self.pending.clear()
+            await self.send_message({
+                'type': 'subscription_cancelled',
+                'message': 'Unsubscribed from tag updates'
+            })
+
+    async def tag_values(self, event):
+        # Сообщение группы: последние значения перезаписывают ещё не отправленные
+        for payload in event['values']:
+            self.pending[payload['tag_id']] = payload
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.TAG_PUSH_INTERVAL)
+            if self.pending:
+                updates, self.pending = list(self.pending.values()), {}
+                await self.send_updates(updates)
+
+    async def send_updates(self, updates):
+        if not updates:
+            return
+        missing = {update['tag_id'] for update in updates} - self.tag_names.keys()
+        if missing:
+            self.tag_names.update(await self.get_tag_names(missing))
+        for update in updates:
+            update['tag_name'] = self.tag_names.get(update['tag_id'])
+        chunk = settings.TAG_UPDATES_CHUNK
+        for start in range(0, len(updates), chunk):
+            await self.send_message({
+                'type': 'tag_updates',
+                'data': updates[start:start + chunk]
+            })
+
+    async def leave_groups(self):
+        if self.subscribed_all:
+            await self.channel_layer.group_discard(ALL_TAGS_GROUP, self.channel_name)
+        for tag_id in self.subscribed_tags:
+            await self.channel_layer.group_discard(tag_group(tag_id), self.channel_name)
+        self.subscribed_all = False
+        self.subscribed_tags = set()
 
     @database_sync_to_async
-    def get_tag_updates(self):
-        # Метод для получения обновлений тегов
-        recent_tags = TagValue.objects.select_related('tag').order_by('-timestamp')[:10]
-        return [
-            {
-                'tag_id': tag_value.tag.id,
-                'tag_name': tag_value.tag.name,
-                'value': tag_value.value,
-                'quality': tag_value.quality,
-                'timestamp': tag_value.timestamp.isoformat()
-            }
-            for tag_value in recent_tags
-        ]
+    def resolve_subscription(self, tags, objects):
+        """Множество id тегов подписки либо None для подписки на все теги"""
+        if not tags and not objects:
+            return None
+        found = metadata.tags({int(tag_id) for tag_id in tags})
+        tag_ids = {tag_id for tag_id, meta in found.items() if not meta.is_archived}
+        return tag_ids | metadata.object_tags({int(object_id) for object_id in objects})
+
+    @database_sync_to_async
+    def get_tag_names(self, tag_ids):
+        return {tag_id: meta.name for tag_id, meta in metadata.tags(tag_ids).items()}
+
+    @database_sync_to_async
+    def get_current_values(self, tag_ids):
+        # Начальный снимок текущих значений подписки
+        queryset = TagCurrentValue.objects.filter(tag__is_archived=False)
+        if tag_ids is not None:
+            queryset = queryset.filter(tag_id__in=tag_ids)
+        return [tag_value_payload(current) for current in queryset]
+
+class AlarmConsumer(FrameCodecMixin, ConsumerMetricsMixin, AsyncWebsocketConsumer):
+    """
+    Поток изменений аварий.
+
+    На {"action": "subscribe_alarms"} клиент получает снимок открытых аварий
+    (alarm_snapshot) с текущим порядковым номером seq, затем только переходы
+    RAISED/ACKNOWLEDGED/RESOLVED (alarm_events), каждый со своим seq.
+    При переподключении клиент передаёт {"action": "subscribe_alarms", "last_seq": N}
+    и получает пропущенные события вместо полного снимка, если они ещё хранятся.
+    """
 
-class AlarmConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        await self.accept()
-        await self.send(json.dumps({
+        self.seq = None
+        await self.accept_codec()
+        await self.send_message({
             'type': 'connection_established',
             'message': 'WebSocket connection established for alarms'
-        }))
+        })
 
     async def disconnect(self, close_code):
-        pass
+        await self.channel_layer.group_discard(ALARMS_GROUP, self.channel_name)
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive_message(self, data):
         
         if data.get('action') == 'subscribe_alarms':
-            await self.send(json.dumps({
+            # Сначала вступаем в группу, чтобы не потерять события между
+            # снимком и подпиской; дубликаты отсекаются по seq
+            await self.channel_layer.group_add(ALARMS_GROUP, self.channel_name)
+            await self.send_message({
                 'type': 'subscription_confirmed',
                 'message': 'Subscribed to alarm updates'
-            }))
+            })
+            
+            last_seq = data.get('last_seq')
+            events = None
+            if isinstance(last_seq, int):
+                events = await self.get_events_since(last_seq)
+            if events is not None:
+                self.seq = events[-1]['seq'] if events else last_seq
+                await self.send_message({
+                    'type': 'alarm_events',
+                    'events': events
+                })
+            else:
+                await self.send_snapshot()
+
+    async def alarm_events(self, event):
+        if self.seq is None:
+            return
+        events = [item for item in event['events'] if item['seq'] > self.seq]
+        if events and events[0]['seq'] != self.seq + 1:
+            # Пропуск номеров: события другой транзакции уже зафиксированы, но
+            # их публикация ещё в пути (или номер пропал при откате). Всё
+            # после self.seq дочитывается из БД, иначе событие потерялось бы
+            events = await self.get_events_since(self.seq)
+            if events is None:
+                await self.send_snapshot()
+                return
+        if events:
+            self.seq = events[-1]['seq']
+            await self.send_message({
+                'type': 'alarm_events',
+                'events': events
+            })
+
+    async def send_snapshot(self):
+        self.seq, alarms = await self.get_active_alarms()
+        await self.send_message({
+            'type': 'alarm_snapshot',
+            'seq': self.seq,
+            'alarms': alarms
+        })
 
     @database_sync_to_async
-    def get_active_alarms(self):
-        # Метод для получения активных аварий
-        active_alarms = Alarm.objects.filter(
-            state='ACTIVE'
-        ).select_related(
-            'alarm_definition__tag'
-        )[:20]
-        
+    def get_events_since(self, last_seq):
+        """
+        События после last_seq либо None, если продолжить поток нельзя
+        (события удалены или их слишком много) и нужен снимок.
+        """
+        limit = settings.ALARM_RESUME_MAX_EVENTS
+        bounds = AlarmEvent.objects.aggregate(first=Min('id'), last=Max('id'))
+        if last_seq > (bounds['last'] or 0):
+            return None
+        if bounds['first'] is not None and bounds['first'] > last_seq + 1:
+            return None
+        events = list(
+            AlarmEvent.objects.filter(id__gt=last_seq)
+            .select_related('alarm__alarm_definition__tag')
+            .order_by('id')[:limit + 1]
+        )
+        if len(events) > limit:
+            return None
         return [
             {
-                'id': alarm.id,
-                'name': alarm.alarm_definition.name,
-                'message': alarm.alarm_definition.message,
-                'severity': alarm.alarm_definition.severity,
-                'tag_name': alarm.alarm_definition.tag.name,
-                'triggered_at': alarm.triggered_at.isoformat()
+                'seq': event.id,
+                'transition': event.transition,
+                'alarm': alarm_payload(event.alarm, event.alarm.alarm_definition),
             }
-            for alarm in active_alarms
-        ]
\ No newline at end of file
+            for event in events
+        ]
+
+    @database_sync_to_async
+    def get_active_alarms(self):
+        # Снимок открытых аварий и номер последнего события на момент снимка;
+        # блокировка номеров не даёт событию зафиксироваться между двумя чтениями
+        with transaction.atomic():
+            lock_event_sequence()
+            seq = AlarmEvent.objects.aggregate(seq=Max('id'))['seq'] or 0
+            active_alarms = Alarm.objects.filter(
+                state__in=OPEN_STATES
+            ).select_related(
+                'alarm_definition__tag'
+            )
+            return seq, [alarm_payload(alarm, alarm.alarm_definition) for alarm in active_alarms]
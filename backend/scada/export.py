@@ -0,0 +1,117 @@
+import csv
+import io
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+
+from .models import Tag, TagValue
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+CSV_HEADER = ('tag_id', 'tag_name', 'timestamp', 'value', 'quality')
+
+
+def history_rows(tag_ids, start, end):
+    """
+    Строки истории (tag_id, timestamp, value, quality) по тегам за
+    [start, end) в порядке (тег, время). Читаются итератором частями по
+    EXPORT_CHUNK_ROWS (на PostgreSQL — серверный курсор), в памяти не
+    накапливаются.
+    """
+    return (
+        TagValue.objects
+        .filter(tag_id__in=tag_ids, timestamp__gte=start, timestamp__lt=end)
+        .order_by('tag_id', 'timestamp')
+        .values_list('tag_id', 'timestamp', 'value', 'quality')
+        .iterator(chunk_size=settings.EXPORT_CHUNK_ROWS)
+    )
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _Echo:
+    """Файлоподобный объект, возвращающий записанное вместо хранения"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(tag_ids, start, end):
+    """Генератор кусков CSV: заголовок и по одному куску на EXPORT_CHUNK_ROWS строк"""
+    names = dict(Tag.objects.filter(id__in=tag_ids).values_list('id', 'name'))
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for chunk in _chunks(history_rows(tag_ids, start, end), settings.EXPORT_CHUNK_ROWS):
+        yield ''.join(
+            writer.writerow((tag_id, names.get(tag_id, ''), timestamp.isoformat(), value, quality))
+            for tag_id, timestamp, value, quality in chunk
+        )
+
+
+class _ZipStream:
+    """Несмещаемый поток для zipfile: записанные байты забираются через take()"""
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+
+    def write(self, data):
+        return self._buffer.write(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+def _npy(array):
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def stream_npz(tag_ids, start, end):
+    """
+    Генератор архива .npz (zip без сжатия), который пишется по частям.
+
+    Каждые EXPORT_CHUNK_ROWS строк дают четыре массива с номером части:
+    tag_id_000000 (int64), timestamp_000000 (datetime64[us], UTC),
+    value_000000 (float64), quality_000000 (int16). Справочник тегов —
+    массивы tag_ids и tag_names. Полный ряд собирается конкатенацией частей
+    по возрастанию номера.
+    """
+    stream = _ZipStream()
+    archive = zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True)
+    names = dict(Tag.objects.filter(id__in=tag_ids).values_list('id', 'name'))
+    archive.writestr('tag_ids.npy', _npy(np.array(list(names), dtype=np.int64)))
+    archive.writestr('tag_names.npy', _npy(np.array(list(names.values()), dtype=np.str_)))
+    yield stream.take()
+
+    for number, chunk in enumerate(_chunks(history_rows(tag_ids, start, end), settings.EXPORT_CHUNK_ROWS)):
+        tag_column, time_column, value_column, quality_column = zip(*chunk)
+        micros = [(moment - EPOCH) // MICROSECOND for moment in time_column]
+        arrays = {
+            'tag_id': np.array(tag_column, dtype=np.int64),
+            'timestamp': np.array(micros, dtype=np.int64).astype('datetime64[us]'),
+            'value': np.array(value_column, dtype=np.float64),
+            'quality': np.array(quality_column, dtype=np.int16),
+        }
+        for name, array in arrays.items():
+            archive.writestr(f'{name}_{number:06d}.npy', _npy(array))
+        yield stream.take()
+
+    archive.close()
+    yield stream.take()
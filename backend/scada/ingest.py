@@ -0,0 +1,263 @@
+import logging
+import math
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .alarms import evaluate_values, record_transitions
+from .cache import metadata
+from .calculations import calculations
+from .compression import compress_values
+from .leaks import publish_samples
+from .realtime import publish_tag_values
+from .rollups import mark_dirty_hours
+from .models import TagCurrentValue, TagValue
+from .writebuffer import ALWAYS, FALLBACK, write_buffer
+
+logger = logging.getLogger('scada.ingest')
+
+# Максимальный размер пакета и размер одного INSERT
+MAX_BATCH_ROWS = getattr(settings, 'INGEST_MAX_BATCH_ROWS', 100000)
+INSERT_BATCH_SIZE = getattr(settings, 'INGEST_INSERT_BATCH_SIZE', 5000)
+
+
+class IngestError(Exception):
+    """Ошибка пакета целиком (а не отдельной строки)"""
+
+
+def _split_row(row):
+    """Приводит строку пакета к кортежу (tag, value, quality, timestamp)"""
+    if isinstance(row, dict):
+        tag = row.get('tag', row.get('tag_id', row.get('tag_name')))
+        return tag, row.get('value'), row.get('quality', 100), row.get('timestamp')
+    if isinstance(row, (list, tuple)) and 2 <= len(row) <= 4:
+        padded = list(row) + [100, None][len(row) - 2:]
+        return tuple(padded)
+    raise ValueError('Строка должна быть объектом или массивом [tag, value, quality, timestamp]')
+
+
+def _parse_timestamp(raw, default):
+    if raw is None or raw == '':
+        return default
+    if isinstance(raw, datetime):
+        parsed = raw
+    elif isinstance(raw, (int, float)) and not isinstance(raw, bool):
+        return datetime.fromtimestamp(raw, tz=dt_timezone.utc)
+    else:
+        parsed = parse_datetime(str(raw))
+        if parsed is None:
+            raise ValueError(f'Некорректная временная метка: {raw}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _resolve_tags(keys):
+    """
+    Разрешает идентификаторы и имена тегов пакета через кэш метаданных
+    (промахи читаются одним запросом).
+    Возвращает словарь ключ -> id для активных (не архивных) тегов.
+    """
+    return metadata.resolve(keys)
+
+
+def insert_values(values):
+    """
+    Вставка значений в архив одним executemany. На пакетах в десятки тысяч
+    строк построение INSERT через bulk_create (подготовка каждого поля
+    каждого объекта) занимает больше времени, чем сама вставка; id строк
+    после записи не нужны. Часы старых значений отмечаются для пересчёта
+    агрегатов (rollups.mark_dirty_hours).
+    """
+    quote = connection.ops.quote_name
+    adapt = connection.ops.adapt_datetimefield_value
+    sql = 'INSERT INTO {} ({}, {}, {}, {}) VALUES (%s, %s, %s, %s)'.format(
+        quote(TagValue._meta.db_table), quote('tag_id'), quote('value'), quote('quality'), quote('timestamp'),
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(values), INSERT_BATCH_SIZE):
+            cursor.executemany(sql, [
+                (tv.tag_id, tv.value, tv.quality, adapt(tv.timestamp))
+                for tv in values[start:start + INSERT_BATCH_SIZE]
+            ])
+    mark_dirty_hours(values)
+
+
+def update_current_values(values, stored_values=None):
+    """
+    Обновляет таблицу текущих значений по пакету TagValue.
+    Для каждого тега берётся самое позднее значение пакета; более старые,
+    чем уже сохранённое текущее значение, его не заменяют. Счётчики принятых
+    и записанных в архив значений (stored_values) накапливаются.
+    """
+    if stored_values is None:
+        stored_values = values
+    latest = {}
+    raw_counts = Counter()
+    for tag_value in values:
+        raw_counts[tag_value.tag_id] += 1
+        known = latest.get(tag_value.tag_id)
+        if known is None or tag_value.timestamp >= known.timestamp:
+            latest[tag_value.tag_id] = tag_value
+    if not latest:
+        return
+    stored_counts = Counter(tag_value.tag_id for tag_value in stored_values)
+
+    existing = {
+        row[0]: row for row in TagCurrentValue.objects.filter(tag_id__in=latest).values_list(
+            'tag_id', 'timestamp', 'value', 'quality', 'raw_count', 'stored_count'
+        )
+    }
+    current = []
+    for tag_id, tv in latest.items():
+        row = existing.get(tag_id)
+        if row is None:
+            current.append(TagCurrentValue(
+                tag_id=tag_id, value=tv.value, quality=tv.quality, timestamp=tv.timestamp,
+                raw_count=raw_counts[tag_id], stored_count=stored_counts[tag_id],
+            ))
+            continue
+        _, timestamp, value, quality, raw_count, stored_count = row
+        if tv.timestamp >= timestamp:
+            timestamp, value, quality = tv.timestamp, tv.value, tv.quality
+        current.append(TagCurrentValue(
+            tag_id=tag_id, value=value, quality=quality, timestamp=timestamp,
+            raw_count=raw_count + raw_counts[tag_id], stored_count=stored_count + stored_counts[tag_id],
+        ))
+    TagCurrentValue.objects.bulk_create(
+        current,
+        batch_size=INSERT_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['tag'],
+        update_fields=['value', 'quality', 'timestamp', 'updated_at', 'raw_count', 'stored_count'],
+    )
+
+
+def on_values_written(values, stored_values=None):
+    """
+    Обработка принятых значений: аварии, текущие значения, после фиксации
+    транзакции — публикация в WebSocket и (при LEAK_DETECTION) отсчётов
+    расхода для службы обнаружения утечек. stored_values — часть пакета,
+    записанная в архив после сжатия (по умолчанию весь пакет).
+    """
+    transitions = evaluate_values(values)
+    update_current_values(values, stored_values)
+    # События аварий — последним шагом: номера выдаются под блокировкой,
+    # которая держится до фиксации (см. lock_event_sequence)
+    record_transitions(transitions)
+    # Публикация — после фиксации: ошибка channel layer (например, Redis
+    # недоступен) только логируется, данные уже записаны и ответ успешен
+    transaction.on_commit(lambda: publish_tag_values(values), robust=True)
+    if settings.LEAK_DETECTION:
+        transaction.on_commit(lambda: publish_samples(values), robust=True)
+
+
+def _write_values(values, stored, commit_compression):
+    """
+    Запись пакета в БД или в буфер записи (см. scada/writebuffer.py) по
+    INGEST_BUFFER: always — всегда в буфер, в БД переносит фоновый поток;
+    fallback — в БД, а при недоступности БД (и пока буфер этого процесса
+    не разобран, чтобы не нарушать порядок) — в буфер; off — только в БД.
+    Состояние сжатия (commit_compression) применяется, только когда пакет
+    зафиксирован в БД или добавлен в буфер.
+    """
+    mode = settings.INGEST_BUFFER
+    if mode == ALWAYS or (mode == FALLBACK and write_buffer.backlog):
+        write_buffer.append(values, stored)
+        commit_compression()
+        return
+    try:
+        with transaction.atomic():
+            insert_values(stored)
+            on_values_written(values, stored)
+            transaction.on_commit(commit_compression)
+    except (OperationalError, InterfaceError) as exc:
+        if mode != FALLBACK or connection.in_atomic_block:
+            raise
+        logger.warning('БД недоступна (%s): пакет из %d значений записан в буфер', exc, len(values))
+        write_buffer.append(values, stored)
+        commit_compression()
+
+
+def _calculate(values):
+    """
+    Значения вычисляемых тегов по пакету. Если БД недоступна и включён
+    режим fallback, пакет пишется в буфер без них.
+    """
+    try:
+        return calculations.calculate(values)
+    except (OperationalError, InterfaceError) as exc:
+        if settings.INGEST_BUFFER != FALLBACK or connection.in_atomic_block:
+            raise
+        logger.warning('БД недоступна (%s): вычисляемые теги пакета не рассчитаны', exc)
+        return []
+
+
+def ingest_values(rows):
+    """
+    Записывает пакет значений тегов одной транзакцией.
+
+    rows — список строк вида {"tag": id|имя, "value": ..., "quality": ..., "timestamp": ...}
+    или [tag, value, quality, timestamp]. Имена тегов разрешаются одним запросом
+    на весь пакет. К пакету добавляются значения вычисляемых тегов, зависящих
+    от его тегов (scada/calculations.py); строки для самих вычисляемых тегов
+    отклоняются. Пакет сжимается по настройкам архива тегов, оставшиеся
+    значения записываются в архив, затем весь пакет проверяется по
+    определениям аварий и обновляются текущие значения тегов (сразу или при
+    переносе из буфера записи, см. _write_values).
+    Возвращает кортеж (принятые TagValue, записанные в архив TagValue,
+    список отклонённых строк).
+    """
+    if not isinstance(rows, (list, tuple)):
+        raise IngestError('Ожидается массив значений')
+    if not rows:
+        raise IngestError('Пустой пакет')
+    if len(rows) > MAX_BATCH_ROWS:
+        raise IngestError(f'Размер пакета превышает {MAX_BATCH_ROWS} строк')
+
+    now = timezone.now()
+    rejected = []
+    parsed = []
+    for index, row in enumerate(rows):
+        try:
+            parsed.append((index,) + _split_row(row))
+        except ValueError as exc:
+            rejected.append({'index': index, 'error': str(exc)})
+
+    tag_ids = _resolve_tags({item[1] for item in parsed if isinstance(item[1], (int, str))})
+    calculated = {tag_id for tag_id, meta in metadata.tags(set(tag_ids.values())).items() if meta.expression}
+
+    values = []
+    for index, tag_key, value, quality, timestamp in parsed:
+        try:
+            tag_id = tag_ids.get(tag_key) if isinstance(tag_key, (int, str)) else None
+            if tag_id is None:
+                raise ValueError(f'Тег не найден: {tag_key}')
+            if tag_id in calculated:
+                raise ValueError(f'Тег вычисляемый, значения не принимаются: {tag_key}')
+            if value is None:
+                raise ValueError('Отсутствует значение')
+            value = float(value)
+            if not math.isfinite(value):
+                raise ValueError('Значение должно быть конечным числом')
+            quality = int(quality)
+            if not 0 <= quality <= 100:
+                raise ValueError('Качество должно быть в диапазоне 0-100')
+            timestamp = _parse_timestamp(timestamp, now)
+        except (TypeError, ValueError, OverflowError) as exc:
+            rejected.append({'index': index, 'error': str(exc)})
+            continue
+        values.append(TagValue(tag_id=tag_id, value=value, quality=quality, timestamp=timestamp))
+
+    stored = []
+    if values:
+        values.extend(_calculate(values))
+        stored, commit_compression = compress_values(values)
+        _write_values(values, stored, commit_compression)
+
+    rejected.sort(key=lambda item: item['index'])
+    return values, stored, rejected
@@ -0,0 +1,399 @@
+"""
+Обнаружение утечек по балансу расхода между соседними НПС.
+
+Участок — пара соседних по км_mark станций (объекты типа LEAK_STATION_TYPE)
+с тегами расхода (шаблон LEAK_FLOW_TEMPLATE). Небаланс участка — разность
+средних расходов на входе (верхняя станция) и выходе (нижняя станция) за
+скользящее окно LEAK_WINDOW_SECONDS, в процентах от входа. Значение
+пишется в тег шаблона LEAK_IMBALANCE_TEMPLATE верхней станции, авария —
+обычное определение аварии GT на этом теге (гистерезис, задержки, дребезг,
+квитирование — см. alarms.py).
+
+Значения расхода идут потоком: процессы записи после фиксации транзакции
+отправляют отсчёты тегов расхода в группу LEAK_GROUP channel layer,
+единственный процесс run_leak_detection получает их и ведёт окна
+(MassBalance). Так в окна попадают все отсчёты, кто бы их ни записал.
+"""
+import asyncio
+import logging
+import math
+import threading
+from collections import namedtuple
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .cache import bump_config_version, metadata
+from .models import AlarmDefinition, ObjectType, PipelineObject, Tag, TagTemplate
+from .provisioning import provision_tags
+
+logger = logging.getLogger('scada.leaks')
+
+# Группа channel layer с отсчётами тегов расхода для службы обнаружения утечек
+LEAK_GROUP = 'leaks'
+
+Segment = namedtuple('Segment', 'upstream downstream inflow_tag_id outflow_tag_id imbalance_tag_id')
+
+
+def load_segments():
+    """
+    Участки по текущей конфигурации: станции с километровой отметкой и
+    тегом расхода по возрастанию км, каждая пара соседних. Станция без
+    тега расхода пропускается (участок продолжается до следующей).
+    Участок без тега небаланса у верхней станции не считается.
+    """
+    stations = PipelineObject.objects.filter(
+        object_type__name=settings.LEAK_STATION_TYPE, km_mark__isnull=False,
+    ).order_by('km_mark', 'index').values_list('id', 'name')
+    templates = {settings.LEAK_FLOW_TEMPLATE: {}, settings.LEAK_IMBALANCE_TEMPLATE: {}}
+    for object_id, tag_id, name_template in Tag.objects.filter(
+        is_archived=False, tag_template__name_template__in=templates,
+        pipeline_object__object_type__name=settings.LEAK_STATION_TYPE,
+    ).values_list('pipeline_object_id', 'id', 'tag_template__name_template'):
+        templates[name_template][object_id] = tag_id
+    flows = templates[settings.LEAK_FLOW_TEMPLATE]
+    imbalances = templates[settings.LEAK_IMBALANCE_TEMPLATE]
+    metered = [(object_id, name) for object_id, name in stations if object_id in flows]
+    return [
+        Segment(upstream, downstream, flows[upstream[0]], flows[downstream[0]], imbalances[upstream[0]])
+        for upstream, downstream in zip(metered, metered[1:])
+        if upstream[0] in imbalances
+    ]
+
+
+class SegmentCache:
+    """Участки и множество тегов расхода по версии конфигурации (как AssetTree)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._segments = None
+        self._flow_tags = frozenset()
+
+    def get(self):
+        """(версия, участки, множество id тегов расхода)"""
+        version = metadata.version
+        with self._lock:
+            if self._version == version:
+                return version, self._segments, self._flow_tags
+        segments = load_segments()
+        flow_tags = frozenset(tag_id for segment in segments for tag_id in (segment.inflow_tag_id, segment.outflow_tag_id))
+        with self._lock:
+            self._version, self._segments, self._flow_tags = version, segments, flow_tags
+        return version, segments, flow_tags
+
+
+segment_cache = SegmentCache()
+
+
+def publish_samples(values):
+    """
+    Отправляет отсчёты тегов расхода пакета (все, не только последние) в
+    группу LEAK_GROUP одним сообщением. Вызывается после фиксации записи.
+    """
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    _, _, flow_tags = segment_cache.get()
+    samples = [
+        [tag_value.tag_id, tag_value.value, tag_value.quality, tag_value.timestamp.timestamp()]
+        for tag_value in values if tag_value.tag_id in flow_tags
+    ]
+    if samples:
+        async_to_sync(layer.group_send)(LEAK_GROUP, {'type': 'leak.samples', 'samples': samples})
+
+
+class MassBalance:
+    """
+    Скользящие окна расхода по станциям и небаланс участков.
+
+    Время делится на интервалы bucket_seconds; окно — window интервалов.
+    Для каждой станции кольцевой буфер (строка массива NumPy) хранит
+    значение расхода на каждом интервале (последний отсчёт интервала,
+    пустые интервалы заполняются предыдущим значением), рядом — сумма
+    буфера. Отсчёт меняет одну ячейку и сумму: O(1), переход на следующий
+    интервал — O(1) на пропущенный интервал. Небаланс всех участков
+    считается векторно по суммам.
+
+    Опоздавший отсчёт (интервал раньше последнего, но в пределах окна)
+    записывается в свой интервал и переносится вперёд на следующие
+    интервалы, заполненные предыдущим значением, — до первого интервала со
+    своим отсчётом (маска sampled). Отсчёт старше окна отбрасывается.
+    """
+
+    def __init__(self, segments, window_seconds, bucket_seconds=1.0, min_quality=50, stale_seconds=30.0, min_flow=0.0):
+        self.segments = segments
+        self.window_seconds = window_seconds
+        self.min_flow = min_flow
+        self.bucket_seconds = bucket_seconds
+        self.window = max(1, int(round(window_seconds / bucket_seconds)))
+        self.min_quality = min_quality
+        self.stale_seconds = stale_seconds
+        self.stale_buckets = int(math.ceil(stale_seconds / bucket_seconds))
+        tag_ids = sorted({tag_id for segment in segments for tag_id in (segment.inflow_tag_id, segment.outflow_tag_id)})
+        self.rows = {tag_id: row for row, tag_id in enumerate(tag_ids)}
+        count = len(tag_ids)
+        self.ring = np.zeros((count, self.window))
+        # Интервалы окна со своим отсчётом (остальные заполнены предыдущим значением)
+        self.sampled = np.zeros((count, self.window), dtype=bool)
+        self.sums = np.zeros(count)
+        # Последний интервал с отсчётом, число заполненных интервалов окна, последнее значение
+        self.head = np.full(count, -1, dtype=np.int64)
+        self.filled = np.zeros(count, dtype=np.int64)
+        self.last = np.zeros(count)
+        self.inflow = np.array([self.rows[segment.inflow_tag_id] for segment in segments], dtype=np.int64)
+        self.outflow = np.array([self.rows[segment.outflow_tag_id] for segment in segments], dtype=np.int64)
+        self.samples = 0
+        self._advances = 0
+
+    def resized(self, segments):
+        """
+        Новый MassBalance для изменившихся участков с окнами тегов расхода,
+        которые остались (окно не набирается заново после правки конфигурации)
+        """
+        balance = MassBalance(
+            segments, self.window_seconds, self.bucket_seconds,
+            self.min_quality, self.stale_seconds, self.min_flow,
+        )
+        for tag_id, row in balance.rows.items():
+            previous = self.rows.get(tag_id)
+            if previous is not None:
+                for name in ('ring', 'sampled', 'sums', 'head', 'filled', 'last'):
+                    getattr(balance, name)[row] = getattr(self, name)[previous]
+        balance.samples = self.samples
+        return balance
+
+    @property
+    def watermark(self):
+        """Последний интервал, по которому есть отсчёты (-1 — отсчётов нет)"""
+        return int(self.head.max()) if len(self.head) else -1
+
+    def add(self, tag_id, value, quality, timestamp):
+        """Отсчёт расхода; timestamp — секунды Unix"""
+        row = self.rows.get(tag_id)
+        if row is None or quality < self.min_quality or not math.isfinite(value):
+            return
+        bucket = int(timestamp // self.bucket_seconds)
+        head = int(self.head[row])
+        if bucket > head:
+            self._advance(row, bucket)
+            head = bucket
+        elif bucket <= head - self.filled[row]:
+            return  # старше окна или раньше первого отсчёта
+        ring = self.ring[row]
+        sampled = self.sampled[row]
+        total = self.sums[row]
+        slot = bucket % self.window
+        total += value - ring[slot]
+        ring[slot] = value
+        sampled[slot] = True
+        # Опоздавший отсчёт заменяет предыдущее значение в следующих интервалах без отсчёта
+        step = bucket + 1
+        while step <= head and not sampled[step % self.window]:
+            slot = step % self.window
+            total += value - ring[slot]
+            ring[slot] = value
+            step += 1
+        if step > head:
+            self.last[row] = value
+        self.sums[row] = total
+        self.samples += 1
+
+    def _advance(self, row, bucket):
+        """Продлевает окно станции до bucket, заполняя интервалы последним значением"""
+        head = int(self.head[row])
+        ring = self.ring[row]
+        if head < 0 or bucket - head >= self.window:
+            # Первый отсчёт или разрыв длиннее окна: окно начинается заново
+            ring[:] = 0.0
+            self.sampled[row] = False
+            self.sums[row] = 0.0
+            self.filled[row] = 1
+        else:
+            held = self.last[row]
+            total = self.sums[row]
+            for step in range(head + 1, bucket + 1):
+                slot = step % self.window
+                total += held - ring[slot]
+                ring[slot] = held
+                self.sampled[row, slot] = False
+            self.sums[row] = total
+            self.filled[row] = min(self.window, self.filled[row] + bucket - head)
+        self.head[row] = bucket
+        self._advances += 1
+        if self._advances % (16 * self.window) == 0:
+            # Накопленная ошибка округления сумм
+            self.sums[:] = self.ring.sum(axis=1)
+
+    def evaluate(self, bucket=None):
+        """
+        Небаланс участков на интервал bucket (по умолчанию — последний
+        интервал с отсчётами): массив процентов, NaN — участок не считается
+        (окно ещё не набрано, станция молчит дольше stale_seconds или
+        средний расход на входе меньше min_flow). Окна станций
+        предварительно продлеваются до этого интервала.
+        """
+        if bucket is None:
+            bucket = self.watermark
+        live = (self.head >= 0) & (bucket - self.head <= self.stale_buckets)
+        for row in np.flatnonzero(live & (self.head < bucket)):
+            self._advance(int(row), bucket)
+        full = live & (self.filled >= self.window)
+        inflow = self.sums[self.inflow] / self.window
+        outflow = self.sums[self.outflow] / self.window
+        valid = full[self.inflow] & full[self.outflow] & (inflow >= self.min_flow) & (inflow > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            imbalance = (inflow - outflow) / inflow * 100.0
+        imbalance[~valid] = np.nan
+        return imbalance
+
+
+class LeakDetectionService:
+    """
+    Служба обнаружения утечек: получает отсчёты расхода из группы
+    LEAK_GROUP, ведёт окна MassBalance и раз в LEAK_EVALUATE_SECONDS
+    записывает небаланс участков в их теги через writer (ingest_values) —
+    там же проверяются определения аварий. Время оценки — последний
+    интервал с отсчётами, а не часы процесса: задержка пакетов записи и
+    перенос из буфера не дают ложного небаланса.
+    """
+
+    # Повторная подписка на группу (у channels_redis членство истекает)
+    RESUBSCRIBE_SECONDS = 3600.0
+
+    def __init__(self, writer):
+        self._write = database_sync_to_async(writer)
+        self._segments = database_sync_to_async(segment_cache.get)
+        self.version = None
+        self.balance = None
+        self.stats = {'samples': 0, 'messages': 0, 'evaluations': 0, 'written': 0, 'segments': 0, 'over_threshold': 0}
+
+    async def load(self):
+        """Участки по текущей версии конфигурации; окна переносятся"""
+        version, segments, _ = await self._segments()
+        if version == self.version:
+            return
+        if self.balance is None:
+            self.balance = MassBalance(
+                segments, settings.LEAK_WINDOW_SECONDS, settings.LEAK_BUCKET_SECONDS,
+                settings.LEAK_MIN_QUALITY, settings.LEAK_STALE_SECONDS, settings.LEAK_MIN_FLOW,
+            )
+        else:
+            self.balance = self.balance.resized(segments)
+        self.version = version
+        self.stats['segments'] = len(segments)
+        logger.info('Участков баланса расхода: %d (версия конфигурации %s)', len(segments), version)
+
+    def receive(self, samples):
+        add = self.balance.add
+        for tag_id, value, quality, timestamp in samples:
+            add(tag_id, value, quality, timestamp)
+        self.stats['samples'] += len(samples)
+        self.stats['messages'] += 1
+
+    async def evaluate(self):
+        """Небаланс участков в их теги (только посчитанные участки)"""
+        await self.load()
+        balance = self.balance
+        bucket = balance.watermark
+        if bucket < 0:
+            return
+        imbalance = balance.evaluate(bucket)
+        timestamp = bucket * balance.bucket_seconds
+        rows = [
+            [segment.imbalance_tag_id, round(float(value), 3), 100, timestamp]
+            for segment, value in zip(balance.segments, imbalance) if not math.isnan(value)
+        ]
+        self.stats['evaluations'] += 1
+        self.stats['over_threshold'] = int(np.sum(imbalance > settings.LEAK_THRESHOLD_PCT))
+        if not rows:
+            return
+        try:
+            values, _, rejected = await self._write(rows)
+        except Exception:
+            logger.exception('Ошибка записи небаланса %d участков', len(rows))
+            return
+        self.stats['written'] += len(values)
+        if rejected:
+            logger.warning('Небаланс: отклонено строк %d, первая ошибка: %s', len(rejected), rejected[0]['error'])
+
+    async def run(self, duration=None):
+        """Обрабатывает поток duration секунд (None — до отмены)"""
+        layer = get_channel_layer()
+        if layer is None:
+            raise RuntimeError('CHANNEL_LAYERS не настроен')
+        await self.load()
+        loop = asyncio.get_running_loop()
+        channel = await layer.new_channel()
+        await layer.group_add(LEAK_GROUP, channel)
+        started = loop.time()
+        subscribed_at = next_at = started
+        try:
+            while duration is None or loop.time() - started < duration:
+                now = loop.time()
+                if now >= next_at:
+                    await self.evaluate()
+                    next_at += settings.LEAK_EVALUATE_SECONDS
+                    if next_at < now:
+                        next_at = now + settings.LEAK_EVALUATE_SECONDS
+                if now - subscribed_at >= self.RESUBSCRIBE_SECONDS:
+                    await layer.group_add(LEAK_GROUP, channel)
+                    subscribed_at = now
+                try:
+                    message = await asyncio.wait_for(layer.receive(channel), max(0.0, next_at - loop.time()))
+                except asyncio.TimeoutError:
+                    continue
+                self.receive(message['samples'])
+        finally:
+            await layer.group_discard(LEAK_GROUP, channel)
+
+
+def provision_leak_detection():
+    """
+    Подготовка конфигурации: шаблон тега небаланса для станций, теги по нему
+    (provision_tags) и определение аварии GT на теге небаланса каждого
+    участка. Существующие определения не меняются. Возвращает словарь
+    с числом созданных тегов, определений аварий и участков.
+    """
+    station_type = ObjectType.objects.get(name=settings.LEAK_STATION_TYPE)
+    TagTemplate.objects.get_or_create(
+        object_type=station_type, name_template=settings.LEAK_IMBALANCE_TEMPLATE,
+        defaults={
+            'description_template': 'Небаланс расхода на участке от НПС {index} до следующей НПС',
+            'engineering_units': '%',
+            'min_value': -10.0,
+            'max_value': 10.0,
+            'compression': 'DEADBAND',
+            'deadband_abs': 0.05,
+        },
+    )
+    tags = provision_tags(object_types=[station_type.pk], archive_missing=False)
+    segments = load_segments()
+    existing = set(AlarmDefinition.objects.filter(
+        tag_id__in=[segment.imbalance_tag_id for segment in segments], condition='GT',
+    ).values_list('tag_id', flat=True))
+    definitions = [
+        AlarmDefinition(
+            tag_id=segment.imbalance_tag_id,
+            name=f'Утечка: {segment.upstream[1]} — {segment.downstream[1]}',
+            condition='GT',
+            trigger_value=settings.LEAK_THRESHOLD_PCT,
+            message=f'Небаланс расхода на участке {segment.upstream[1]} — {segment.downstream[1]} '
+                    f'выше {settings.LEAK_THRESHOLD_PCT}%: возможна утечка',
+            severity='CRITICAL',
+            deadband=settings.LEAK_THRESHOLD_PCT / 4,
+            on_delay=settings.LEAK_ALARM_DELAY,
+        )
+        for segment in segments if segment.imbalance_tag_id not in existing
+    ]
+    if definitions:
+        with transaction.atomic():
+            AlarmDefinition.objects.bulk_create(definitions)
+            # bulk_create не отправляет post_save
+            transaction.on_commit(bump_config_version)
+    return {'tags_created': tags['created'], 'alarm_definitions': len(definitions), 'segments': len(segments)}
+
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from scada.rollups import MINUTE, HOUR, apply_rollup_retention, build_rollups
+
+
+class Command(BaseCommand):
+    help = 'Построение агрегатов истории (1 минута, 1 час) без Celery, например после загрузки архива'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention', action='store_true',
+                            help='Удалить агрегаты старше сроков хранения')
+
+    def handle(self, *args, **options):
+        for interval, label in ((MINUTE, '1 минута'), (HOUR, '1 час')):
+            written = build_rollups(interval)
+            self.stdout.write(self.style.SUCCESS(f'✓ Агрегаты {label}: записано строк {written}'))
+
+        if options['retention']:
+            deleted = apply_rollup_retention()
+            self.stdout.write(self.style.WARNING(f'Удалено агрегатов: {deleted}'))
@@ -0,0 +1,68 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from scada.modbus import ModbusSimulator
+from scada.models import ModbusPoint
+from scada.simulation import PlantSimulator, build_modbus_device, build_plant, plant_tags
+
+
+class Command(BaseCommand):
+    help = ('Симулятор устройства Modbus TCP: значения тегов симуляции (simulate_plant) '
+            'в регистрах, обновляемые с заданной частотой')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=5020)
+        parser.add_argument('--objects', type=int, default=0,
+                            help='Создать N объектов каждого типа (как simulate_plant --objects)')
+        parser.add_argument('--map', action='store_true',
+                            help='Создать устройство SIM-MODBUS и точки для тегов симуляции')
+        parser.add_argument('--scan-class', type=int, default=1000, choices=[100, 1000, 10000],
+                            help='Класс опроса создаваемых точек, мс')
+        parser.add_argument('--rate', type=float, default=10.0, help='Обновлений регистров в секунду')
+        parser.add_argument('--duration', type=float, default=None, help='Длительность, с (по умолчанию — без ограничения)')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['objects']:
+            result = build_plant(options['objects'])
+            self.stdout.write(self.style.SUCCESS(f"✓ Теги симуляции: создано {result['created']}"))
+        tags = plant_tags()
+        if not tags:
+            raise CommandError('Нет тегов симуляции: запустите с --objects N')
+        if options['map']:
+            device = build_modbus_device(tags, options['host'], options['port'], options['scan_class'])
+            self.stdout.write(self.style.SUCCESS(f'✓ Устройство {device}: точек {len(tags)}'))
+
+        points = list(ModbusPoint.objects.filter(tag_id__in=[tag_id for tag_id, _, _, _ in tags]).values_list(
+            'tag_id', 'register_type', 'address', 'data_type', 'word_swap', 'scale', 'offset'
+        ))
+        if not points:
+            raise CommandError('У тегов симуляции нет точек Modbus: запустите с --map')
+        mapped = {point[0] for point in points}
+        tags = [tag for tag in tags if tag[0] in mapped]
+        simulator = PlantSimulator.for_tags(tags, seed=options['seed'])
+        asyncio.run(self.serve(simulator, points, options))
+
+    async def serve(self, simulator, points, options):
+        server = await ModbusSimulator(options['host'], options['port']).start()
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Modbus TCP {options['host']}:{server.port}, точек {len(points)}, обновлений {options['rate']:g}/с"
+        ))
+        by_tag = {point[0]: point[1:] for point in points}
+        interval = 1.0 / options['rate']
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        next_at = started
+        try:
+            while options['duration'] is None or loop.time() - started < options['duration']:
+                for tag_id, value, _, _ in simulator.step(timezone.now()):
+                    register_type, address, data_type, word_swap, scale, offset = by_tag[tag_id]
+                    server.set_value(register_type, address, (value - offset) / scale, data_type, word_swap)
+                next_at += interval
+                await asyncio.sleep(max(0.0, next_at - loop.time()))
+        finally:
+            await server.stop()
+            self.stdout.write(f'Запросов обработано: {server.requests}')
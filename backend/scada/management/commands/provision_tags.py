@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scada.provisioning import ProvisioningError, provision_tags
+
+
+class Command(BaseCommand):
+    help = 'Создание, обновление и архивация тегов по шаблонам для всех объектов нефтепровода'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--object-type', type=int, action='append', dest='object_types',
+                            help='Ограничить id типа объекта (можно указать несколько раз)')
+        parser.add_argument('--no-archive', action='store_true',
+                            help='Не архивировать теги, для которых нет шаблона или объекта')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать изменения')
+
+    def handle(self, *args, **options):
+        try:
+            result = provision_tags(
+                object_types=options['object_types'],
+                archive_missing=not options['no_archive'],
+                dry_run=options['dry_run'],
+            )
+        except ProvisioningError as exc:
+            raise CommandError(str(exc))
+
+        prefix = 'Будет ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}создано: {result['created']}, обновлено: {result['updated']}, "
+            f"восстановлено: {result['restored']}, архивировано: {result['archived']}, "
+            f"без изменений: {result['unchanged']}"
+        ))
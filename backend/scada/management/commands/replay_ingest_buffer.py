@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from scada.writebuffer import write_buffer
+
+
+class Command(BaseCommand):
+    help = 'Перенос значений из буфера записи (INGEST_BUFFER_DIR) в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='store_true', help='Только показать состояние буфера')
+        parser.add_argument('--watch', action='store_true', help='Переносить непрерывно')
+        parser.add_argument('--interval', type=float, default=1.0, help='Пауза между проверками для --watch, с')
+
+    def handle(self, *args, **options):
+        stats = write_buffer.stats()
+        self.stdout.write(f"Каталог {write_buffer.directory}: значений {stats['depth']}, сегментов {stats['segments']}")
+        if options['status']:
+            return
+        while True:
+            began = time.perf_counter()
+            replayed = write_buffer.drain()
+            if replayed:
+                elapsed = time.perf_counter() - began
+                self.stdout.write(self.style.SUCCESS(
+                    f'✓ Перенесено значений: {replayed} за {elapsed:.1f} с ({replayed / elapsed:.0f}/с)'
+                ))
+            if not options['watch']:
+                return
+            time.sleep(options['interval'])
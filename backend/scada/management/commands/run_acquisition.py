@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scada.acquisition import AcquisitionService, load_plan
+
+
+class Command(BaseCommand):
+    help = 'Служба сбора данных: опрос устройств Modbus TCP по классам опроса и запись значений тегов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', action='append', default=[], help='Опрашивать только это устройство (можно несколько)')
+        parser.add_argument('--duration', type=float, default=None, help='Длительность, с (по умолчанию — без ограничения)')
+        parser.add_argument('--stats-interval', type=float, default=10.0, help='Период вывода статистики, с (0 — не выводить)')
+
+    def handle(self, *args, **options):
+        plan = load_plan(options['device'])
+        if not plan:
+            raise CommandError('Нет включённых устройств Modbus с точками')
+        for device, scan_classes in plan:
+            summary = ', '.join(
+                f'{scan_class} мс: {sum(len(block.points) for block in blocks)} точек / {len(blocks)} блоков'
+                for scan_class, blocks in sorted(scan_classes.items())
+            )
+            self.stdout.write(f'{device}: {summary}')
+
+        service = AcquisitionService(plan)
+        began = time.perf_counter()
+        try:
+            asyncio.run(self.serve(service, options))
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.perf_counter() - began
+        stats = service.stats
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Прочитано точек: {stats['points']} за {elapsed:.1f} с ({stats['points'] / elapsed:.0f}/с), "
+            f"записано значений: {stats['written']} (пакетов {stats['batches']}), "
+            f"время записи {stats['write_seconds']:.1f} с, ошибок чтения {stats['errors']}, "
+            f"перерасходов цикла {stats['overruns']}"
+        ))
+
+    async def serve(self, service, options):
+        reporter = None
+        if options['stats_interval'] > 0:
+            reporter = asyncio.create_task(self.report(service, options['stats_interval']))
+        try:
+            await service.run(options['duration'])
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+
+    async def report(self, service, interval):
+        previous = dict(service.stats)
+        while True:
+            await asyncio.sleep(interval)
+            stats = dict(service.stats)
+            self.stdout.write(
+                f"точек/с {(stats['points'] - previous['points']) / interval:.0f}, "
+                f"записано/с {(stats['written'] - previous['written']) / interval:.0f}, "
+                f"ошибок {stats['errors'] - previous['errors']}, "
+                f"перерасходов {stats['overruns'] - previous['overruns']}"
+            )
+            previous = stats
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scada.ingest import ingest_values
+from scada.leaks import LeakDetectionService, load_segments, provision_leak_detection
+from scada.models import ObjectType
+
+
+class Command(BaseCommand):
+    help = 'Служба обнаружения утечек: баланс расхода между соседними НПС по скользящему окну'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--provision', action='store_true',
+            help='Создать шаблон и теги небаланса и определения аварий участков, затем выйти',
+        )
+        parser.add_argument('--duration', type=float, default=None, help='Длительность, с (по умолчанию — без ограничения)')
+        parser.add_argument('--stats-interval', type=float, default=10.0, help='Период вывода статистики, с (0 — не выводить)')
+
+    def handle(self, *args, **options):
+        if options['provision']:
+            try:
+                result = provision_leak_detection()
+            except ObjectType.DoesNotExist:
+                raise CommandError('Тип объектов станций (LEAK_STATION_TYPE) не найден')
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Участков: {result['segments']}, создано тегов: {result['tags_created']}, "
+                f"определений аварий: {result['alarm_definitions']}"
+            ))
+            return
+
+        segments = load_segments()
+        if not segments:
+            raise CommandError('Нет участков: нужны станции с км отметкой, тегами расхода и небаланса (см. --provision)')
+        self.stdout.write(f'Участков: {len(segments)}')
+
+        service = LeakDetectionService(ingest_values)
+        began = time.perf_counter()
+        try:
+            asyncio.run(self.serve(service, options))
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.perf_counter() - began
+        stats = service.stats
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Отсчётов расхода: {stats['samples']} за {elapsed:.1f} с ({stats['samples'] / elapsed:.0f}/с), "
+            f"расчётов: {stats['evaluations']}, записано значений небаланса: {stats['written']}"
+        ))
+
+    async def serve(self, service, options):
+        reporter = None
+        if options['stats_interval'] > 0:
+            reporter = asyncio.create_task(self.report(service, options['stats_interval']))
+        try:
+            await service.run(options['duration'])
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+
+    async def report(self, service, interval):
+        previous = dict(service.stats)
+        while True:
+            await asyncio.sleep(interval)
+            stats = dict(service.stats)
+            self.stdout.write(
+                f"отсчётов/с {(stats['samples'] - previous['samples']) / interval:.0f}, "
+                f"участков {stats['segments']}, выше порога {stats['over_threshold']}, "
+                f"записано/с {(stats['written'] - previous['written']) / interval:.0f}"
+            )
+            previous = stats
@@ -0,0 +1,79 @@
+import json
+
+from django.db import connection
+from django.core.management.base import BaseCommand, CommandError
+
+from scada.benchmark import run_benchmark
+from scada.simulation import build_plant, create_alarm_definitions, plant_tags
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк: пропускная способность записи, латентность трендов и проверки аварий '
+            'на синтетической установке. Запускать на отдельной базе SQLite')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--objects', type=int, default=20, help='Объектов каждого типа')
+        parser.add_argument('--ticks', type=int, default=1000, help='Отсчётов истории на тег')
+        parser.add_argument('--interval', type=float, default=10.0, help='Шаг истории, с')
+        parser.add_argument('--batch', type=int, default=5000, help='Строк в пакете записи')
+        parser.add_argument('--queries', type=int, default=50, help='Запросов трендов каждого вида')
+        parser.add_argument('--alarm-ticks', type=int, default=200, help='Отсчётов для замера проверки аварий')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+        parser.add_argument('--force', action='store_true',
+                            help='Разрешить запуск не на SQLite (пишет синтетические данные в базу)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite' and not options['force']:
+            raise CommandError('Бенчмарк пишет синтетические данные; запустите его на SQLite '
+                               '(DB_ENGINE=sqlite DB_NAME=...) или укажите --force')
+        build_plant(options['objects'])
+        tags = plant_tags()
+        if not tags:
+            raise CommandError('Нет тегов: сначала создайте типы объектов и шаблоны (create_pipeline_data.py)')
+        create_alarm_definitions([tag_id for tag_id, _, _, _ in tags])
+
+        result = run_benchmark(
+            tags,
+            ticks=options['ticks'],
+            interval=options['interval'],
+            batch_rows=options['batch'],
+            queries=options['queries'],
+            alarm_ticks=options['alarm_ticks'],
+            seed=options['seed'],
+        )
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2, ensure_ascii=False))
+            return
+
+        ingest = result['ingest']
+        self.stdout.write(f"Тегов: {result['tags']}")
+        self.stdout.write(
+            f"Запись: {ingest['rows']} значений за {ingest['seconds']} с — {ingest['rows_per_second']} значений/с, "
+            f"в архив {ingest['stored']}; пакет {self._format(ingest['batch_latency'])}"
+        )
+        self.stdout.write(f"Агрегаты: {result['rollups']['rows']} строк за {result['rollups']['seconds']} с")
+        self.stdout.write(
+            f"Аварии ({result['alarms']['values_per_tick']} значений на отсчёт): {self._format(result['alarms'])}"
+        )
+        for name, stats in result['queries'].items():
+            self.stdout.write(f"Запрос {name}: {self._format(stats)}")
+        serialization = result['serialization']
+        self.stdout.write(
+            f"Сериализация ({serialization['tags']} тегов): TagSerializer {serialization['serializer_ms']} мс"
+        )
+        for name in ('rest_json', 'rest_orjson', 'rest_msgpack', 'ws_json', 'ws_orjson', 'ws_msgpack'):
+            stats = serialization[name]
+            self.stdout.write(f"  {name}: {stats['ms']} мс, {stats['bytes']} байт")
+        balance = result['mass_balance']
+        self.stdout.write(
+            f"Баланс расхода ({balance['segments']} участков): приём {balance['samples_per_second']} отсчётов/с, "
+            f"расчёт {balance['evaluate_ms']} мс, небаланс с утечкой {balance['leak_imbalance_pct']}% "
+            f"(остальные до {balance['other_max_pct']}%)"
+        )
+
+    def _format(self, stats):
+        if not stats['count']:
+            return 'нет данных'
+        return (f"p50 {stats['p50_ms']} мс, p95 {stats['p95_ms']} мс, "
+                f"p99 {stats['p99_ms']} мс, max {stats['max_ms']} мс (n={stats['count']})")
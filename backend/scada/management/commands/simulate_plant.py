@@ -0,0 +1,68 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from scada.ingest import ingest_values
+from scada.simulation import PlantSimulator, build_plant, create_alarm_definitions, plant_tags
+
+
+class Command(BaseCommand):
+    help = ('Симуляция объектов нефтепровода: N объектов каждого типа с шаблонами '
+            '(см. create_pipeline_data.py), поток значений тегов с шумом, дрейфом и ступеньками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--objects', type=int, default=10, help='Объектов каждого типа')
+        parser.add_argument('--rate', type=float, default=1.0, help='Отсчётов в секунду на тег')
+        parser.add_argument('--duration', type=float, default=60.0, help='Длительность, с')
+        parser.add_argument('--backfill', action='store_true',
+                            help='Сгенерировать историю за последние --duration секунд без ожидания')
+        parser.add_argument('--batch', type=int, default=5000, help='Строк в пакете записи (для --backfill)')
+        parser.add_argument('--with-alarms', action='store_true',
+                            help='Создать определения аварий GT для тегов float без аварий')
+        parser.add_argument('--all-tags', action='store_true',
+                            help='Симулировать все теги, а не только объекты симуляции')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        result = build_plant(options['objects'])
+        self.stdout.write(self.style.SUCCESS(f"✓ Теги симуляции: создано {result['created']}"))
+        tags = plant_tags(prefix=None if options['all_tags'] else 'SIM')
+        if not tags:
+            raise CommandError('Нет тегов: сначала создайте типы объектов и шаблоны (create_pipeline_data.py)')
+        if options['with_alarms']:
+            created = create_alarm_definitions([tag_id for tag_id, _, _, _ in tags])
+            self.stdout.write(self.style.SUCCESS(f'✓ Создано определений аварий: {created}'))
+
+        simulator = PlantSimulator.for_tags(tags, seed=options['seed'])
+        interval = 1.0 / options['rate']
+        ticks = max(1, int(options['duration'] * options['rate']))
+        self.stdout.write(f'Тегов: {len(tags)}, отсчётов: {ticks}, интервал {interval:g} с')
+
+        began = time.perf_counter()
+        written = 0
+        if options['backfill']:
+            pending = []
+            start = timezone.now() - timedelta(seconds=ticks * interval)
+            for _, rows in simulator.run(start, ticks, interval):
+                pending.extend(rows)
+                if len(pending) >= options['batch']:
+                    written += len(ingest_values(pending)[0])
+                    pending = []
+            if pending:
+                written += len(ingest_values(pending)[0])
+        else:
+            for tick in range(ticks):
+                deadline = began + (tick + 1) * interval
+                written += len(ingest_values(simulator.step(timezone.now()))[0])
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif tick % max(1, int(options['rate'] * 10)) == 0:
+                    self.stdout.write(self.style.WARNING(f'Отставание от темпа {-delay:.2f} с'))
+
+        elapsed = time.perf_counter() - began
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Записано значений: {written} за {elapsed:.1f} с ({written / elapsed:.0f} значений/с)'
+        ))
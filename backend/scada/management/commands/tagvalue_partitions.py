@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from scada.partitions import apply_retention, ensure_partitions, is_partitioned, list_partitions
+
+
+class Command(BaseCommand):
+    help = 'Создание будущих секций истории тегов и удаление секций старше срока хранения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=None,
+                            help='На сколько месяцев вперёд создавать секции')
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help='Срок хранения истории в днях (по умолчанию TAGVALUE_RETENTION_DAYS)')
+        parser.add_argument('--detach-only', action='store_true',
+                            help='Только отсоединять старые секции, не удаляя их')
+        parser.add_argument('--list', action='store_true', help='Показать существующие секции')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write('Таблица истории не секционирована (не PostgreSQL)')
+        else:
+            for name in ensure_partitions(options['ahead']):
+                self.stdout.write(self.style.SUCCESS(f'✓ Создана секция {name}'))
+
+        removed, deleted = apply_retention(options['retention_days'], detach_only=options['detach_only'])
+        for name in removed:
+            action = 'Отсоединена' if options['detach_only'] else 'Удалена'
+            self.stdout.write(self.style.WARNING(f'{action} секция {name}'))
+        if deleted:
+            self.stdout.write(self.style.WARNING(f'Удалено строк истории: {deleted}'))
+
+        if options['list'] and is_partitioned():
+            for start, name in list_partitions():
+                self.stdout.write(f'{name}  {start:%Y-%m}')
@@ -0,0 +1,234 @@
+import contextvars
+import hmac
+import ipaddress
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger('scada.metrics')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Сборщик SQL текущего запроса/сообщения; None — запросы не учитываются
+_collector = contextvars.ContextVar('scada_sql_collector', default=None)
+
+
+class SqlCollector:
+    """Число, суммарное время и первые max_queries SQL-запросов одного запроса"""
+    __slots__ = ('count', 'seconds', 'queries', 'max_queries')
+
+    def __init__(self, max_queries):
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = []
+        self.max_queries = max_queries
+
+
+def sql_execute_wrapper(execute, sql, params, many, context):
+    collector = _collector.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - began
+        collector.count += 1
+        collector.seconds += elapsed
+        if len(collector.queries) < collector.max_queries:
+            collector.queries.append((elapsed, sql))
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    """Подключает учёт SQL к новому соединению (сигнал connection_created)"""
+    if sql_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_execute_wrapper)
+
+
+class Histogram:
+    """Гистограмма Prometheus с фиксированными границами корзин"""
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Метрики процесса: гистограммы по набору меток и счётчики.
+    Каждый процесс (воркер) ведёт свой реестр. Значения других подсистем
+    (счётчики, показатели) добавляются сборщиками: функциями, возвращающими
+    список кортежей (имя, тип, описание, значение).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+
+    def add_collector(self, collector):
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def describe(self, name, help_text, bounds):
+        self._help[name] = (help_text, bounds)
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self._help[name][1])
+            histogram.observe(value)
+
+    def render(self):
+        """Текстовый формат Prometheus 0.0.4"""
+        with self._lock:
+            items = sorted(
+                (name, labels, list(h.counts), h.sum, h.count)
+                for (name, labels), h in self._histograms.items()
+            )
+        lines = []
+        described = set()
+        for name, labels, counts, total, count in items:
+            if name not in described:
+                help_text, _ = self._help[name]
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                described.add(name)
+            bounds = self._help[name][1]
+            label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+            prefix = f'{label_text},' if label_text else ''
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{{label_text}}} {total:.6f}')
+            lines.append(f'{name}_count{{{label_text}}} {count}')
+        for collector in self._collectors:
+            for name, kind, help_text, value in collector():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+registry.describe('scada_http_request_duration_seconds', 'Время обработки HTTP-запроса', LATENCY_BUCKETS)
+registry.describe('scada_http_request_sql_queries', 'Число SQL-запросов на HTTP-запрос', QUERY_BUCKETS)
+registry.describe('scada_http_request_sql_duration_seconds', 'Время SQL на HTTP-запрос', LATENCY_BUCKETS)
+registry.describe('scada_ws_message_duration_seconds', 'Время обработки сообщения WebSocket', LATENCY_BUCKETS)
+registry.describe('scada_ws_message_sql_queries', 'Число SQL-запросов на сообщение WebSocket', QUERY_BUCKETS)
+registry.describe('scada_ws_message_sql_duration_seconds', 'Время SQL на сообщение WebSocket', LATENCY_BUCKETS)
+
+
+def _log_slow(kind, name, elapsed, collector):
+    queries = sorted(collector.queries, key=lambda item: item[0], reverse=True)
+    query_lines = ''.join(f'\n  {seconds * 1000:.1f} мс: {sql[:500]}' for seconds, sql in queries)
+    logger.warning(
+        'Медленный %s %s: %.1f мс, SQL: %d запросов, %.1f мс%s',
+        kind, name, elapsed * 1000, collector.count, collector.seconds * 1000, query_lines,
+    )
+
+
+class MetricsMiddleware:
+    """
+    Латентность, число и время SQL-запросов на HTTP-запрос по маршрутам
+    (имя URL DRF, например tag-list, tagvalue-trend). Запросы дольше
+    SLOW_REQUEST_MS пишутся в лог scada.metrics вместе со списком SQL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        collector = SqlCollector(settings.SLOW_REQUEST_LOG_QUERIES)
+        token = _collector.set(collector)
+        began = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - began
+            _collector.reset(token)
+
+        match = request.resolver_match
+        route = match.view_name if match else 'unresolved'
+        labels = (('method', request.method), ('route', route), ('status', str(response.status_code)))
+        registry.observe('scada_http_request_duration_seconds', labels, elapsed)
+        registry.observe('scada_http_request_sql_queries', labels, collector.count)
+        registry.observe('scada_http_request_sql_duration_seconds', labels, collector.seconds)
+        if elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+            _log_slow('запрос', f'{request.method} {request.get_full_path()} ({response.status_code})',
+                      elapsed, collector)
+        return response
+
+
+class ConsumerMetricsMixin:
+    """
+    Те же метрики для consumer-ов Channels: замеряется обработка каждого
+    сообщения (websocket.receive, групповые события) в dispatch.
+    """
+
+    async def dispatch(self, message):
+        if not settings.METRICS_ENABLED:
+            return await super().dispatch(message)
+        collector = SqlCollector(settings.SLOW_REQUEST_LOG_QUERIES)
+        token = _collector.set(collector)
+        began = time.perf_counter()
+        try:
+            return await super().dispatch(message)
+        finally:
+            elapsed = time.perf_counter() - began
+            _collector.reset(token)
+            labels = (('consumer', type(self).__name__), ('message', message.get('type', '')))
+            registry.observe('scada_ws_message_duration_seconds', labels, elapsed)
+            registry.observe('scada_ws_message_sql_queries', labels, collector.count)
+            registry.observe('scada_ws_message_sql_duration_seconds', labels, collector.seconds)
+            if elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+                _log_slow('WebSocket', f"{type(self).__name__} {message.get('type', '')}", elapsed, collector)
+
+
+def _metrics_allowed(request):
+    """
+    Доступ к /metrics: METRICS_PUBLIC, верный Bearer-токен METRICS_TOKEN или
+    адрес клиента из METRICS_ALLOWED_NETWORKS. Адрес — REMOTE_ADDR, а не
+    X-Forwarded-For: заголовок подделывается клиентом.
+    """
+    if settings.METRICS_PUBLIC:
+        return True
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics_view(request):
+    """Метрики процесса в формате Prometheus (доступ — см. _metrics_allowed)"""
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
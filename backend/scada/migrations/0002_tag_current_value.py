@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_current_values(apps, schema_editor):
+    Tag = apps.get_model('scada', 'Tag')
+    TagValue = apps.get_model('scada', 'TagValue')
+    TagCurrentValue = apps.get_model('scada', 'TagCurrentValue')
+
+    current = []
+    for tag_id in Tag.objects.values_list('id', flat=True).iterator():
+        latest = TagValue.objects.filter(tag_id=tag_id).order_by('-timestamp').first()
+        if latest:
+            current.append(TagCurrentValue(
+                tag_id=tag_id, value=latest.value, quality=latest.quality, timestamp=latest.timestamp
+            ))
+    TagCurrentValue.objects.bulk_create(current, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagCurrentValue',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='current', serialize=False, to='scada.tag', verbose_name='Тег')),
+                ('value', models.FloatField(verbose_name='Значение')),
+                ('quality', models.IntegerField(default=100, verbose_name='Качество (0-100)')),
+                ('timestamp', models.DateTimeField(verbose_name='Временная метка')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Текущее значение тега',
+                'verbose_name_plural': 'Текущие значения тегов',
+            },
+        ),
+        migrations.RunPython(fill_current_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def partition_tagvalue(apps, schema_editor):
+    """
+    PostgreSQL: превращает scada_tagvalue в таблицу, секционированную по
+    месяцам timestamp. Первичный ключ секционированной таблицы обязан
+    включать ключ секционирования, поэтому он становится (id, timestamp).
+
+    Вся история копируется одним INSERT ... SELECT в транзакции миграции.
+    RENAME берёт ACCESS EXCLUSIVE на scada_tagvalue, и блокировка держится
+    до фиксации: чтение и запись истории стоят всё время копирования и
+    построения индексов. На время миграции нужно место под вторую копию
+    таблицы. На большой истории миграцию выполняют в окно обслуживания,
+    остановив запись (см. docs/deployment.md).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    from datetime import datetime, timezone
+
+    def add_month(moment):
+        return moment.replace(year=moment.year + moment.month // 12, month=moment.month % 12 + 1)
+
+    execute = schema_editor.execute
+    execute('ALTER TABLE scada_tagvalue RENAME TO scada_tagvalue_old')
+    execute('CREATE SEQUENCE scada_tagvalue_id_seq_p')
+    execute(
+        'CREATE TABLE scada_tagvalue ('
+        " id bigint NOT NULL DEFAULT nextval('scada_tagvalue_id_seq_p'),"
+        ' value double precision NOT NULL,'
+        ' quality integer NOT NULL,'
+        ' "timestamp" timestamp with time zone NOT NULL,'
+        ' tag_id bigint NOT NULL REFERENCES scada_tag (id) DEFERRABLE INITIALLY DEFERRED,'
+        ' PRIMARY KEY (id, "timestamp")'
+        ') PARTITION BY RANGE ("timestamp")'
+    )
+    execute('ALTER SEQUENCE scada_tagvalue_id_seq_p OWNED BY scada_tagvalue.id')
+    execute('CREATE TABLE scada_tagvalue_default PARTITION OF scada_tagvalue DEFAULT')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT min("timestamp"), max("timestamp") FROM scada_tagvalue_old')
+        first, last = cursor.fetchone()
+    now = datetime.now(timezone.utc)
+    first = min(first, now) if first else now
+    last = max(last, now) if last else now
+    start = datetime(first.year, first.month, 1, tzinfo=timezone.utc)
+    while start <= last:
+        end = add_month(start)
+        execute(
+            f'CREATE TABLE scada_tagvalue_p{start.year:04d}_{start.month:02d} '
+            f'PARTITION OF scada_tagvalue FOR VALUES FROM (%s) TO (%s)',
+            [start, end],
+        )
+        start = end
+
+    execute(
+        'INSERT INTO scada_tagvalue (id, value, quality, "timestamp", tag_id) '
+        'SELECT id, value, quality, "timestamp", tag_id FROM scada_tagvalue_old'
+    )
+    execute(
+        "SELECT setval('scada_tagvalue_id_seq_p', "
+        "COALESCE((SELECT max(id) FROM scada_tagvalue), 0) + 1, false)"
+    )
+    execute('DROP TABLE scada_tagvalue_old')
+    execute('CREATE INDEX tagvalue_tag_ts_idx ON scada_tagvalue (tag_id, "timestamp" DESC)')
+    execute('CREATE INDEX tagvalue_ts_idx ON scada_tagvalue ("timestamp" DESC)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0002_tag_current_value'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='tagvalue',
+            options={'verbose_name': 'Значение тега', 'verbose_name_plural': 'Значения тегов'},
+        ),
+        migrations.AlterField(
+            model_name='tagvalue',
+            name='tag',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='values', to='scada.tag', verbose_name='Тег'),
+        ),
+        migrations.AddIndex(
+            model_name='tagvalue',
+            index=models.Index(fields=['tag', '-timestamp'], name='tagvalue_tag_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tagvalue',
+            index=models.Index(fields=['-timestamp'], name='tagvalue_ts_idx'),
+        ),
+        migrations.RunPython(partition_tagvalue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0003_tagvalue_partitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlarmEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transition', models.CharField(choices=[('RAISED', 'Возникла'), ('ACKNOWLEDGED', 'Квитирована'), ('RESOLVED', 'Сброшена')], max_length=15, verbose_name='Переход')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Время')),
+                ('alarm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='scada.alarm', verbose_name='Авария')),
+            ],
+            options={
+                'verbose_name': 'Событие аварии',
+                'verbose_name_plural': 'События аварий',
+                'ordering': ['id'],
+            },
+        ),
+    ]
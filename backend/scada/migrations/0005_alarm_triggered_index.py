@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0004_alarm_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alarm',
+            index=models.Index(fields=['-triggered_at', '-id'], name='alarm_triggered_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0005_alarm_triggered_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='compression',
+            field=models.CharField(blank=True, choices=[('NONE', 'Без сжатия'), ('DEADBAND', 'Зона нечувствительности'), ('SWINGING_DOOR', 'Вращающаяся дверь')], max_length=15, verbose_name='Сжатие архива'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='deadband_abs',
+            field=models.FloatField(blank=True, null=True, verbose_name='Зона нечувствительности (абс.)'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='deadband_pct',
+            field=models.FloatField(blank=True, null=True, verbose_name='Зона нечувствительности (% диапазона)'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='swinging_door_tolerance',
+            field=models.FloatField(blank=True, null=True, verbose_name='Допуск вращающейся двери'),
+        ),
+        migrations.AddField(
+            model_name='tagcurrentvalue',
+            name='raw_count',
+            field=models.BigIntegerField(default=0, verbose_name='Принято значений'),
+        ),
+        migrations.AddField(
+            model_name='tagcurrentvalue',
+            name='stored_count',
+            field=models.BigIntegerField(default=0, verbose_name='Записано в архив'),
+        ),
+        migrations.AddField(
+            model_name='tagtemplate',
+            name='compression',
+            field=models.CharField(choices=[('NONE', 'Без сжатия'), ('DEADBAND', 'Зона нечувствительности'), ('SWINGING_DOOR', 'Вращающаяся дверь')], default='NONE', max_length=15, verbose_name='Сжатие архива'),
+        ),
+        migrations.AddField(
+            model_name='tagtemplate',
+            name='deadband_abs',
+            field=models.FloatField(default=0.0, verbose_name='Зона нечувствительности (абс.)'),
+        ),
+        migrations.AddField(
+            model_name='tagtemplate',
+            name='deadband_pct',
+            field=models.FloatField(default=0.0, verbose_name='Зона нечувствительности (% диапазона)'),
+        ),
+        migrations.AddField(
+            model_name='tagtemplate',
+            name='swinging_door_tolerance',
+            field=models.FloatField(default=0.0, verbose_name='Допуск вращающейся двери'),
+        ),
+    ]
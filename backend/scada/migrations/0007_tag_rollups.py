@@ -0,0 +1,47 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0006_archive_compression'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.PositiveIntegerField(choices=[(60, '1 минута'), (3600, '1 час')], unique=True, verbose_name='Интервал (с)')),
+                ('built_until', models.DateTimeField(verbose_name='Построено до')),
+            ],
+            options={
+                'verbose_name': 'Состояние агрегатов',
+                'verbose_name_plural': 'Состояние агрегатов',
+            },
+        ),
+        migrations.CreateModel(
+            name='TagRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.PositiveIntegerField(choices=[(60, '1 минута'), (3600, '1 час')], verbose_name='Интервал (с)')),
+                ('bucket', models.DateTimeField(verbose_name='Начало интервала')),
+                ('min', models.FloatField(verbose_name='Минимум')),
+                ('max', models.FloatField(verbose_name='Максимум')),
+                ('avg', models.FloatField(verbose_name='Среднее')),
+                ('count', models.IntegerField(verbose_name='Количество значений')),
+                ('first', models.FloatField(verbose_name='Первое значение')),
+                ('last', models.FloatField(verbose_name='Последнее значение')),
+                ('tag', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='scada.tag', verbose_name='Тег')),
+            ],
+            options={
+                'verbose_name': 'Агрегат значений тега',
+                'verbose_name_plural': 'Агрегаты значений тегов',
+                'indexes': [models.Index(fields=['interval', 'bucket'], name='tagrollup_interval_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tag', 'interval', 'bucket'), name='tagrollup_tag_interval_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0007_tag_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alarm',
+            index=models.Index(condition=models.Q(('state__in', ['ACTIVE', 'ACKNOWLEDGED'])), fields=['state'], name='alarm_open_state_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-17 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0008_alarm_open_state_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alarmdefinition',
+            name='chatter_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Срабатываний для дребезга (0 — выкл.)'),
+        ),
+        migrations.AddField(
+            model_name='alarmdefinition',
+            name='chatter_window',
+            field=models.FloatField(default=60.0, verbose_name='Окно дребезга (с)'),
+        ),
+        migrations.AddField(
+            model_name='alarmdefinition',
+            name='deadband',
+            field=models.FloatField(default=0.0, verbose_name='Гистерезис сброса'),
+        ),
+        migrations.AddField(
+            model_name='alarmdefinition',
+            name='off_delay',
+            field=models.FloatField(default=0.0, verbose_name='Задержка сброса (с)'),
+        ),
+        migrations.AddField(
+            model_name='alarmdefinition',
+            name='on_delay',
+            field=models.FloatField(default=0.0, verbose_name='Задержка срабатывания (с)'),
+        ),
+        migrations.AddField(
+            model_name='alarmdefinition',
+            name='shelve_duration',
+            field=models.FloatField(default=600.0, verbose_name='Отключение при дребезге (с)'),
+        ),
+        migrations.AddField(
+            model_name='alarmdefinition',
+            name='shelved_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Отключена до'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.2 on 2026-10-17 19:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0009_alarm_flood_protection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModbusDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Название')),
+                ('host', models.CharField(max_length=255, verbose_name='Адрес')),
+                ('port', models.PositiveIntegerField(default=502, verbose_name='Порт')),
+                ('unit_id', models.PositiveSmallIntegerField(default=1, verbose_name='Адрес ведомого (Unit ID)')),
+                ('connections', models.PositiveSmallIntegerField(default=2, verbose_name='Соединений в пуле')),
+                ('timeout', models.FloatField(default=1.0, verbose_name='Таймаут ответа (с)')),
+                ('is_enabled', models.BooleanField(default=True, verbose_name='Опрашивается')),
+            ],
+            options={
+                'verbose_name': 'Устройство Modbus',
+                'verbose_name_plural': 'Устройства Modbus',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ModbusPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('register_type', models.CharField(choices=[('HOLDING', 'Holding (03)'), ('INPUT', 'Input (04)'), ('COIL', 'Coil (01)'), ('DISCRETE', 'Discrete input (02)')], default='HOLDING', max_length=10, verbose_name='Тип регистра')),
+                ('address', models.PositiveIntegerField(verbose_name='Адрес регистра')),
+                ('data_type', models.CharField(choices=[('INT16', 'INT16'), ('UINT16', 'UINT16'), ('INT32', 'INT32'), ('UINT32', 'UINT32'), ('FLOAT32', 'FLOAT32'), ('BOOL', 'BOOL')], default='FLOAT32', max_length=10, verbose_name='Тип данных')),
+                ('word_swap', models.BooleanField(default=False, verbose_name='Младшее слово первым')),
+                ('scale', models.FloatField(default=1.0, verbose_name='Множитель')),
+                ('offset', models.FloatField(default=0.0, verbose_name='Смещение')),
+                ('scan_class', models.PositiveIntegerField(choices=[(100, '100 мс'), (1000, '1 с'), (10000, '10 с')], default=1000, verbose_name='Класс опроса (мс)')),
+                ('is_enabled', models.BooleanField(default=True, verbose_name='Опрашивается')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points', to='scada.modbusdevice', verbose_name='Устройство')),
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='modbus_point', to='scada.tag', verbose_name='Тег')),
+            ],
+            options={
+                'verbose_name': 'Точка Modbus',
+                'verbose_name_plural': 'Точки Modbus',
+                'ordering': ['device', 'register_type', 'address'],
+            },
+        ),
+    ]
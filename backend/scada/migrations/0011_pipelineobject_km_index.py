@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-17 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0010_modbus_acquisition'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pipelineobject',
+            index=models.Index(fields=['km_mark'], name='pipelineobject_km_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-17 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0011_pipelineobject_km_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='expression',
+            field=models.TextField(blank=True, verbose_name='Выражение'),
+        ),
+        migrations.AddField(
+            model_name='tagtemplate',
+            name='expression_template',
+            field=models.TextField(blank=True, help_text='Для вычисляемых тегов, например PRESSURE_OUT_{index} - PRESSURE_IN_{index}', verbose_name='Шаблон выражения'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-17 19:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0012_calculated_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='compression_max_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='Максимальный интервал записи (с, 0 — без ограничения)'),
+        ),
+        migrations.AddField(
+            model_name='tagtemplate',
+            name='compression_max_seconds',
+            field=models.FloatField(default=600.0, verbose_name='Максимальный интервал записи (с, 0 — без ограничения)'),
+        ),
+    ]
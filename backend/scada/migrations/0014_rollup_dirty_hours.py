@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-17 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0013_compression_max_interval'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDirtyHour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(unique=True, verbose_name='Начало часа')),
+            ],
+            options={
+                'verbose_name': 'Час для пересчёта агрегатов',
+                'verbose_name_plural': 'Часы для пересчёта агрегатов',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-17 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0014_rollup_dirty_hours'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestBufferCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('buffer', models.CharField(max_length=32, unique=True, verbose_name='Идентификатор журнала')),
+                ('segment', models.PositiveBigIntegerField(verbose_name='Сегмент')),
+                ('offset', models.PositiveBigIntegerField(verbose_name='Смещение')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Позиция буфера записи',
+                'verbose_name_plural': 'Позиции буфера записи',
+            },
+        ),
+    ]
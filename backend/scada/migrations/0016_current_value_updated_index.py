@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0015_ingest_buffer_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tagcurrentvalue',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Обновлено'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-17 19:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def resolve_duplicates(apps, schema_editor):
+    """Лишние открытые аварии определения (кроме самой ранней) сбрасываются"""
+    Alarm = apps.get_model('scada', 'Alarm')
+    open_states = ['ACTIVE', 'ACKNOWLEDGED']
+    duplicated = (
+        Alarm.objects.filter(state__in=open_states)
+        .values('alarm_definition_id').annotate(alarms=Count('id')).filter(alarms__gt=1)
+        .values_list('alarm_definition_id', flat=True)
+    )
+    for definition_id in list(duplicated):
+        alarms = Alarm.objects.filter(alarm_definition_id=definition_id, state__in=open_states).order_by('triggered_at', 'id')
+        extra = list(alarms.values_list('id', flat=True)[1:])
+        Alarm.objects.filter(id__in=extra).update(state='RESOLVED', resolved_at=models.F('triggered_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scada', '0016_current_value_updated_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='alarm',
+            constraint=models.UniqueConstraint(condition=models.Q(('state__in', ['ACTIVE', 'ACKNOWLEDGED'])), fields=('alarm_definition',), name='alarm_one_open_idx'),
+        ),
+    ]
@@ -0,0 +1,224 @@
+import asyncio
+import itertools
+import struct
+from array import array
+
+# Коды функций чтения по типам регистров
+FUNCTION_CODES = {'COIL': 1, 'DISCRETE': 2, 'HOLDING': 3, 'INPUT': 4}
+BIT_TYPES = ('COIL', 'DISCRETE')
+# Ограничения протокола на одно чтение
+MAX_REGISTERS = 125
+MAX_BITS = 2000
+# Поле длины MBAP: байт адреса устройства и PDU (не больше 253 байт)
+MAX_MBAP_LENGTH = 254
+# Сколько 16-битных регистров занимает значение
+WIDTHS = {'INT16': 1, 'UINT16': 1, 'INT32': 2, 'UINT32': 2, 'FLOAT32': 2, 'BOOL': 1}
+
+_MBAP = struct.Struct('>HHHB')
+_READ_REQUEST = struct.Struct('>BHH')
+_FORMATS = {'INT32': '>i', 'UINT32': '>I', 'FLOAT32': '>f'}
+
+
+class ModbusError(Exception):
+    """Ошибка обмена с устройством: исключение Modbus, таймаут, разрыв соединения"""
+
+
+def decode(registers, index, data_type, word_swap=False):
+    """Значение типа data_type из регистров (или битов) начиная с index"""
+    if data_type == 'BOOL':
+        return 1.0 if registers[index] else 0.0
+    if data_type == 'UINT16':
+        return float(registers[index])
+    if data_type == 'INT16':
+        raw = registers[index]
+        return float(raw - 0x10000 if raw & 0x8000 else raw)
+    high, low = registers[index], registers[index + 1]
+    if word_swap:
+        high, low = low, high
+    return float(struct.unpack(_FORMATS[data_type], struct.pack('>HH', high, low))[0])
+
+
+def encode(value, data_type, word_swap=False):
+    """Обратное к decode: кортеж 16-битных слов для записи в регистры"""
+    if data_type == 'BOOL':
+        return (1 if value else 0,)
+    if data_type in ('INT16', 'UINT16'):
+        return (int(round(value)) & 0xFFFF,)
+    if data_type == 'FLOAT32':
+        packed = struct.pack('>f', value)
+    else:
+        packed = struct.pack('>I', int(round(value)) & 0xFFFFFFFF)
+    high, low = struct.unpack('>HH', packed)
+    return (low, high) if word_swap else (high, low)
+
+
+class ModbusConnection:
+    """
+    TCP-соединение с устройством. Запросы по одному соединению идут по
+    очереди (многие устройства не поддерживают конвейер запросов);
+    соединение открывается при первом запросе и после ошибки.
+    """
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._transactions = itertools.count(1)
+
+    async def _connect(self):
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError) as exc:
+            raise ModbusError(f'Нет соединения с {self.host}:{self.port}: {exc!r}') from exc
+
+    async def read(self, unit_id, function, address, count):
+        """
+        Выполняет чтение (функции 1-4); возвращает байты данных ответа.
+        Ответ проверяется по длине MBAP, коду функции и числу байт данных
+        (count регистров или битов): при несовпадении соединение
+        закрывается — поток байт после него уже не разобрать.
+        """
+        if self._writer is None:
+            await self._connect()
+        transaction_id = next(self._transactions) & 0xFFFF
+        request = _READ_REQUEST.pack(function, address, count)
+        try:
+            self._writer.write(_MBAP.pack(transaction_id, 0, len(request) + 1, unit_id) + request)
+            header = await asyncio.wait_for(self._reader.readexactly(_MBAP.size), self.timeout)
+            response_id, _, length, _ = _MBAP.unpack(header)
+            if not 3 <= length <= MAX_MBAP_LENGTH:
+                raise self._invalid(f'длина MBAP {length}')
+            body = await asyncio.wait_for(self._reader.readexactly(length - 1), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as exc:
+            self.close()
+            raise ModbusError(f'{self.host}:{self.port}: обмен прерван: {exc!r}') from exc
+        if response_id != transaction_id:
+            self.close()
+            raise ModbusError(f'{self.host}:{self.port}: ответ на чужую транзакцию {response_id}')
+        if body[0] & 0x7F != function:
+            raise self._invalid(f'код функции {body[0]} в ответе на {function}')
+        if body[0] & 0x80:
+            if len(body) != 2:
+                raise self._invalid(f'исключение длиной {len(body)} байт')
+            raise ModbusError(f'{self.host}:{self.port}: исключение Modbus {body[1]} (функция {function})')
+        expected = (count + 7) // 8 if function in (1, 2) else 2 * count
+        if body[1] != expected or len(body) != expected + 2:
+            raise self._invalid(f'ожидалось байт данных {expected}, получено {body[1]} ({len(body) - 2})')
+        return body[2:]
+
+    def _invalid(self, reason):
+        self.close()
+        return ModbusError(f'{self.host}:{self.port}: неверный ответ: {reason}')
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class ConnectionPool:
+    """
+    Пул соединений с одним устройством: не больше size одновременных
+    запросов, соединения переиспользуются между циклами опроса.
+    """
+
+    def __init__(self, host, port, size=2, timeout=1.0):
+        self._connections = [ModbusConnection(host, port, timeout) for _ in range(max(1, size))]
+        self._idle = asyncio.Queue()
+        for connection in self._connections:
+            self._idle.put_nowait(connection)
+
+    async def read(self, unit_id, register_type, address, count):
+        """Читает count регистров (кортеж слов) или битов (кортеж 0/1)"""
+        connection = await self._idle.get()
+        try:
+            data = await connection.read(unit_id, FUNCTION_CODES[register_type], address, count)
+        finally:
+            self._idle.put_nowait(connection)
+        # Число байт данных проверено в ModbusConnection.read
+        if register_type in BIT_TYPES:
+            return tuple((data[bit >> 3] >> (bit & 7)) & 1 for bit in range(count))
+        return struct.unpack(f'>{count}H', data)
+
+    def close(self):
+        for connection in self._connections:
+            connection.close()
+
+
+class ModbusSimulator:
+    """
+    Простой сервер Modbus TCP для проверки опроса без оборудования.
+    Поддерживает чтение (функции 1-4) из общей таблицы регистров и битов
+    на 65536 адресов; значения задаются через set_value.
+    """
+
+    def __init__(self, host='127.0.0.1', port=5020):
+        self.host = host
+        self.port = port
+        self.registers = array('H', bytes(2 * 65536))
+        self.bits = bytearray(65536)
+        self.requests = 0
+        self._server = None
+        self._clients = {}
+
+    def set_value(self, register_type, address, value, data_type='FLOAT32', word_swap=False):
+        if register_type in BIT_TYPES:
+            self.bits[address] = 1 if value else 0
+        else:
+            words = encode(value, data_type, word_swap)
+            self.registers[address:address + len(words)] = array('H', words)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+        for writer in self._clients.values():
+            writer.close()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._clients[task] = writer
+        try:
+            while True:
+                header = await reader.readexactly(_MBAP.size)
+                transaction_id, protocol, length, unit_id = _MBAP.unpack(header)
+                if not 2 <= length <= MAX_MBAP_LENGTH:
+                    # Границу следующего запроса не найти: соединение закрывается
+                    break
+                pdu = await reader.readexactly(length - 1)
+                self.requests += 1
+                response = self._respond(pdu)
+                writer.write(_MBAP.pack(transaction_id, protocol, len(response) + 1, unit_id) + response)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._clients[task]
+            writer.close()
+
+    def _respond(self, pdu):
+        function = pdu[0]
+        if function not in (1, 2, 3, 4) or len(pdu) != _READ_REQUEST.size:
+            return bytes((function | 0x80, 1))
+        _, address, count = _READ_REQUEST.unpack(pdu)
+        if function in (1, 2):
+            if not 1 <= count <= MAX_BITS or address + count > len(self.bits):
+                return bytes((function | 0x80, 2))
+            data = bytearray((count + 7) // 8)
+            for bit in range(count):
+                if self.bits[address + bit]:
+                    data[bit >> 3] |= 1 << (bit & 7)
+            return bytes((function, len(data))) + bytes(data)
+        if not 1 <= count <= MAX_REGISTERS or address + count > len(self.registers):
+            return bytes((function | 0x80, 2))
+        return bytes((function, 2 * count)) + struct.pack(f'>{count}H', *self.registers[address:address + count])
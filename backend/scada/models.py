@@ -27,6 +27,10 @@ class PipelineObject(models.Model):
         verbose_name = 'Объект нефтепровода'
         verbose_name_plural = 'Объекты нефтепровода'
         unique_together = ['object_type', 'index']
+        indexes = [
+            # Выборки участка трассы и профили по километровой отметке
+            models.Index(fields=['km_mark'], name='pipelineobject_km_idx'),
+        ]
     
     def __str__(self):
         return f"{self.object_type.name} {self.index} - {self.name}"
@@ -40,6 +44,12 @@ class TagTemplate(models.Model):
         ('string', 'String'),
     ]
     
+    COMPRESSION_MODES = [
+        ('NONE', 'Без сжатия'),
+        ('DEADBAND', 'Зона нечувствительности'),
+        ('SWINGING_DOOR', 'Вращающаяся дверь'),
+    ]
+    
     object_type = models.ForeignKey(ObjectType, on_delete=models.CASCADE, verbose_name='Тип объекта')
     name_template = models.CharField(max_length=100, verbose_name='Шаблон имени тега')
     description_template = models.TextField(verbose_name='Шаблон описания')
@@ -47,6 +57,15 @@ class TagTemplate(models.Model):
     engineering_units = models.CharField(max_length=50, blank=True, verbose_name='Единицы измерения')
     min_value = models.FloatField(default=0.0, verbose_name='Минимальное значение')
     max_value = models.FloatField(default=100.0, verbose_name='Максимальное значение')
+    compression = models.CharField(max_length=15, choices=COMPRESSION_MODES, default='NONE', verbose_name='Сжатие архива')
+    deadband_abs = models.FloatField(default=0.0, verbose_name='Зона нечувствительности (абс.)')
+    deadband_pct = models.FloatField(default=0.0, verbose_name='Зона нечувствительности (% диапазона)')
+    swinging_door_tolerance = models.FloatField(default=0.0, verbose_name='Допуск вращающейся двери')
+    compression_max_seconds = models.FloatField(default=600.0, verbose_name='Максимальный интервал записи (с, 0 — без ограничения)')
+    expression_template = models.TextField(
+        blank=True, verbose_name='Шаблон выражения',
+        help_text='Для вычисляемых тегов, например PRESSURE_OUT_{index} - PRESSURE_IN_{index}',
+    )
     
     class Meta:
         verbose_name = 'Шаблон тега'
@@ -67,6 +86,14 @@ class Tag(models.Model):
     min_value = models.FloatField(default=0.0, verbose_name='Минимальное значение')
     max_value = models.FloatField(default=100.0, verbose_name='Максимальное значение')
     is_archived = models.BooleanField(default=False, verbose_name='В архиве')
+    # Настройки сжатия архива; пустые значения берутся из шаблона при сохранении
+    compression = models.CharField(max_length=15, choices=TagTemplate.COMPRESSION_MODES, blank=True, verbose_name='Сжатие архива')
+    deadband_abs = models.FloatField(null=True, blank=True, verbose_name='Зона нечувствительности (абс.)')
+    deadband_pct = models.FloatField(null=True, blank=True, verbose_name='Зона нечувствительности (% диапазона)')
+    swinging_door_tolerance = models.FloatField(null=True, blank=True, verbose_name='Допуск вращающейся двери')
+    compression_max_seconds = models.FloatField(null=True, blank=True, verbose_name='Максимальный интервал записи (с, 0 — без ограничения)')
+    # Вычисляемый тег: значения рассчитываются по выражению над другими тегами (scada/calculations.py)
+    expression = models.TextField(blank=True, verbose_name='Выражение')
     
     class Meta:
         verbose_name = 'Тег'
@@ -82,6 +109,13 @@ class Tag(models.Model):
             self.data_type = self.tag_template.data_type
         if not self.engineering_units:
             self.engineering_units = self.tag_template.engineering_units
+        if not self.expression:
+            self.expression = self.tag_template.expression_template.replace('{index}', self.pipeline_object.index)
+        if not self.compression:
+            self.compression = self.tag_template.compression
+        for field in ('deadband_abs', 'deadband_pct', 'swinging_door_tolerance', 'compression_max_seconds'):
+            if getattr(self, field) is None:
+                setattr(self, field, getattr(self.tag_template, field))
         
         super().save(*args, **kwargs)
     
@@ -89,8 +123,14 @@ class Tag(models.Model):
         return self.name
 
 class TagValue(models.Model):
-    """Значения тегов нефтепровода"""
-    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='values', verbose_name='Тег')
+    """
+    Значения тегов нефтепровода.
+
+    В PostgreSQL таблица секционирована по timestamp (помесячно),
+    см. scada/partitions.py. Сортировка по умолчанию не задана:
+    запросы истории указывают порядок явно.
+    """
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='values', db_index=False, verbose_name='Тег')
     value = models.FloatField(verbose_name='Значение')
     quality = models.IntegerField(default=100, verbose_name='Качество (0-100)')
     timestamp = models.DateTimeField(default=timezone.now, verbose_name='Временная метка')
@@ -98,11 +138,106 @@ class TagValue(models.Model):
     class Meta:
         verbose_name = 'Значение тега'
         verbose_name_plural = 'Значения тегов'
-        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['tag', '-timestamp'], name='tagvalue_tag_ts_idx'),
+            models.Index(fields=['-timestamp'], name='tagvalue_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.tag.name}: {self.value}"
 
+class TagCurrentValue(models.Model):
+    """Текущее (последнее) значение тега, обновляется при записи значений"""
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True, related_name='current', verbose_name='Тег')
+    value = models.FloatField(verbose_name='Значение')
+    quality = models.IntegerField(default=100, verbose_name='Качество (0-100)')
+    timestamp = models.DateTimeField(verbose_name='Временная метка')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Обновлено')
+    raw_count = models.BigIntegerField(default=0, verbose_name='Принято значений')
+    stored_count = models.BigIntegerField(default=0, verbose_name='Записано в архив')
+    
+    class Meta:
+        verbose_name = 'Текущее значение тега'
+        verbose_name_plural = 'Текущие значения тегов'
+    
+    def __str__(self):
+        return f"{self.tag_id}: {self.value}"
+
+class TagRollup(models.Model):
+    """
+    Агрегаты значений тега за минуту или час (уровни прореживания истории).
+
+    Строятся по значениям архива, то есть уже после сжатия: count — число
+    записанных точек, а не принятых; avg — среднее записанных точек без
+    весов по времени. При сжатии avg смещён к участкам, где сигнал менялся
+    и точки писались чаще; min/max отличаются от исходных не больше допуска
+    сжатия. Для тегов без сжатия (NONE) агрегаты точные.
+    """
+    INTERVALS = [
+        (60, '1 минута'),
+        (3600, '1 час'),
+    ]
+    
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='rollups', db_index=False, verbose_name='Тег')
+    interval = models.PositiveIntegerField(choices=INTERVALS, verbose_name='Интервал (с)')
+    bucket = models.DateTimeField(verbose_name='Начало интервала')
+    min = models.FloatField(verbose_name='Минимум')
+    max = models.FloatField(verbose_name='Максимум')
+    avg = models.FloatField(verbose_name='Среднее')
+    count = models.IntegerField(verbose_name='Количество значений')
+    first = models.FloatField(verbose_name='Первое значение')
+    last = models.FloatField(verbose_name='Последнее значение')
+    
+    class Meta:
+        verbose_name = 'Агрегат значений тега'
+        verbose_name_plural = 'Агрегаты значений тегов'
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'interval', 'bucket'], name='tagrollup_tag_interval_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['interval', 'bucket'], name='tagrollup_interval_bucket_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.tag_id} {self.interval}s {self.bucket}"
+
+class RollupState(models.Model):
+    """До какого момента построены агрегаты данного интервала"""
+    interval = models.PositiveIntegerField(choices=TagRollup.INTERVALS, unique=True, verbose_name='Интервал (с)')
+    built_until = models.DateTimeField(verbose_name='Построено до')
+    
+    class Meta:
+        verbose_name = 'Состояние агрегатов'
+        verbose_name_plural = 'Состояние агрегатов'
+    
+    def __str__(self):
+        return f"{self.interval}s до {self.built_until}"
+
+class RollupDirtyHour(models.Model):
+    """Час, в который записаны значения после построения его агрегатов (опоздавшие, перенос из буфера)"""
+    bucket = models.DateTimeField(unique=True, verbose_name='Начало часа')
+    
+    class Meta:
+        verbose_name = 'Час для пересчёта агрегатов'
+        verbose_name_plural = 'Часы для пересчёта агрегатов'
+    
+    def __str__(self):
+        return f"{self.bucket}"
+
+class IngestBufferCheckpoint(models.Model):
+    """Позиция переноса буфера записи в БД; обновляется в транзакции пакета"""
+    buffer = models.CharField(max_length=32, unique=True, verbose_name='Идентификатор журнала')
+    segment = models.PositiveBigIntegerField(verbose_name='Сегмент')
+    offset = models.PositiveBigIntegerField(verbose_name='Смещение')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+    
+    class Meta:
+        verbose_name = 'Позиция буфера записи'
+        verbose_name_plural = 'Позиции буфера записи'
+    
+    def __str__(self):
+        return f"{self.buffer}: {self.segment}/{self.offset}"
+
 class AlarmDefinition(models.Model):
     """Определения аварий для нефтепровода"""
     CONDITIONS = [
@@ -126,6 +261,14 @@ class AlarmDefinition(models.Model):
     message = models.TextField(verbose_name='Сообщение аварии')
     severity = models.CharField(max_length=10, choices=SEVERITIES, default='MEDIUM', verbose_name='Важность')
     is_enabled = models.BooleanField(default=True, verbose_name='Активна')
+    # Защита от лавины аварий (см. scada/alarms.py)
+    deadband = models.FloatField(default=0.0, verbose_name='Гистерезис сброса')
+    on_delay = models.FloatField(default=0.0, verbose_name='Задержка срабатывания (с)')
+    off_delay = models.FloatField(default=0.0, verbose_name='Задержка сброса (с)')
+    chatter_count = models.PositiveIntegerField(default=0, verbose_name='Срабатываний для дребезга (0 — выкл.)')
+    chatter_window = models.FloatField(default=60.0, verbose_name='Окно дребезга (с)')
+    shelve_duration = models.FloatField(default=600.0, verbose_name='Отключение при дребезге (с)')
+    shelved_until = models.DateTimeField(null=True, blank=True, verbose_name='Отключена до')
     
     class Meta:
         verbose_name = 'Определение аварии'
@@ -153,6 +296,98 @@ class Alarm(models.Model):
         verbose_name = 'Авария'
         verbose_name_plural = 'Аварии'
         ordering = ['-triggered_at']
+        indexes = [
+            models.Index(fields=['-triggered_at', '-id'], name='alarm_triggered_idx'),
+            # Открытых аварий мало по сравнению с историей: частичный индекс только по ним
+            models.Index(fields=['state'], name='alarm_open_state_idx',
+                         condition=models.Q(state__in=['ACTIVE', 'ACKNOWLEDGED'])),
+        ]
+        constraints = [
+            # Не больше одной открытой аварии на определение (при записи из нескольких процессов)
+            models.UniqueConstraint(fields=['alarm_definition'], name='alarm_one_open_idx',
+                                    condition=models.Q(state__in=['ACTIVE', 'ACKNOWLEDGED'])),
+        ]
+    
+    def __str__(self):
+        return f"{self.alarm_definition.name} - {self.state}"
+
+class AlarmEvent(models.Model):
+    """Переход состояния аварии; id служит порядковым номером в потоке изменений"""
+    TRANSITIONS = [
+        ('RAISED', 'Возникла'),
+        ('ACKNOWLEDGED', 'Квитирована'),
+        ('RESOLVED', 'Сброшена'),
+    ]
+    
+    alarm = models.ForeignKey(Alarm, on_delete=models.CASCADE, related_name='events', verbose_name='Авария')
+    transition = models.CharField(max_length=15, choices=TRANSITIONS, verbose_name='Переход')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Время')
+    
+    class Meta:
+        verbose_name = 'Событие аварии'
+        verbose_name_plural = 'События аварий'
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"#{self.id} {self.alarm_id} {self.transition}"
+
+class ModbusDevice(models.Model):
+    """Устройство Modbus TCP (контроллер, шлюз), опрашиваемое службой сбора данных"""
+    name = models.CharField(max_length=100, unique=True, verbose_name='Название')
+    host = models.CharField(max_length=255, verbose_name='Адрес')
+    port = models.PositiveIntegerField(default=502, verbose_name='Порт')
+    unit_id = models.PositiveSmallIntegerField(default=1, verbose_name='Адрес ведомого (Unit ID)')
+    connections = models.PositiveSmallIntegerField(default=2, verbose_name='Соединений в пуле')
+    timeout = models.FloatField(default=1.0, verbose_name='Таймаут ответа (с)')
+    is_enabled = models.BooleanField(default=True, verbose_name='Опрашивается')
+    
+    class Meta:
+        verbose_name = 'Устройство Modbus'
+        verbose_name_plural = 'Устройства Modbus'
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} ({self.host}:{self.port}/{self.unit_id})"
+
+class ModbusPoint(models.Model):
+    """Привязка тега к регистрам устройства Modbus и классу опроса"""
+    REGISTER_TYPES = [
+        ('HOLDING', 'Holding (03)'),
+        ('INPUT', 'Input (04)'),
+        ('COIL', 'Coil (01)'),
+        ('DISCRETE', 'Discrete input (02)'),
+    ]
+    
+    DATA_TYPES = [
+        ('INT16', 'INT16'),
+        ('UINT16', 'UINT16'),
+        ('INT32', 'INT32'),
+        ('UINT32', 'UINT32'),
+        ('FLOAT32', 'FLOAT32'),
+        ('BOOL', 'BOOL'),
+    ]
+    
+    SCAN_CLASSES = [
+        (100, '100 мс'),
+        (1000, '1 с'),
+        (10000, '10 с'),
+    ]
+    
+    device = models.ForeignKey(ModbusDevice, on_delete=models.CASCADE, related_name='points', verbose_name='Устройство')
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, related_name='modbus_point', verbose_name='Тег')
+    register_type = models.CharField(max_length=10, choices=REGISTER_TYPES, default='HOLDING', verbose_name='Тип регистра')
+    address = models.PositiveIntegerField(verbose_name='Адрес регистра')
+    data_type = models.CharField(max_length=10, choices=DATA_TYPES, default='FLOAT32', verbose_name='Тип данных')
+    word_swap = models.BooleanField(default=False, verbose_name='Младшее слово первым')
+    scale = models.FloatField(default=1.0, verbose_name='Множитель')
+    offset = models.FloatField(default=0.0, verbose_name='Смещение')
+    scan_class = models.PositiveIntegerField(choices=SCAN_CLASSES, default=1000, verbose_name='Класс опроса (мс)')
+    is_enabled = models.BooleanField(default=True, verbose_name='Опрашивается')
+    
+    class Meta:
+        verbose_name = 'Точка Modbus'
+        verbose_name_plural = 'Точки Modbus'
+        ordering = ['device', 'register_type', 'address']
     
     def __str__(self):
-        return f"{self.alarm_definition.name} - {self.state}"
\ No newline at end of file
+        return f"{self.device.name} {self.register_type}:{self.address} -> {self.tag_id}"
@@ -0,0 +1,147 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация по (ordering_field, id) в порядке убывания.
+
+    Страница выбирается условием (поле, id) < (курсор), а не OFFSET, поэтому
+    время ответа не зависит от глубины страницы. Условие записано как
+    поле <= значение AND (поле < значение OR поле = значение AND id < pk):
+    первая часть избыточна, но только её планировщик превращает в границу
+    диапазона индекса (тег, время) — OR индексом не ограничивается. Общее число записей по
+    умолчанию не считается; ?count=approx добавляет оценку из плана запроса
+    PostgreSQL (на других СУБД — точный COUNT).
+    """
+    ordering_field = None
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.count = self.estimate_count(queryset)
+
+        position, reverse = self.decode_cursor(request)
+        queryset = self.cursor_queryset(queryset, position, reverse)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.first_item = results[0] if results else None
+        self.last_item = results[-1] if results else None
+        return results
+
+    def cursor_queryset(self, queryset, position, reverse):
+        """Запрос страницы после (reverse — до) позиции курсора (значение поля, id)"""
+        field = self.ordering_field
+        if position is None:
+            return queryset.order_by(f'-{field}', '-id')
+        value, pk = position
+        if reverse:
+            return queryset.filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk}), **{f'{field}__gte': value}
+            ).order_by(field, 'id')
+        return queryset.filter(
+            Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}), **{f'{field}__lte': value}
+        ).order_by(f'-{field}', '-id')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            value, pk, reverse = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            moment = parse_datetime(value)
+            if moment is None:
+                raise ValueError(value)
+            return (moment, int(pk)), bool(reverse)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse):
+        value = getattr(item, self.ordering_field).isoformat()
+        raw = json.dumps([value, item.pk, int(reverse)]).encode('ascii')
+        cursor = base64.urlsafe_b64encode(raw).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.has_next or self.last_item is None:
+            return None
+        return self.encode_cursor(self.last_item, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first_item is None:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.first_item, reverse=True)
+
+    def estimate_count(self, queryset):
+        if connection.vendor != 'postgresql':
+            return queryset.count()
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def get_paginated_response(self, data):
+        fields = [('next', self.get_next_link()), ('previous', self.get_previous_link())]
+        if self.count is not None:
+            fields.append(('count', self.count))
+        fields.append(('results', data))
+        return Response(OrderedDict(fields))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer', 'description': 'Оценка числа записей (только с ?count=approx)'},
+                'results': schema,
+            },
+        }
+
+
+class TagValuePagination(KeysetPagination):
+    ordering_field = 'timestamp'
+
+
+class AlarmPagination(KeysetPagination):
+    ordering_field = 'triggered_at'
@@ -0,0 +1,187 @@
+"""
+Обслуживание помесячных секций таблицы истории scada_tagvalue (PostgreSQL).
+
+Родительская таблица секционирована по RANGE (timestamp), секции называются
+scada_tagvalue_pYYYY_MM; значения вне созданных секций попадают в
+scada_tagvalue_default. На SQLite таблица обычная, и удаление старой истории
+выполняется DELETE.
+"""
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import TagValue
+
+PARENT_TABLE = TagValue._meta.db_table
+DEFAULT_PARTITION = f'{PARENT_TABLE}_default'
+PARTITION_RE = re.compile(rf'^{PARENT_TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(moment):
+    """Начало месяца (UTC) для указанного момента"""
+    moment = moment.astimezone(dt_timezone.utc) if timezone.is_aware(moment) else moment
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(moment, months):
+    month_index = moment.month - 1 + months
+    return moment.replace(year=moment.year + month_index // 12, month=month_index % 12 + 1)
+
+
+def partition_name(start):
+    return f'{PARENT_TABLE}_p{start.year:04d}_{start.month:02d}'
+
+
+def is_partitioned():
+    """Секционирована ли таблица истории в текущей БД"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [PARENT_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """Возвращает отсортированный список (начало месяца, имя секции)"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s AND pg_table_is_visible(p.oid)",
+            [PARENT_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            start = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)
+            partitions.append((start, name))
+    return sorted(partitions)
+
+
+def _create_partition(cursor, start):
+    """
+    Создаёт секцию за месяц. Если в секции по умолчанию уже есть строки
+    этого месяца, они переносятся в новую секцию.
+    """
+    end = add_months(start, 1)
+    name = partition_name(start)
+    qn = connection.ops.quote_name
+
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {qn(DEFAULT_PARTITION)} "
+        f"WHERE timestamp >= %s AND timestamp < %s)",
+        [start, end],
+    )
+    has_default_rows = cursor.fetchone()[0]
+
+    if not has_default_rows:
+        cursor.execute(
+            f"CREATE TABLE {qn(name)} PARTITION OF {qn(PARENT_TABLE)} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+        return
+
+    cursor.execute(f"ALTER TABLE {qn(PARENT_TABLE)} DETACH PARTITION {qn(DEFAULT_PARTITION)}")
+    cursor.execute(
+        f"CREATE TABLE {qn(name)} PARTITION OF {qn(PARENT_TABLE)} "
+        f"FOR VALUES FROM (%s) TO (%s)",
+        [start, end],
+    )
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {qn(DEFAULT_PARTITION)} "
+        f"WHERE timestamp >= %s AND timestamp < %s RETURNING *) "
+        f"INSERT INTO {qn(name)} SELECT * FROM moved",
+        [start, end],
+    )
+    cursor.execute(f"ALTER TABLE {qn(PARENT_TABLE)} ATTACH PARTITION {qn(DEFAULT_PARTITION)} DEFAULT")
+
+
+def ensure_partitions(months_ahead=None, now=None):
+    """
+    Создаёт недостающие секции от текущего месяца на months_ahead месяцев вперёд.
+    Возвращает имена созданных секций.
+    """
+    if not is_partitioned():
+        return []
+    if months_ahead is None:
+        months_ahead = settings.TAGVALUE_PARTITION_MONTHS_AHEAD
+
+    existing = {name for _, name in list_partitions()}
+    current = month_start(now or timezone.now())
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(months_ahead + 1):
+            start = add_months(current, offset)
+            if partition_name(start) not in existing:
+                _create_partition(cursor, start)
+                created.append(partition_name(start))
+    return created
+
+
+def drop_partitions_before(cutoff, detach_only=False):
+    """
+    Отсоединяет (и, если не detach_only, удаляет) секции, целиком лежащие
+    до cutoff. Это операция над метаданными, а не многочасовой DELETE.
+    Возвращает имена затронутых секций.
+    """
+    if not is_partitioned():
+        return []
+
+    qn = connection.ops.quote_name
+    removed = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start, name in list_partitions():
+            if add_months(start, 1) > cutoff:
+                break
+            cursor.execute(f"ALTER TABLE {qn(PARENT_TABLE)} DETACH PARTITION {qn(name)}")
+            if not detach_only:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+            removed.append(name)
+    return removed
+
+
+def delete_before(model, field, cutoff, **filters):
+    """
+    Удаляет строки model с field < cutoff одним DELETE по границе, без
+    выборки строк, сигналов и каскада (на таблицы истории и агрегатов нет
+    внешних ключей). filters — дополнительные условия равенства по полям.
+    Возвращает число удалённых строк.
+    """
+    qn = connection.ops.quote_name
+    column = model._meta.get_field(field).column
+    conditions = [f'{qn(column)} < %s']
+    params = [connection.ops.adapt_datetimefield_value(cutoff)]
+    for name, value in filters.items():
+        conditions.append(f'{qn(model._meta.get_field(name).column)} = %s')
+        params.append(value)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {qn(model._meta.db_table)} WHERE {' AND '.join(conditions)}", params)
+        return cursor.rowcount
+
+
+def apply_retention(days=None, now=None, detach_only=False):
+    """
+    Удаляет историю старше days (по умолчанию TAGVALUE_RETENTION_DAYS).
+    Без секционирования строки удаляются DELETE.
+    Возвращает кортеж (удалённые секции, число удалённых строк).
+    """
+    if days is None:
+        days = settings.TAGVALUE_RETENTION_DAYS
+    if not days:
+        return [], 0
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    if is_partitioned():
+        return drop_partitions_before(cutoff, detach_only=detach_only), 0
+    return [], delete_before(TagValue, 'timestamp', cutoff)
@@ -0,0 +1,146 @@
+from django.db import transaction
+
+from .cache import bump_config_version
+from .models import PipelineObject, Tag, TagTemplate
+
+# Поля тега, которые выводятся из шаблона и синхронизируются при повторном запуске
+SYNC_FIELDS = ('name', 'description', 'data_type', 'engineering_units', 'min_value', 'max_value', 'expression')
+BATCH_SIZE = 2000
+
+
+class ProvisioningError(Exception):
+    """Развёртывание шаблонов невозможно (например, конфликт имён тегов)"""
+
+
+def render(template, pipeline_object):
+    return template.replace('{index}', pipeline_object.index)
+
+
+def template_base_name(template):
+    """Имя шаблона без подстановки индекса: PRESSURE_OUT_{index} -> PRESSURE_OUT"""
+    return template.replace('{index}', '').strip('_-. ')
+
+
+def expand_templates(templates, objects):
+    """
+    Раскрывает шаблоны × объекты их типа в памяти.
+    Возвращает словарь (template_id, object_id) -> значения SYNC_FIELDS.
+    """
+    by_type = {}
+    for template in templates:
+        by_type.setdefault(template.object_type_id, []).append(template)
+
+    desired = {}
+    for pipeline_object in objects:
+        for template in by_type.get(pipeline_object.object_type_id, ()):
+            desired[(template.pk, pipeline_object.pk)] = {
+                'name': render(template.name_template, pipeline_object),
+                'description': render(template.description_template, pipeline_object),
+                'data_type': template.data_type,
+                'engineering_units': template.engineering_units,
+                'min_value': template.min_value,
+                'max_value': template.max_value,
+                'expression': render(template.expression_template, pipeline_object),
+            }
+    return desired
+
+
+def _check_names(desired, existing):
+    """Новые имена не должны совпадать между собой и с именами других тегов"""
+    owners = {}
+    for key, fields in desired.items():
+        other = owners.setdefault(fields['name'], key)
+        if other != key:
+            raise ProvisioningError(f"Шаблоны дают одинаковое имя тега {fields['name']}")
+
+    renamed = {
+        fields['name'] for key, fields in desired.items()
+        if key not in existing or existing[key].name != fields['name']
+    }
+    if not renamed:
+        return
+    taken = Tag.objects.filter(name__in=renamed).values_list('name', 'tag_template_id', 'pipeline_object_id')
+    conflicts = sorted(name for name, template_id, object_id in taken if owners[name] != (template_id, object_id))
+    if conflicts:
+        raise ProvisioningError(f"Имена уже заняты другими тегами: {', '.join(conflicts[:10])}")
+
+
+def provision_tags(object_types=None, archive_missing=True, dry_run=False):
+    """
+    Приводит теги в соответствие шаблонам: для каждой пары (шаблон, объект
+    того же типа) должен существовать неархивный тег.
+
+    Шаблоны, объекты и существующие теги читаются тремя запросами, разница
+    вычисляется в памяти и применяется bulk_create/bulk_update в одной
+    транзакции. Теги без пары (шаблон, объект) архивируются, если
+    archive_missing. object_types — ограничить развёртывание id типов объектов.
+    Возвращает словарь с числом созданных, обновлённых, архивированных,
+    восстановленных и неизменных тегов.
+    """
+    templates = TagTemplate.objects.all()
+    objects = PipelineObject.objects.only('id', 'object_type_id', 'index')
+    tags = Tag.objects.only('id', 'tag_template_id', 'pipeline_object_id', 'is_archived', *SYNC_FIELDS)
+    if object_types is not None:
+        templates = templates.filter(object_type_id__in=object_types)
+        objects = objects.filter(object_type_id__in=object_types)
+        tags = tags.filter(pipeline_object__object_type_id__in=object_types)
+
+    templates = list(templates)
+    desired = expand_templates(templates, objects)
+    existing = {(tag.tag_template_id, tag.pipeline_object_id): tag for tag in tags}
+    _check_names(desired, existing)
+
+    templates_by_id = {template.pk: template for template in templates}
+    to_create, to_update, to_archive = [], [], []
+    restored = unchanged = 0
+    for key, fields in desired.items():
+        tag = existing.get(key)
+        if tag is None:
+            template = templates_by_id[key[0]]
+            to_create.append(Tag(
+                tag_template_id=key[0],
+                pipeline_object_id=key[1],
+                compression=template.compression,
+                deadband_abs=template.deadband_abs,
+                deadband_pct=template.deadband_pct,
+                swinging_door_tolerance=template.swinging_door_tolerance,
+                compression_max_seconds=template.compression_max_seconds,
+                **fields,
+            ))
+            continue
+        changed = tag.is_archived
+        if tag.is_archived:
+            tag.is_archived = False
+            restored += 1
+        for field, value in fields.items():
+            if getattr(tag, field) != value:
+                setattr(tag, field, value)
+                changed = True
+        if changed:
+            to_update.append(tag)
+        else:
+            unchanged += 1
+
+    if archive_missing:
+        for key, tag in existing.items():
+            if key not in desired and not tag.is_archived:
+                tag.is_archived = True
+                to_archive.append(tag)
+
+    result = {
+        'created': len(to_create),
+        'updated': len(to_update) - restored,
+        'restored': restored,
+        'archived': len(to_archive),
+        'unchanged': unchanged,
+    }
+    if dry_run or not (to_create or to_update or to_archive):
+        return result
+
+    with transaction.atomic():
+        Tag.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        Tag.objects.bulk_update(to_update, ['is_archived', *SYNC_FIELDS], batch_size=BATCH_SIZE)
+        Tag.objects.bulk_update(to_archive, ['is_archived'], batch_size=BATCH_SIZE)
+        # bulk-операции не отправляют post_save, поэтому версии сбрасываются явно
+        transaction.on_commit(bump_config_version)
+    return result
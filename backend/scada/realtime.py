@@ -0,0 +1,58 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+# Группы channel layer: значения конкретного тега, общий поток всех тегов
+# и поток изменений аварий
+ALL_TAGS_GROUP = 'tags.all'
+ALARMS_GROUP = 'alarms'
+
+
+def tag_group(tag_id):
+    return f'tags.{tag_id}'
+
+
+def tag_value_payload(tag_value):
+    return {
+        'tag_id': tag_value.tag_id,
+        'value': tag_value.value,
+        'quality': tag_value.quality,
+        'timestamp': tag_value.timestamp.isoformat(),
+    }
+
+
+async def _send_all(layer, messages):
+    for group, message in messages:
+        await layer.group_send(group, message)
+
+
+def publish_tag_values(values):
+    """
+    Публикует последнее значение каждого тега пакета в его группу один раз,
+    а весь пакет — одним сообщением в группу подписчиков на все теги.
+    Рассылкой по сокетам занимается channel layer.
+    """
+    layer = get_channel_layer()
+    if layer is None or not values:
+        return
+
+    latest = {}
+    for tag_value in values:
+        known = latest.get(tag_value.tag_id)
+        if known is None or tag_value.timestamp >= known.timestamp:
+            latest[tag_value.tag_id] = tag_value
+
+    payloads = [tag_value_payload(tag_value) for tag_value in latest.values()]
+    messages = [
+        (tag_group(payload['tag_id']), {'type': 'tag.values', 'values': [payload]})
+        for payload in payloads
+    ]
+    messages.append((ALL_TAGS_GROUP, {'type': 'tag.values', 'values': payloads}))
+    async_to_sync(_send_all)(layer, messages)
+
+
+def publish_alarm_events(events):
+    """Публикует пакет переходов аварий одним сообщением группы"""
+    layer = get_channel_layer()
+    if layer is None or not events:
+        return
+    async_to_sync(layer.group_send)(ALARMS_GROUP, {'type': 'alarm.events', 'events': events})
@@ -0,0 +1,58 @@
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .serialization import dumps_json, dumps_msgpack, loads_json, loads_msgpack
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson: тот же формат ответа (даты ISO 8601 с Z, отступ
+    по параметру indent в Accept), кодирование в разы быстрее json.dumps.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        try:
+            return dumps_json(data, indent=bool(indent))
+        except orjson.JSONEncodeError:
+            # Например, целое вне 64 бит — стандартный кодировщик справится
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Ответ в MessagePack (Accept: application/msgpack или ?format=msgpack)"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps_msgpack(data)
+
+
+class ORJSONParser(JSONParser):
+    """Разбор тела JSON через orjson"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads_json(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackParser(BaseParser):
+    """Тело запроса в MessagePack (Content-Type: application/msgpack)"""
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads_msgpack(stream.read())
+        except (ValueError, TypeError) as exc:
+            raise ParseError(f'MessagePack parse error - {str(exc) or type(exc).__name__}')
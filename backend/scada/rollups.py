@@ -0,0 +1,181 @@
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import RollupDirtyHour, RollupState, TagRollup, TagValue
+from .partitions import delete_before
+
+MINUTE = 60
+HOUR = 3600
+# Уровни от грубого к точному
+TIERS = (HOUR, MINUTE)
+INSERT_BATCH_SIZE = 5000
+
+logger = logging.getLogger('scada.rollups')
+
+
+def align_down(moment, interval):
+    epoch = moment.timestamp()
+    return datetime.fromtimestamp(epoch - epoch % interval, tz=dt_timezone.utc)
+
+
+def align_up(moment, interval):
+    aligned = align_down(moment, interval)
+    return aligned if aligned == moment else aligned + timedelta(seconds=interval)
+
+
+def built_until():
+    """Словарь интервал -> момент, до которого построены агрегаты"""
+    return dict(RollupState.objects.values_list('interval', 'built_until'))
+
+
+def select_tier(width_seconds):
+    """Самый грубый уровень агрегатов, не превышающий ширину корзины запроса"""
+    for interval in TIERS:
+        if interval <= width_seconds:
+            return interval
+    return None
+
+
+def compute_rollups(interval, start, end):
+    """
+    Пересчитывает агрегаты интервала interval в [start, end) и сохраняет их
+    (upsert). Минутные агрегаты строятся по сырым значениям, часовые — по
+    минутным. Возвращает число записанных строк.
+    """
+    from .trends import bucket_aggregates
+
+    source = None if interval == MINUTE else MINUTE
+    aggregates = bucket_aggregates(None, start, end, start.timestamp(), interval, source)
+    rollups = [
+        TagRollup(
+            tag_id=tag_id,
+            interval=interval,
+            bucket=start + timedelta(seconds=index * interval),
+            min=row['min'],
+            max=row['max'],
+            avg=row['total'] / row['count'],
+            count=row['count'],
+            first=row['first'],
+            last=row['last'],
+        )
+        for (tag_id, index), row in aggregates.items()
+    ]
+    TagRollup.objects.bulk_create(
+        rollups,
+        batch_size=INSERT_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['tag', 'interval', 'bucket'],
+        update_fields=['min', 'max', 'avg', 'count', 'first', 'last'],
+    )
+    return len(rollups)
+
+
+def build_rollups(interval, now=None):
+    """
+    Инкрементально достраивает агрегаты интервала interval.
+
+    Обрабатывается диапазон от отметки RollupState (минус ROLLUP_RECOMPUTE_SECONDS
+    для опоздавших значений) до now - ROLLUP_DELAY_SECONDS, частями по
+    ROLLUP_CHUNK_INTERVALS интервалов. Часовые агрегаты не строятся дальше
+    минутных. Минутный проход затем пересчитывает часы со значениями,
+    записанными позже (см. mark_dirty_hours). Возвращает число записанных строк.
+    """
+    now = now or timezone.now()
+    end = align_down(now - timedelta(seconds=settings.ROLLUP_DELAY_SECONDS), interval)
+    if interval != MINUTE:
+        minute_until = built_until().get(MINUTE)
+        if minute_until is None:
+            return 0
+        end = min(end, align_down(minute_until, interval))
+
+    state = RollupState.objects.filter(interval=interval).first()
+    if state:
+        start = align_down(state.built_until - timedelta(seconds=settings.ROLLUP_RECOMPUTE_SECONDS), interval)
+    else:
+        if interval == MINUTE:
+            first = TagValue.objects.aggregate(first=Min('timestamp'))['first']
+        else:
+            first = TagRollup.objects.filter(interval=MINUTE).aggregate(first=Min('bucket'))['first']
+        if first is None:
+            return 0
+        start = align_down(first, interval)
+
+    written = 0
+    chunk = timedelta(seconds=interval * settings.ROLLUP_CHUNK_INTERVALS)
+    while start < end:
+        chunk_end = min(start + chunk, end)
+        with transaction.atomic():
+            written += compute_rollups(interval, start, chunk_end)
+            RollupState.objects.update_or_create(interval=interval, defaults={'built_until': chunk_end})
+        start = chunk_end
+    if interval == MINUTE:
+        written += rebuild_dirty_hours()
+    return written
+
+
+def mark_dirty_hours(values, now=None):
+    """
+    Отмечает для пересчёта часы значений старше ROLLUP_DELAY_SECONDS: их
+    агрегаты могли быть уже построены, а окно ROLLUP_RECOMPUTE_SECONDS
+    покрывает только недавнее прошлое (перенос из буфера записи, отставание
+    сбора, дозаполнение истории, опоздавшие пакеты REST). Значения реального
+    времени запросов не добавляют.
+    """
+    now = now or timezone.now()
+    threshold = now - timedelta(seconds=settings.ROLLUP_DELAY_SECONDS)
+    hours = {align_down(tv.timestamp, HOUR) for tv in values if tv.timestamp < threshold}
+    if hours:
+        RollupDirtyHour.objects.bulk_create(
+            [RollupDirtyHour(bucket=bucket) for bucket in sorted(hours)], ignore_conflicts=True,
+        )
+
+
+def rebuild_dirty_hours():
+    """
+    Пересчитывает минутные и часовые агрегаты отмеченных часов (не больше
+    ROLLUP_DIRTY_HOURS_PER_RUN за вызов, от старых к новым). Часы, которые
+    ещё не построены инкрементально, остаются построению по отметке:
+    их пересчёт здесь был бы преждевременным. Часы старше срока хранения
+    сырых значений (TAGVALUE_RETENTION_DAYS) не пересчитываются: их значения
+    уже удалены, и агрегаты по остатку заменили бы полные. Возвращает число
+    записанных строк.
+    """
+    days = settings.TAGVALUE_RETENTION_DAYS
+    if days:
+        expired, _ = RollupDirtyHour.objects.filter(bucket__lt=timezone.now() - timedelta(days=days)).delete()
+        if expired:
+            logger.warning('Часов вне срока хранения сырых значений не пересчитано: %d', expired)
+    built = built_until()
+    minute_until, hour_until = built.get(MINUTE), built.get(HOUR)
+    if minute_until is None:
+        return 0
+    written = 0
+    hours = RollupDirtyHour.objects.filter(bucket__lt=minute_until).order_by('bucket')
+    for dirty in hours[:settings.ROLLUP_DIRTY_HOURS_PER_RUN]:
+        start = dirty.bucket
+        end = start + timedelta(seconds=HOUR)
+        with transaction.atomic():
+            written += compute_rollups(MINUTE, start, min(end, align_down(minute_until, MINUTE)))
+            if hour_until is not None and end <= hour_until:
+                written += compute_rollups(HOUR, start, end)
+            dirty.delete()
+    return written
+
+
+def apply_rollup_retention(now=None):
+    """Удаляет агрегаты старше срока хранения своего уровня (0 — бессрочно)"""
+    now = now or timezone.now()
+    retention = {
+        MINUTE: settings.ROLLUP_1M_RETENTION_DAYS,
+        HOUR: settings.ROLLUP_1H_RETENTION_DAYS,
+    }
+    deleted = 0
+    for interval, days in retention.items():
+        if days:
+            deleted += delete_before(TagRollup, 'bucket', now - timedelta(days=days), interval=interval)
+    return deleted
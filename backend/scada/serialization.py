@@ -0,0 +1,36 @@
+import msgpack
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+
+MSGPACK = 'msgpack'
+JSON = 'json'
+
+# Типы, которые orjson/msgpack не кодируют сами (Decimal, timedelta, ленивые
+# строки, QuerySet, numpy), приводятся так же, как в JSONRenderer DRF
+_fallback = JSONEncoder().default
+
+_ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _msgpack_default(obj):
+    # msgpack не знает datetime: метки времени — те же ISO-строки, что в JSON
+    return _fallback(obj)
+
+
+def dumps_json(data, indent=False):
+    """JSON в байтах через orjson; даты — ISO 8601 с суффиксом Z, как у DRF"""
+    options = _ORJSON_OPTIONS | orjson.OPT_INDENT_2 if indent else _ORJSON_OPTIONS
+    return orjson.dumps(data, default=_fallback, option=options)
+
+
+def loads_json(data):
+    return orjson.loads(data)
+
+
+def dumps_msgpack(data):
+    """MessagePack: та же структура, что в JSON"""
+    return msgpack.packb(data, default=_msgpack_default, use_bin_type=True, datetime=False)
+
+
+def loads_msgpack(data):
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
@@ -1,6 +1,12 @@
+from datetime import timedelta
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import ObjectType, PipelineObject, TagTemplate, Tag, TagValue, AlarmDefinition, Alarm
+from django.utils import timezone
+from .calculations import ExpressionError, calculations, check_graph, compile_expression
+from .modbus import BIT_TYPES, WIDTHS
+from .provisioning import template_base_name
+from .models import ObjectType, PipelineObject, TagTemplate, Tag, TagValue, AlarmDefinition, Alarm, ModbusDevice, ModbusPoint
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -39,12 +45,22 @@ class TagSerializer(serializers.ModelSerializer):
         fields = '__all__'
     
     def get_current_value(self, obj):
-        latest_value = obj.values.first()
-        return latest_value.value if latest_value else 0.0
+        current = getattr(obj, 'current', None)
+        return current.value if current else 0.0
     
     def get_current_quality(self, obj):
-        latest_value = obj.values.first()
-        return latest_value.quality if latest_value else 0
+        current = getattr(obj, 'current', None)
+        return current.quality if current else 0
+
+    def validate_expression(self, value):
+        if not value.strip():
+            return ''
+        try:
+            _, inputs = compile_expression(value)
+            check_graph(self.instance.pk if self.instance else None, inputs, calculations.graph())
+        except ExpressionError as exc:
+            raise serializers.ValidationError(str(exc))
+        return value.strip()
 
 class TagValueSerializer(serializers.ModelSerializer):
     tag_name = serializers.CharField(source='tag.name', read_only=True)
@@ -53,6 +69,23 @@ class TagValueSerializer(serializers.ModelSerializer):
         model = TagValue
         fields = '__all__'
 
+    def validate_tag(self, value):
+        if value.expression:
+            raise serializers.ValidationError("Тег вычисляемый, значения не принимаются")
+        return value
+
+class TagValueCreateSerializer(TagValueSerializer):
+    """
+    POST /api/tag-values/: значение проходит путь пакета (сжатие, буфер
+    записи) и пишется в архив пакетной вставкой, поэтому id строки архива в
+    ответе нет; stored — записано ли значение в архив после сжатия.
+    """
+    stored = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = TagValue
+        fields = ['tag', 'tag_name', 'value', 'quality', 'timestamp', 'stored']
+
 class AlarmDefinitionSerializer(serializers.ModelSerializer):
     tag_name = serializers.CharField(source='tag.name', read_only=True)
     
@@ -69,10 +102,137 @@ class AlarmSerializer(serializers.ModelSerializer):
         model = Alarm
         fields = '__all__'
 
+class ModbusDeviceSerializer(serializers.ModelSerializer):
+    point_count = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = ModbusDevice
+        fields = '__all__'
+
+class ModbusPointSerializer(serializers.ModelSerializer):
+    tag_name = serializers.CharField(source='tag.name', read_only=True)
+    device_name = serializers.CharField(source='device.name', read_only=True)
+    
+    class Meta:
+        model = ModbusPoint
+        fields = '__all__'
+
+    def validate(self, attrs):
+        register_type = attrs.get('register_type', getattr(self.instance, 'register_type', 'HOLDING'))
+        data_type = attrs.get('data_type', getattr(self.instance, 'data_type', 'FLOAT32'))
+        address = attrs.get('address', getattr(self.instance, 'address', 0))
+        if (register_type in BIT_TYPES) != (data_type == 'BOOL'):
+            raise serializers.ValidationError('Тип BOOL допустим только для coils и discrete inputs и обязателен для них')
+        if address + WIDTHS[data_type] > 65536:
+            raise serializers.ValidationError('Значение выходит за пределы адресного пространства (65536)')
+        return attrs
+
 class AlarmAcknowledgeSerializer(serializers.Serializer):
     acknowledged_by = serializers.IntegerField()
 
     def validate_acknowledged_by(self, value):
         if not User.objects.filter(id=value).exists():
             raise serializers.ValidationError("User does not exist")
-        return value
\ No newline at end of file
+        return value
+
+class AlarmShelveSerializer(serializers.Serializer):
+    duration = serializers.FloatField(min_value=1, required=False, help_text='Секунды; по умолчанию shelve_duration')
+
+class AlarmBulkAcknowledgeSerializer(AlarmAcknowledgeSerializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, max_length=settings.ALARM_BULK_ACK_MAX
+    )
+    all_active = serializers.BooleanField(default=False)
+    severity = serializers.ChoiceField(choices=AlarmDefinition.SEVERITIES, required=False)
+
+    def validate(self, attrs):
+        if not attrs.get('ids') and not attrs['all_active']:
+            raise serializers.ValidationError("Укажите ids или all_active")
+        return attrs
+
+class ProvisionSerializer(serializers.Serializer):
+    object_types = serializers.ListField(child=serializers.IntegerField(), required=False, allow_null=True, default=None)
+    archive_missing = serializers.BooleanField(default=True)
+    dry_run = serializers.BooleanField(default=False)
+
+class TagRangeQuerySerializer(serializers.Serializer):
+    """Параметры запроса истории: список тегов и интервал (по умолчанию последние сутки)"""
+    max_tags_setting = 'TREND_MAX_TAGS'
+
+    tag_id = serializers.CharField()
+    start_time = serializers.DateTimeField(required=False)
+    end_time = serializers.DateTimeField(required=False)
+
+    def validate_tag_id(self, value):
+        try:
+            tag_ids = sorted({int(part) for part in value.split(',') if part.strip()})
+        except ValueError:
+            raise serializers.ValidationError("Ожидается список id тегов через запятую")
+        if not tag_ids:
+            raise serializers.ValidationError("Не указаны теги")
+        max_tags = getattr(settings, self.max_tags_setting)
+        if len(tag_ids) > max_tags:
+            raise serializers.ValidationError(f"Не более {max_tags} тегов за запрос")
+        return tag_ids
+
+    def validate(self, attrs):
+        end_time = attrs.get('end_time') or timezone.now()
+        start_time = attrs.get('start_time') or end_time - timedelta(days=1)
+        if start_time >= end_time:
+            raise serializers.ValidationError("start_time должно быть раньше end_time")
+        attrs['start_time'] = start_time
+        attrs['end_time'] = end_time
+        return attrs
+
+class TrendQuerySerializer(TagRangeQuerySerializer):
+    MODES = [('aggregate', 'Агрегаты по корзинам'), ('lttb', 'LTTB')]
+
+    buckets = serializers.IntegerField(min_value=1, max_value=settings.TREND_MAX_BUCKETS, default=500)
+    mode = serializers.ChoiceField(choices=MODES, default='aggregate')
+
+class AlignedQuerySerializer(TagRangeQuerySerializer):
+    FILLS = [('previous', 'Предыдущее значение'), ('linear', 'Линейная интерполяция')]
+
+    step = serializers.FloatField(min_value=0.001, default=60.0)
+    fill = serializers.ChoiceField(choices=FILLS, default='previous')
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        points = (attrs['end_time'] - attrs['start_time']).total_seconds() / attrs['step']
+        if points > settings.TREND_MAX_BUCKETS:
+            raise serializers.ValidationError(
+                f"Не более {settings.TREND_MAX_BUCKETS} точек сетки: увеличьте step или сократите интервал"
+            )
+        return attrs
+
+class ExportQuerySerializer(TagRangeQuerySerializer):
+    OUTPUTS = [('csv', 'CSV'), ('npz', 'NumPy .npz')]
+    max_tags_setting = 'EXPORT_MAX_TAGS'
+
+    output = serializers.ChoiceField(choices=OUTPUTS, default='csv')
+
+class KmRangeQuerySerializer(serializers.Serializer):
+    """Участок трассы по километровой отметке (границы включительно)"""
+    km_min = serializers.FloatField(required=False)
+    km_max = serializers.FloatField(required=False)
+
+    def validate(self, attrs):
+        if 'km_min' in attrs and 'km_max' in attrs and attrs['km_min'] > attrs['km_max']:
+            raise serializers.ValidationError("km_min не может быть больше km_max")
+        return attrs
+
+class ProfileQuerySerializer(KmRangeQuerySerializer):
+    template = serializers.CharField(help_text='id или имя шаблона тега без подстановок, через запятую')
+    at = serializers.DateTimeField(required=False, help_text='Момент времени; по умолчанию текущие значения')
+
+    def validate_template(self, value):
+        keys = {part.strip() for part in value.split(',') if part.strip()}
+        if not keys:
+            raise serializers.ValidationError("Не указан шаблон")
+        template_ids = []
+        for template_id, name_template in TagTemplate.objects.values_list('id', 'name_template'):
+            if str(template_id) in keys or name_template in keys or template_base_name(name_template) in keys:
+                template_ids.append(template_id)
+        if not template_ids:
+            raise serializers.ValidationError("Шаблон не найден")
+        return template_ids
@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_config_version
+from .models import AlarmDefinition, ObjectType, PipelineObject, Tag, TagTemplate
+
+
+@receiver(post_save, sender=AlarmDefinition)
+@receiver(post_delete, sender=AlarmDefinition)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=TagTemplate)
+@receiver(post_delete, sender=TagTemplate)
+@receiver(post_save, sender=PipelineObject)
+@receiver(post_delete, sender=PipelineObject)
+@receiver(post_save, sender=ObjectType)
+@receiver(post_delete, sender=ObjectType)
+def configuration_changed(sender, **kwargs):
+    # Новый тег тоже сбрасывает кэш: его имя могло быть запомнено как отсутствующее.
+    # Версия меняется после фиксации: иначе другой процесс успеет перечитать
+    # ещё не зафиксированную конфигурацию и закэшировать её под новой версией
+    transaction.on_commit(bump_config_version, robust=True)
@@ -0,0 +1,178 @@
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+
+from .cache import bump_config_version
+from .models import AlarmDefinition, ModbusDevice, ModbusPoint, ObjectType, PipelineObject, Tag
+from .provisioning import provision_tags
+
+SIM_PREFIX = 'SIM'
+GOOD_QUALITY = 100
+BAD_QUALITY = 0
+
+
+def build_plant(objects_per_type, prefix=SIM_PREFIX):
+    """
+    Создаёт objects_per_type объектов каждого типа, у которого есть шаблоны
+    тегов (индексы SIM0001, SIM0002, ...), и развёртывает для них теги.
+    Существующие объекты не дублируются. Возвращает результат provision_tags.
+    """
+    types = list(ObjectType.objects.filter(tagtemplate__isnull=False).distinct())
+    PipelineObject.objects.bulk_create([
+        PipelineObject(
+            object_type=object_type,
+            index=f'{prefix}{number:04d}',
+            name=f'{object_type.name} {prefix}{number:04d}',
+            location='Симуляция',
+        )
+        for object_type in types
+        for number in range(1, objects_per_type + 1)
+    ], ignore_conflicts=True)
+    return provision_tags(object_types=[object_type.pk for object_type in types], archive_missing=False)
+
+
+def create_alarm_definitions(tag_ids, ratio=0.9):
+    """
+    Добавляет тегам float без определений аварий правило GT на ratio диапазона.
+    Возвращает число созданных определений.
+    """
+    covered = set(AlarmDefinition.objects.filter(tag_id__in=tag_ids).values_list('tag_id', flat=True))
+    tags = Tag.objects.filter(id__in=tag_ids, data_type='float').exclude(id__in=covered).only(
+        'id', 'name', 'min_value', 'max_value'
+    )
+    definitions = [
+        AlarmDefinition(
+            tag=tag,
+            name=f'{tag.name} высокий',
+            condition='GT',
+            trigger_value=tag.min_value + ratio * (tag.max_value - tag.min_value),
+            message=f'Превышение {tag.name}',
+            severity='HIGH',
+        )
+        for tag in tags
+    ]
+    with transaction.atomic():
+        AlarmDefinition.objects.bulk_create(definitions, batch_size=1000)
+        transaction.on_commit(bump_config_version)
+    return len(definitions)
+
+
+def plant_tags(prefix=SIM_PREFIX):
+    """Неархивные теги объектов симуляции (prefix=None — все теги)"""
+    tags = Tag.objects.filter(is_archived=False)
+    if prefix:
+        tags = tags.filter(pipeline_object__index__startswith=prefix)
+    return list(tags.order_by('id').values_list('id', 'data_type', 'min_value', 'max_value'))
+
+
+def build_modbus_device(tags, host='127.0.0.1', port=5020, scan_class=1000, name='SIM-MODBUS'):
+    """
+    Устройство Modbus для симулятора (modbus_simulator) с точками для тегов
+    tags (строки plant_tags): теги boolean — coils по порядку, остальные —
+    FLOAT32 в holding-регистрах подряд. Существующие привязки тегов
+    переносятся на это устройство. Возвращает устройство.
+    """
+    device, _ = ModbusDevice.objects.update_or_create(name=name, defaults={'host': host, 'port': port})
+    points = []
+    coil = register = 0
+    for tag_id, data_type, _, _ in tags:
+        if data_type == 'boolean':
+            points.append(ModbusPoint(device=device, tag_id=tag_id, register_type='COIL', address=coil,
+                                      data_type='BOOL', scan_class=scan_class))
+            coil += 1
+        else:
+            points.append(ModbusPoint(device=device, tag_id=tag_id, register_type='HOLDING', address=register,
+                                      data_type='FLOAT32', scan_class=scan_class))
+            register += 2
+    if register > 65536:
+        raise ValueError('Точки не помещаются в адресное пространство устройства')
+    ModbusPoint.objects.bulk_create(
+        points, batch_size=1000, update_conflicts=True, unique_fields=['tag'],
+        update_fields=['device', 'register_type', 'address', 'data_type', 'word_swap', 'scale', 'offset', 'scan_class'],
+    )
+    return device
+
+
+class PlantSimulator:
+    """
+    Генератор правдоподобных потоков значений тегов.
+
+    Значение тега — середина диапазона плюс медленный дрейф (случайное
+    блуждание с возвратом к среднему), белый шум и редкие ступеньки на
+    несколько отсчётов. У тегов с порогами GT/LT ступенька переводит значение
+    за порог и обратно, поэтому аварии открываются и сбрасываются. Теги
+    boolean дают 0/1. Все вычисления векторизованы по тегам (NumPy).
+    """
+
+    def __init__(self, tags, thresholds=None, seed=None, noise_pct=0.5, drift_pct=0.05,
+                 step_probability=0.002, bad_quality_probability=0.0001):
+        self.rng = np.random.default_rng(seed)
+        self.tag_ids = [tag_id for tag_id, _, _, _ in tags]
+        low = np.array([low for _, _, low, _ in tags], dtype=np.float64)
+        high = np.array([high for _, _, _, high in tags], dtype=np.float64)
+        self.span = np.maximum(high - low, 1e-9)
+        self.low = low - 0.1 * self.span
+        self.high = high + 0.1 * self.span
+        self.base = (low + high) / 2
+        self.boolean = np.array([data_type == 'boolean' for _, data_type, _, _ in tags])
+        self.noise = self.span * noise_pct / 100
+        self.drift_step = self.span * drift_pct / 100
+        self.drift = np.zeros(len(tags))
+        self.offset = np.zeros(len(tags))
+        self.remaining = np.zeros(len(tags), dtype=np.int64)
+        self.step_probability = step_probability
+        self.bad_quality_probability = bad_quality_probability
+
+        # Высота ступеньки: за порог аварии, иначе ±20% диапазона
+        self.step_target = np.full(len(tags), np.nan)
+        positions = {tag_id: position for position, tag_id in enumerate(self.tag_ids)}
+        for tag_id, condition, trigger in thresholds or ():
+            position = positions.get(tag_id)
+            if position is None:
+                continue
+            margin = 0.05 * self.span[position]
+            if condition == 'GT':
+                self.step_target[position] = trigger + margin - self.base[position]
+            elif condition == 'LT':
+                self.step_target[position] = trigger - margin - self.base[position]
+
+    @classmethod
+    def for_tags(cls, tags, **kwargs):
+        """Симулятор с порогами из включённых определений аварий этих тегов"""
+        thresholds = AlarmDefinition.objects.filter(
+            is_enabled=True, tag_id__in=[tag_id for tag_id, _, _, _ in tags], condition__in=('GT', 'LT')
+        ).values_list('tag_id', 'condition', 'trigger_value')
+        return cls(tags, thresholds=list(thresholds), **kwargs)
+
+    def step(self, timestamp):
+        """Один отсчёт всех тегов: список строк (tag_id, value, quality, timestamp)"""
+        count = len(self.tag_ids)
+        rng = self.rng
+
+        self.drift = 0.99 * self.drift + rng.normal(0.0, self.drift_step)
+        starting = (self.remaining == 0) & (rng.random(count) < self.step_probability)
+        if starting.any():
+            random_steps = rng.choice([-0.2, 0.2], size=count) * self.span
+            targets = np.where(np.isnan(self.step_target), random_steps, self.step_target)
+            self.offset[starting] = targets[starting]
+            self.remaining[starting] = rng.integers(5, 60, size=int(starting.sum()))
+        active = self.remaining > 0
+        self.remaining[active] -= 1
+        self.offset[self.remaining == 0] = 0.0
+
+        values = self.base + self.drift + self.offset + rng.normal(0.0, self.noise)
+        values = np.clip(values, self.low, self.high)
+        values = np.where(self.boolean, (values > self.base).astype(np.float64), values)
+        bad = rng.random(count) < self.bad_quality_probability
+
+        return [
+            (tag_id, value, BAD_QUALITY if is_bad else GOOD_QUALITY, timestamp)
+            for tag_id, value, is_bad in zip(self.tag_ids, values.tolist(), bad.tolist())
+        ]
+
+    def run(self, start, ticks, interval):
+        """Генератор отсчётов: пары (timestamp, строки) с шагом interval секунд"""
+        for tick in range(ticks):
+            timestamp = start + timedelta(seconds=tick * interval)
+            yield timestamp, self.step(timestamp)
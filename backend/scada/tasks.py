@@ -0,0 +1,40 @@
+from celery import shared_task
+from django.conf import settings
+
+from .alarms import prune_alarm_events
+from .partitions import apply_retention, ensure_partitions
+from .rollups import apply_rollup_retention, build_rollups
+from .writebuffer import OFF, write_buffer
+
+
+@shared_task
+def build_rollups_task(interval):
+    """Достраивает агрегаты интервала interval (секунды)"""
+    return build_rollups(interval)
+
+
+@shared_task
+def maintain_history():
+    """Секции TagValue наперёд и удаление данных и событий аварий старше сроков хранения"""
+    created = ensure_partitions()
+    removed, deleted_rows = apply_retention()
+    deleted_rollups = apply_rollup_retention()
+    deleted_events = prune_alarm_events()
+    return {
+        'created_partitions': len(created),
+        'removed_partitions': len(removed),
+        'deleted_rows': deleted_rows,
+        'deleted_rollups': deleted_rollups,
+        'deleted_alarm_events': deleted_events,
+    }
+
+
+@shared_task
+def replay_ingest_buffer():
+    """
+    Переносит в БД остаток буфера записи, если его процесс-владелец
+    остановился. На одном узле с веб-процессами (каталог буфера локальный).
+    """
+    if settings.INGEST_BUFFER == OFF:
+        return 0
+    return write_buffer.drain()
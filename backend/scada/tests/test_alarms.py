@@ -0,0 +1,165 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from scada.alarms import AlarmEngine, prune_alarm_events
+from scada.ingest import on_values_written
+from scada.cache import bump_config_version
+from scada.models import Alarm, AlarmDefinition, AlarmEvent, ObjectType, PipelineObject, Tag, TagTemplate, TagValue
+
+
+class AlarmEngineTest(TestCase):
+    """Гистерезис, задержки, одна открытая авария на определение, откат пакета"""
+
+    @classmethod
+    def setUpTestData(cls):
+        object_type = ObjectType.objects.create(name='НПС')
+        template = TagTemplate.objects.create(
+            object_type=object_type, name_template='PRESSURE_{index}', description_template='Давление',
+        )
+        pipeline_object = PipelineObject.objects.create(object_type=object_type, name='НПС 1', index='001')
+        cls.tag = Tag.objects.create(tag_template=template, pipeline_object=pipeline_object)
+
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+        self.engine = AlarmEngine()
+
+    def define(self, **options):
+        definition = AlarmDefinition.objects.create(
+            tag=self.tag, name='Давление высокое', condition='GT', trigger_value=10.0, message='Давление', **options,
+        )
+        bump_config_version()
+        return definition
+
+    def evaluate(self, *points, engine=None):
+        values = [
+            TagValue(tag_id=self.tag.pk, value=value, timestamp=self.start + timedelta(seconds=second))
+            for second, value in points
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            return (engine or self.engine).evaluate(values)
+
+    def states(self, definition):
+        return list(Alarm.objects.filter(alarm_definition=definition).order_by('id').values_list('state', flat=True))
+
+    def test_hysteresis(self):
+        definition = self.define(deadband=1.0)
+        self.evaluate((0, 11.0))
+        self.evaluate((1, 9.5))
+        self.assertEqual(self.states(definition), ['ACTIVE'])
+        self.evaluate((2, 8.9))
+        self.assertEqual(self.states(definition), ['RESOLVED'])
+
+    def test_on_and_off_delay(self):
+        definition = self.define(on_delay=10.0, off_delay=5.0)
+        self.evaluate((0, 11.0), (5, 12.0))
+        self.assertEqual(self.states(definition), [])
+        self.evaluate((10, 11.0))
+        self.assertEqual(self.states(definition), ['ACTIVE'])
+        self.evaluate((11, 5.0), (15, 5.0))
+        self.assertEqual(self.states(definition), ['ACTIVE'])
+        self.evaluate((16, 5.0))
+        self.assertEqual(self.states(definition), ['RESOLVED'])
+
+    def test_rolled_back_batch_keeps_timers(self):
+        definition = self.define(on_delay=10.0)
+        self.evaluate((0, 11.0))
+        # Пакет, запись которого откатилась, не сдвигает таймер задержки
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.engine.evaluate([TagValue(tag_id=self.tag.pk, value=5.0, timestamp=self.start + timedelta(seconds=4))])
+                raise RuntimeError
+        self.evaluate((10, 11.0))
+        self.assertEqual(self.states(definition), ['ACTIVE'])
+
+    def test_alarm_opened_elsewhere_is_not_duplicated(self):
+        definition = self.define()
+        self.evaluate((0, 5.0))
+        # Аварию открыл другой процесс после того, как этот прочитал открытые
+        other = Alarm.objects.create(alarm_definition=definition, triggered_at=self.start, state='ACTIVE')
+        opened, transitions = self.engine._create(
+            [Alarm(alarm_definition_id=definition.pk, triggered_at=self.start, state='ACTIVE')], [],
+        )
+        self.assertEqual(opened, [])
+        self.assertEqual(list(Alarm.objects.filter(alarm_definition=definition)), [other])
+        self.assertFalse(AlarmEvent.objects.exists())
+
+    def test_chatter_counted_across_processes(self):
+        definition = self.define(chatter_count=3, chatter_window=60.0, shelve_duration=600.0)
+        other = AlarmEngine()
+        # Срабатывания приходят в два процесса записи по очереди
+        for second, engine in ((0, self.engine), (10, other), (20, self.engine)):
+            self.evaluate((second, 11.0), (second + 1, 5.0), engine=engine)
+        definition.refresh_from_db()
+        self.assertEqual(definition.shelved_until, self.start + timedelta(seconds=620))
+        self.assertEqual(len(self.states(definition)), 3)
+        self.evaluate((30, 11.0))
+        self.assertEqual(len(self.states(definition)), 3)
+
+
+    def test_events_are_last_write_of_ingest(self):
+        # Блокировка номеров событий держится до фиксации — берётся в конце
+        self.define()
+        values = [TagValue(tag_id=self.tag.pk, value=11.0, quality=100, timestamp=self.start)]
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                on_values_written(values)
+        writes = [query['sql'] for query in queries if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertIn('scada_alarmevent', writes[-1])
+        self.assertEqual(AlarmEvent.objects.get().transition, 'RAISED')
+
+class AcknowledgeTest(TestCase):
+    """Квитирование только активной аварии; срок хранения событий"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('operator')
+        object_type = ObjectType.objects.create(name='НПС')
+        template = TagTemplate.objects.create(
+            object_type=object_type, name_template='PRESSURE_{index}', description_template='Давление',
+        )
+        pipeline_object = PipelineObject.objects.create(object_type=object_type, name='НПС 1', index='001')
+        tag = Tag.objects.create(tag_template=template, pipeline_object=pipeline_object)
+        cls.definition = AlarmDefinition.objects.create(
+            tag=tag, name='Давление высокое', condition='GT', trigger_value=10.0, message='Давление',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def acknowledge(self, alarm):
+        return self.client.post(
+            f'/api/alarms/{alarm.pk}/acknowledge/', {'acknowledged_by': self.user.pk}, format='json',
+        )
+
+    def test_acknowledge_once(self):
+        alarm = Alarm.objects.create(alarm_definition=self.definition, state='ACTIVE')
+        self.assertEqual(self.acknowledge(alarm).status_code, 200)
+        second = self.acknowledge(alarm)
+        self.assertEqual(second.status_code, 409)
+        self.assertEqual(second.data['state'], 'ACKNOWLEDGED')
+        self.assertEqual(AlarmEvent.objects.filter(alarm=alarm, transition='ACKNOWLEDGED').count(), 1)
+
+    def test_resolved_alarm_is_not_reopened(self):
+        alarm = Alarm.objects.create(alarm_definition=self.definition, state='RESOLVED', resolved_at=timezone.now())
+        self.assertEqual(self.acknowledge(alarm).status_code, 409)
+        alarm.refresh_from_db()
+        self.assertEqual(alarm.state, 'RESOLVED')
+        self.assertFalse(AlarmEvent.objects.exists())
+
+    @override_settings(ALARM_EVENT_RETENTION_DAYS=30, ALARM_EVENT_DELETE_BATCH=2)
+    def test_prune_events(self):
+        alarm = Alarm.objects.create(alarm_definition=self.definition, state='ACTIVE')
+        now = timezone.now()
+        AlarmEvent.objects.bulk_create(
+            [AlarmEvent(alarm=alarm, transition='RAISED', created_at=now - timedelta(days=40)) for _ in range(5)]
+            + [AlarmEvent(alarm=alarm, transition='RESOLVED', created_at=now - timedelta(days=1))]
+        )
+        self.assertEqual(prune_alarm_events(now), 5)
+        self.assertEqual(list(AlarmEvent.objects.values_list('transition', flat=True)), ['RESOLVED'])
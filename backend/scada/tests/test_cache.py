@@ -0,0 +1,37 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from scada.cache import VERSION_KEY, MetadataCache, bump_config_version, metadata
+from scada.models import ObjectType
+
+
+class ConfigVersionTest(TestCase):
+    """Версия конфигурации меняется только после фиксации изменения"""
+
+    def test_bumped_on_commit(self):
+        before = cache.get(VERSION_KEY, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            ObjectType.objects.create(name='НПС')
+            self.assertEqual(cache.get(VERSION_KEY, 0), before)
+        self.assertGreater(cache.get(VERSION_KEY, 0), before)
+
+
+@override_settings(METADATA_CACHE_CHECK_SECONDS=0, METADATA_CACHE_RETRY_SECONDS=0)
+class CacheUnavailableTest(TestCase):
+    """Недоступный общий кэш: последняя известная версия, отложенное увеличение"""
+
+    def test_keeps_version_and_bumps_after_recovery(self):
+        cache.set(VERSION_KEY, 7, timeout=None)
+        local = MetadataCache()
+        self.assertEqual(local.version, 7)
+        with mock.patch.object(cache, 'get', side_effect=ConnectionError('Error 111')):
+            self.assertEqual(local.version, 7)
+
+        with mock.patch.object(cache, 'incr', side_effect=ConnectionError('Error 111')):
+            bump_config_version()
+        # Свой процесс сбросил кэш под локальной версией; общая увеличится при сверке
+        self.assertLess(metadata._version, 0)
+        self.assertEqual(cache.get(VERSION_KEY), 7)
+        self.assertEqual(metadata.version, 8)
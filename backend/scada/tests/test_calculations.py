@@ -0,0 +1,97 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from scada.cache import bump_config_version
+from scada.calculations import MAX_EXPRESSION_LENGTH, ExpressionError, compile_expression, evaluate
+from scada.models import ObjectType, PipelineObject, Tag, TagCurrentValue, TagTemplate, TagValue
+
+
+class RoundTest(TestCase):
+    """round с числом знаков: константы выражения компилируются как float"""
+
+    def compile(self, expression):
+        code, _ = compile_expression(expression, resolve=lambda names: {name: 1 for name in names})
+        return code
+
+    def test_round_digits(self):
+        self.assertEqual(evaluate(self.compile('round(x, 2)'), {1: 3.14159}), 3.14)
+        self.assertEqual(evaluate(self.compile('round(x)'), {1: 2.7}), 3.0)
+        self.assertEqual(evaluate(self.compile('round(x, -1)'), {1: 1234.0}), 1230.0)
+
+    def test_fractional_digits(self):
+        with self.assertRaises(ValueError):
+            evaluate(self.compile('round(x, 1.5)'), {1: 3.14159})
+
+
+class ExpressionLimitsTest(TestCase):
+    """Длинное или глубоко вложенное выражение — ошибка проверки, а не 500"""
+
+    def compile(self, expression):
+        return compile_expression(expression, resolve=lambda names: {name: 1 for name in names})
+
+    def test_deep_nesting(self):
+        for expression in ('-' * 1000 + 'x', 'x' + ' + x' * 300, 'abs(' * 300 + 'x' + ')' * 300):
+            with self.assertRaises(ExpressionError):
+                self.compile(expression)
+
+    def test_long_expression(self):
+        with self.assertRaises(ExpressionError):
+            self.compile('-' * 100000 + 'x')
+        with self.assertRaises(ExpressionError):
+            self.compile('x' + ' ' * MAX_EXPRESSION_LENGTH + '+ 1')
+
+    def test_sum_of_many_tags(self):
+        self.compile(' + '.join(f'x{index}' for index in range(100)))
+
+
+class SingleValuePostTest(TestCase):
+    """POST /api/tag-values/ проходит путь пакета: сжатие и вычисляемые теги"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('operator')
+        object_type = ObjectType.objects.create(name='НПС')
+        pipeline_object = PipelineObject.objects.create(object_type=object_type, name='НПС 1', index='001')
+        flow = TagTemplate.objects.create(
+            object_type=object_type, name_template='FLOW_{index}', description_template='Расход',
+            compression='DEADBAND', deadband_abs=1.0,
+        )
+        rounded = TagTemplate.objects.create(
+            object_type=object_type, name_template='FLOW_R_{index}', description_template='Расход (округл.)',
+        )
+        cls.flow = Tag.objects.create(tag_template=flow, pipeline_object=pipeline_object)
+        cls.rounded = Tag.objects.create(
+            tag_template=rounded, pipeline_object=pipeline_object, expression='round(FLOW_001, 1)',
+        )
+
+    def setUp(self):
+        bump_config_version()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, value):
+        # Состояние сжатия применяется после фиксации
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/tag-values/', {'tag': self.flow.pk, 'value': value}, format='json')
+
+    def test_compressed_and_calculated(self):
+        response = self.post(100.0)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['stored'])
+        # В зоне нечувствительности: в архив не пишется, текущее значение обновляется
+        response = self.post(100.44)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['value'], 100.44)
+        self.assertNotIn('id', response.data)
+        self.assertFalse(response.data['stored'])
+        self.assertEqual(TagValue.objects.filter(tag=self.flow).count(), 1)
+        self.assertEqual(TagCurrentValue.objects.get(tag=self.flow).value, 100.44)
+        self.assertEqual(TagCurrentValue.objects.get(tag=self.rounded).value, 100.4)
+
+    def test_deep_expression_is_rejected(self):
+        response = self.client.patch(
+            f'/api/tags/{self.rounded.pk}/', {'expression': '-' * 100000 + 'FLOW_001'}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expression', response.data)
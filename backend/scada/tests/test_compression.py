@@ -0,0 +1,105 @@
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.test import TestCase
+from django.utils import timezone
+
+from scada.cache import bump_config_version
+from scada.compression import ArchiveCompressor
+from scada.models import ObjectType, PipelineObject, Tag, TagTemplate, TagValue
+
+
+class SwingingDoorTest(TestCase):
+    """Состояние сжатия применяется только после записи; максимальный интервал записи"""
+
+    @classmethod
+    def setUpTestData(cls):
+        object_type = ObjectType.objects.create(name='НПС')
+        template = TagTemplate.objects.create(
+            object_type=object_type, name_template='PRESSURE_{index}', description_template='Давление',
+            compression='SWINGING_DOOR', swinging_door_tolerance=0.5, compression_max_seconds=60.0,
+        )
+        pipeline_object = PipelineObject.objects.create(object_type=object_type, name='НПС 1', index='001')
+        cls.tag = Tag.objects.create(tag_template=template, pipeline_object=pipeline_object)
+
+    def setUp(self):
+        bump_config_version()
+        self.compressor = ArchiveCompressor()
+        self.start = timezone.now().replace(microsecond=0)
+
+    def values(self, signal, seconds, offset=0):
+        return [
+            TagValue(tag_id=self.tag.pk, value=signal(second), quality=100,
+                     timestamp=self.start + timedelta(seconds=second))
+            for second in range(offset, offset + seconds)
+        ]
+
+    def compress(self, values, apply=True):
+        stored, commit = self.compressor.compress(values)
+        if apply:
+            commit()
+        return stored
+
+    def test_uncommitted_batch_does_not_change_state(self):
+        signal = lambda second: 10.0 * math.sin(second / 5.0)
+        self.compress(self.values(signal, 10))
+        # Пакет не записан (откат): следующий сжимается так же, как без него
+        self.compress(self.values(lambda second: 100.0, 10, offset=10), apply=False)
+        retried = self.compress(self.values(signal, 10, offset=10), apply=False)
+        reference = ArchiveCompressor()
+        stored, commit = reference.compress(self.values(signal, 10))
+        commit()
+        expected, _ = reference.compress(self.values(signal, 10, offset=10))
+        self.assertEqual(
+            [(tv.timestamp, tv.value) for tv in retried],
+            [(tv.timestamp, tv.value) for tv in expected],
+        )
+
+    def test_max_interval_flushes_held_point(self):
+        stored = self.compress(self.values(lambda second: 5.0, 150))
+        gaps = [
+            (later.timestamp - earlier.timestamp).total_seconds()
+            for earlier, later in zip(stored, stored[1:])
+        ]
+        self.assertTrue(gaps)
+        self.assertLessEqual(max(gaps), 60.0)
+
+    def test_linear_reconstruction_within_tolerance(self):
+        signal = lambda second: 10.0 * math.sin(second / 7.0) + 0.1 * second
+        values = self.values(signal, 300)
+        stored = self.compress(values)
+        self.assertLess(len(stored), len(values))
+        x = np.array([tv.timestamp.timestamp() for tv in stored])
+        y = np.array([tv.value for tv in stored])
+        # Последняя отложенная точка ещё не записана — сравниваем до последней записанной
+        moments = np.array([tv.timestamp.timestamp() for tv in values])
+        covered = moments <= x[-1]
+        restored = np.interp(moments[covered], x, y)
+        original = np.array([tv.value for tv in values])[covered]
+        self.assertLessEqual(np.abs(restored - original).max(), 0.5 + 1e-9)
+
+    def test_config_change_keeps_held_point(self):
+        signal = lambda second: float(min(second, 50))
+        values = self.values(signal, 55)
+        stored = []
+        for tv in values:
+            # Любая правка конфигурации (тег, объект, авария) меняет её версию
+            if (tv.timestamp - self.start).seconds % 7 == 0:
+                bump_config_version()
+            stored.extend(self.compress([tv]))
+        self.assertLess(len(stored), 10)
+        self.assertIn((self.start + timedelta(seconds=50), 50.0), [(tv.timestamp, tv.value) for tv in stored])
+        x = np.array([tv.timestamp.timestamp() for tv in stored])
+        y = np.array([tv.value for tv in stored])
+        moments = np.array([tv.timestamp.timestamp() for tv in values])
+        covered = moments <= x[-1]
+        restored = np.interp(moments[covered], x, y)
+        self.assertLessEqual(np.abs(restored - np.array([tv.value for tv in values])[covered]).max(), 0.5 + 1e-9)
+
+    def test_changed_settings_flush_held_point(self):
+        self.compress(self.values(lambda second: float(second), 10))
+        Tag.objects.filter(pk=self.tag.pk).update(compression='NONE')
+        bump_config_version()
+        stored = self.compress(self.values(lambda second: 100.0, 1, offset=10))
+        self.assertEqual([tv.value for tv in stored], [9.0, 100.0])
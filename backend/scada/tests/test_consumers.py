@@ -0,0 +1,73 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from scada.cache import bump_config_version
+from scada.consumers import TagConsumer
+from scada.models import ObjectType, PipelineObject, Tag, TagCurrentValue, TagTemplate
+from scada.serialization import dumps_msgpack
+
+
+class TagConsumerTest(TransactionTestCase):
+    """Неверные кадры, снимок подписки частями, disconnect без connect"""
+
+    def setUp(self):
+        object_type = ObjectType.objects.create(name='НПС')
+        template = TagTemplate.objects.create(
+            object_type=object_type, name_template='FLOW_{index}', description_template='Расход',
+        )
+        now = timezone.now()
+        for index in range(5):
+            pipeline_object = PipelineObject.objects.create(
+                object_type=object_type, name=f'НПС {index}', index=f'{index:03d}',
+            )
+            tag = Tag.objects.create(tag_template=template, pipeline_object=pipeline_object)
+            TagCurrentValue.objects.create(tag=tag, value=float(index), quality=100, timestamp=now)
+        bump_config_version()
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(TagConsumer.as_asgi(), '/ws/tags/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'connection_established')
+        return communicator
+
+    def test_invalid_frames_keep_connection(self):
+        async def scenario():
+            communicator = await self.connect()
+            for frame in ('{', '[]', '1', 'null'):
+                await communicator.send_to(text_data=frame)
+                self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+            await communicator.send_to(bytes_data=b'\xc1')
+            self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+            await communicator.send_to(bytes_data=dumps_msgpack([1, 2]))
+            self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+            await communicator.send_json_to({'action': 'subscribe_tags', 'tags': 'abc'})
+            self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    @override_settings(TAG_UPDATES_CHUNK=2)
+    def test_snapshot_is_chunked(self):
+        async def scenario():
+            communicator = await self.connect()
+            await communicator.send_json_to({'action': 'subscribe_tags'})
+            self.assertEqual((await communicator.receive_json_from())['type'], 'subscription_confirmed')
+            frames = [await communicator.receive_json_from() for _ in range(3)]
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+            return frames
+
+        frames = async_to_sync(scenario)()
+        self.assertEqual([len(frame['data']) for frame in frames], [2, 2, 1])
+        values = sorted(update['value'] for frame in frames for update in frame['data'])
+        self.assertEqual(values, [0.0, 1.0, 2.0, 3.0, 4.0])
+
+    def test_disconnect_without_connect(self):
+        consumer = TagConsumer()
+        consumer.channel_layer = get_channel_layer()
+        consumer.channel_name = 'test.channel'
+        async_to_sync(consumer.disconnect)(1006)
@@ -0,0 +1,31 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from scada.leaks import MassBalance, Segment
+
+
+class LateSampleTest(SimpleTestCase):
+    """Опоздавший отсчёт переносится на интервалы, заполненные предыдущим значением"""
+
+    def setUp(self):
+        self.balance = MassBalance([Segment(1, 2, 10, 20, 30)], window_seconds=10)
+
+    def test_late_sample_propagates_forward(self):
+        for second in (0, 5):
+            self.balance.add(10, 100.0, 100, second)
+        # Интервалы 6-9 заполнены значением интервала 5; отсчёт 7 приходит последним
+        self.balance.add(10, 100.0, 100, 9.5)
+        self.balance.add(10, 90.0, 100, 7)
+        row = self.balance.rows[10]
+        np.testing.assert_array_equal(self.balance.ring[row, 5:10], [100.0, 100.0, 90.0, 90.0, 100.0])
+        self.assertAlmostEqual(self.balance.sums[row], self.balance.ring[row].sum())
+
+    def test_late_sample_reaches_head(self):
+        self.balance.add(10, 100.0, 100, 0)
+        self.balance.add(10, 100.0, 100, 3)
+        self.balance.evaluate(bucket=6)
+        self.balance.add(10, 80.0, 100, 4)
+        row = self.balance.rows[10]
+        np.testing.assert_array_equal(self.balance.ring[row, 3:7], [100.0, 80.0, 80.0, 80.0])
+        self.assertEqual(self.balance.last[row], 80.0)
+        self.assertAlmostEqual(self.balance.sums[row], self.balance.ring[row].sum())
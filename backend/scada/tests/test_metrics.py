@@ -0,0 +1,25 @@
+from django.test import TestCase, override_settings
+
+
+class MetricsAccessTest(TestCase):
+    """/metrics: токен, внутренние адреса или явное METRICS_PUBLIC"""
+
+    def get(self, address, **headers):
+        return self.client.get('/metrics', REMOTE_ADDR=address, headers=headers).status_code
+
+    @override_settings(METRICS_TOKEN='', METRICS_PUBLIC=False)
+    def test_internal_only_without_token(self):
+        self.assertEqual(self.get('127.0.0.1'), 200)
+        self.assertEqual(self.get('10.1.2.3'), 403)
+        self.assertEqual(self.get('10.1.2.3', x_forwarded_for='127.0.0.1'), 403)
+
+    @override_settings(METRICS_TOKEN='secret', METRICS_PUBLIC=False, METRICS_ALLOWED_NETWORKS=['10.0.0.0/8'])
+    def test_token_or_network(self):
+        self.assertEqual(self.get('192.0.2.1', authorization='Bearer secret'), 200)
+        self.assertEqual(self.get('192.0.2.1', authorization='Bearer wrong'), 403)
+        self.assertEqual(self.get('10.1.2.3'), 200)
+        self.assertEqual(self.get('127.0.0.1'), 403)
+
+    @override_settings(METRICS_TOKEN='', METRICS_PUBLIC=True)
+    def test_public(self):
+        self.assertEqual(self.get('192.0.2.1'), 200)
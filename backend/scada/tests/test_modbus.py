@@ -0,0 +1,140 @@
+import asyncio
+import struct
+from types import SimpleNamespace
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase
+
+from scada.acquisition import GOOD_QUALITY, AcquisitionService, plan_blocks
+from scada.modbus import ConnectionPool, ModbusConnection, ModbusError, ModbusSimulator
+
+
+def point(tag_id, address, register_type='HOLDING', data_type='FLOAT32'):
+    return SimpleNamespace(
+        tag_id=tag_id, address=address, register_type=register_type, data_type=data_type,
+        word_swap=False, scale=1.0, offset=0.0,
+    )
+
+
+class PlanBlocksTest(SimpleTestCase):
+    """Группировка точек в блочные чтения"""
+
+    def test_gap_splits_block(self):
+        blocks = plan_blocks([point(1, 0), point(2, 2), point(3, 20)], max_gap=4)
+        self.assertEqual([(block.address, block.count) for block in blocks], [(0, 4), (20, 2)])
+        self.assertEqual([item.index for item in blocks[0].points], [0, 2])
+
+    def test_protocol_limit(self):
+        blocks = plan_blocks([point(index, 2 * index) for index in range(100)], max_gap=10)
+        self.assertTrue(all(block.count <= 125 for block in blocks))
+        self.assertEqual(sum(len(block.points) for block in blocks), 100)
+        self.assertEqual([block.address for block in blocks], [0, 124])
+
+    def test_register_types_apart(self):
+        blocks = plan_blocks([
+            point(1, 0, 'COIL', 'FLOAT32'), point(2, 1, 'COIL', 'BOOL'), point(3, 0, 'INPUT', 'INT16'),
+        ], max_gap=0)
+        self.assertEqual([(block.register_type, block.count) for block in blocks], [('COIL', 2), ('INPUT', 1)])
+        self.assertEqual({item.data_type for item in blocks[0].points}, {'BOOL'})
+
+
+class ConnectionValidationTest(SimpleTestCase):
+    """Неверный ответ устройства — ModbusError и закрытое соединение"""
+
+    def read(self, pdu, register_type='HOLDING', count=2, length=None):
+        # Ответ с тем же номером транзакции: MBAP (длина, адрес) и PDU
+        response = struct.pack('>HB', len(pdu) + 1 if length is None else length, 1) + pdu
+
+        async def scenario():
+            async def handle(reader, writer):
+                header = await reader.readexactly(7)
+                await reader.readexactly(struct.unpack('>H', header[4:6])[0] - 1)
+                writer.write(header[:4] + response)
+                await writer.drain()
+                writer.close()
+
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            connection = ModbusConnection('127.0.0.1', server.sockets[0].getsockname()[1], 1.0)
+            function = {'COIL': 1, 'HOLDING': 3}[register_type]
+            try:
+                return await connection.read(1, function, 0, count), connection
+            except ModbusError as exc:
+                return exc, connection
+            finally:
+                connection.close()
+                server.close()
+                await server.wait_closed()
+
+        return async_to_sync(scenario)()
+
+    def assertInvalid(self, response, **options):
+        result, connection = self.read(response, **options)
+        self.assertIsInstance(result, ModbusError)
+        self.assertIsNone(connection._writer)
+
+    def test_zero_mbap_length(self):
+        self.assertInvalid(b'', length=0)
+        self.assertInvalid(b'', length=1)
+
+    def test_short_bit_response(self):
+        self.assertInvalid(b'\x01\x01\x01', register_type='COIL', count=16)
+
+    def test_byte_count_mismatch(self):
+        self.assertInvalid(b'\x03\x04\x00\x01')
+        self.assertInvalid(b'\x03\x02\x00\x01')
+
+    def test_short_exception(self):
+        self.assertInvalid(b'\x83')
+
+    def test_valid_response(self):
+        result, _ = self.read(b'\x03\x04\x00\x01\x00\x02')
+        self.assertEqual(result, b'\x00\x01\x00\x02')
+
+
+class SimulatorLoopTest(SimpleTestCase):
+    """Опрос симулятора: значения доходят до записи, неверный кадр не роняет сервер"""
+
+    def test_acquisition_reads_simulator(self):
+        written = []
+
+        def writer(rows):
+            written.extend(rows)
+            return rows, rows, []
+
+        async def scenario():
+            simulator = await ModbusSimulator(port=0).start()
+            simulator.set_value('HOLDING', 10, 42.5)
+            simulator.set_value('COIL', 3, 1)
+            device = SimpleNamespace(
+                pk=1, name='SIM', host=simulator.host, port=simulator.port, connections=2, timeout=1.0, unit_id=1,
+            )
+            blocks = plan_blocks([point(1, 10), point(2, 3, 'COIL', 'BOOL')], max_gap=4)
+            service = AcquisitionService([(device, {100: blocks})], flush_seconds=0.05, batch_rows=100, writer=writer)
+            try:
+                await service.run(duration=0.3)
+            finally:
+                await simulator.stop()
+            return service
+
+        service = async_to_sync(scenario)()
+        self.assertEqual(service.stats['errors'], 0)
+        self.assertIn((1, 42.5, GOOD_QUALITY), [row[:3] for row in written])
+        self.assertIn((2, 1.0, GOOD_QUALITY), [row[:3] for row in written])
+
+    def test_malformed_request_keeps_server(self):
+        async def scenario():
+            simulator = await ModbusSimulator(port=0).start()
+            simulator.set_value('HOLDING', 0, 7, 'UINT16')
+            try:
+                reader, writer = await asyncio.open_connection(simulator.host, simulator.port)
+                writer.write(struct.pack('>HHHB', 1, 0, 0, 1))
+                self.assertEqual(await asyncio.wait_for(reader.read(), 1.0), b'')
+                writer.close()
+                pool = ConnectionPool(simulator.host, simulator.port, timeout=1.0)
+                result = await pool.read(1, 'HOLDING', 0, 1)
+                pool.close()
+                return result
+            finally:
+                await simulator.stop()
+
+        self.assertEqual(async_to_sync(scenario)(), (7,))
@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from scada.models import ObjectType, PipelineObject, Tag, TagTemplate, TagValue
+from scada.pagination import TagValuePagination
+
+
+class KeysetPaginationTest(TestCase):
+    """История /api/tag-values/: страницы по курсору, граница диапазона индекса"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('operator')
+        object_type = ObjectType.objects.create(name='НПС')
+        template = TagTemplate.objects.create(
+            object_type=object_type, name_template='PRESSURE_{index}', description_template='Давление',
+        )
+        pipeline_object = PipelineObject.objects.create(object_type=object_type, name='НПС 1', index='001')
+        cls.tag = Tag.objects.create(tag_template=template, pipeline_object=pipeline_object)
+        start = timezone.now().replace(microsecond=0)
+        # Пары значений с одинаковой меткой: порядок внутри метки — по id
+        TagValue.objects.bulk_create([
+            TagValue(tag=cls.tag, value=number, timestamp=start + timedelta(seconds=number // 2))
+            for number in range(45)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_forward_and_back(self):
+        url = f'/api/tag-values/?tag_id={self.tag.pk}&page_size=10'
+        pages = []
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            pages.append([row['value'] for row in response.data['results']])
+            url = response.data['next']
+        self.assertEqual([value for page in pages for value in page], [float(value) for value in range(44, -1, -1)])
+        self.assertEqual([len(page) for page in pages], [10, 10, 10, 10, 5])
+
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual([row['value'] for row in previous.data['results']], pages[-2])
+
+    def test_cursor_bounds_index_range(self):
+        last = TagValue.objects.filter(tag=self.tag).order_by('-timestamp', '-id')[10]
+        for reverse in (False, True):
+            queryset = TagValuePagination().cursor_queryset(
+                TagValue.objects.filter(tag=self.tag), (last.timestamp, last.pk), reverse,
+            )
+            sql, params = queryset[:11].query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            # Курсор ограничивает диапазон индекса (тег, время), а не фильтрует с начала
+            self.assertIn('tagvalue_tag_ts_idx (tag_id=? AND timestamp' + ('>?' if reverse else '<?'), plan)
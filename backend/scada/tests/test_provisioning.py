@@ -0,0 +1,74 @@
+from django.test import TestCase
+
+from scada.models import ObjectType, PipelineObject, Tag, TagTemplate
+from scada.provisioning import ProvisioningError, provision_tags
+
+
+class ProvisionTagsTest(TestCase):
+    """Развёртывание шаблонов: создание, синхронизация, архивирование, конфликты"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.station = ObjectType.objects.create(name='НПС')
+        cls.valve = ObjectType.objects.create(name='Задвижка')
+        cls.pressure = TagTemplate.objects.create(
+            object_type=cls.station, name_template='PRESSURE_{index}', description_template='Давление НПС {index}',
+            compression='DEADBAND', deadband_abs=0.5,
+        )
+        TagTemplate.objects.create(
+            object_type=cls.station, name_template='FLOW_{index}', description_template='Расход НПС {index}',
+        )
+        TagTemplate.objects.create(
+            object_type=cls.valve, name_template='POSITION_{index}', description_template='Положение',
+        )
+        cls.first = PipelineObject.objects.create(object_type=cls.station, name='НПС 1', index='001')
+        PipelineObject.objects.create(object_type=cls.station, name='НПС 2', index='002')
+        PipelineObject.objects.create(object_type=cls.valve, name='Задвижка 1', index='101')
+
+    def names(self, **filters):
+        return sorted(Tag.objects.filter(**filters).values_list('name', flat=True))
+
+    def test_create_then_unchanged(self):
+        result = provision_tags()
+        self.assertEqual(result['created'], 5)
+        self.assertEqual(self.names(), ['FLOW_001', 'FLOW_002', 'POSITION_101', 'PRESSURE_001', 'PRESSURE_002'])
+        tag = Tag.objects.get(name='PRESSURE_001')
+        self.assertEqual((tag.description, tag.compression, tag.deadband_abs), ('Давление НПС 001', 'DEADBAND', 0.5))
+        self.assertEqual(provision_tags(), {'created': 0, 'updated': 0, 'restored': 0, 'archived': 0, 'unchanged': 5})
+
+    def test_dry_run_and_object_types(self):
+        self.assertEqual(provision_tags(dry_run=True)['created'], 5)
+        self.assertFalse(Tag.objects.exists())
+        provision_tags(object_types=[self.valve.pk])
+        self.assertEqual(self.names(), ['POSITION_101'])
+
+    def test_template_change_updates_names(self):
+        provision_tags()
+        TagTemplate.objects.filter(pk=self.pressure.pk).update(name_template='P_OUT_{index}')
+        result = provision_tags()
+        self.assertEqual((result['updated'], result['unchanged']), (2, 3))
+        self.assertEqual(self.names(name__startswith='P_'), ['P_OUT_001', 'P_OUT_002'])
+
+    def test_archive_and_restore(self):
+        provision_tags()
+        PipelineObject.objects.filter(pk=self.first.pk).update(object_type=self.valve)
+        result = provision_tags()
+        self.assertEqual((result['created'], result['archived']), (1, 2))
+        self.assertEqual(self.names(is_archived=True), ['FLOW_001', 'PRESSURE_001'])
+        PipelineObject.objects.filter(pk=self.first.pk).update(object_type=self.station)
+        result = provision_tags()
+        self.assertEqual((result['restored'], result['archived']), (2, 1))
+        self.assertEqual(self.names(is_archived=True), ['POSITION_001'])
+
+    def test_name_conflicts(self):
+        # Задвижка с индексом станции: шаблон FLOW_{index} дал бы второй FLOW_001
+        TagTemplate.objects.create(object_type=self.valve, name_template='FLOW_{index}', description_template='Расход')
+        valve = PipelineObject.objects.create(object_type=self.valve, name='Задвижка 2', index='001')
+        with self.assertRaises(ProvisioningError):
+            provision_tags()
+        self.assertFalse(Tag.objects.exists())
+        # Имя занято тегом другой пары (шаблон, объект)
+        provision_tags(object_types=[self.station.pk])
+        with self.assertRaises(ProvisioningError):
+            provision_tags(object_types=[self.valve.pk])
+        self.assertFalse(Tag.objects.filter(pipeline_object=valve).exists())
@@ -0,0 +1,55 @@
+from datetime import datetime, timezone as dt_timezone
+
+import msgpack
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from scada.cache import bump_config_version
+from scada.models import ObjectType, PipelineObject, Tag, TagTemplate, TagValue
+from scada.renderers import ORJSONRenderer
+
+
+class RenderersTest(TestCase):
+    """Ответы JSON (orjson) и MessagePack, разбор тел запросов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('operator')
+        object_type = ObjectType.objects.create(name='НПС')
+        template = TagTemplate.objects.create(
+            object_type=object_type, name_template='FLOW_{index}', description_template='Расход',
+        )
+        pipeline_object = PipelineObject.objects.create(object_type=object_type, name='НПС 1', index='001')
+        cls.tag = Tag.objects.create(tag_template=template, pipeline_object=pipeline_object)
+
+    def setUp(self):
+        bump_config_version()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_json_dates_like_drf(self):
+        rendered = ORJSONRenderer().render({'at': datetime(2026, 1, 1, 12, 0, 0, 500000, tzinfo=dt_timezone.utc)})
+        self.assertEqual(rendered, b'{"at":"2026-01-01T12:00:00.500000Z"}')
+        # Целое вне 64 бит orjson не кодирует — ответ строит стандартный кодировщик
+        self.assertEqual(ORJSONRenderer().render({'n': 2 ** 70}), b'{"n":1180591620717411303424}')
+
+    def test_msgpack_response(self):
+        response = self.client.get(f'/api/tags/{self.tag.pk}/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['name'], 'FLOW_001')
+        response = self.client.get(f'/api/tags/{self.tag.pk}/?format=msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['id'], self.tag.pk)
+
+    def test_msgpack_request(self):
+        body = msgpack.packb({'values': [['FLOW_001', 1.5, 100, '2026-01-01T00:00:00Z']]})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/tag-values/bulk/', body, content_type='application/msgpack')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(TagValue.objects.get(tag=self.tag).value, 1.5)
+
+    def test_malformed_bodies(self):
+        response = self.client.post('/api/tag-values/bulk/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/tag-values/bulk/', b'{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from scada.checks import check_retention_order
+from scada.models import ObjectType, PipelineObject, RollupDirtyHour, Tag, TagRollup, TagTemplate, TagValue
+from scada.partitions import apply_retention
+from scada.rollups import HOUR, MINUTE, align_down, apply_rollup_retention, rebuild_dirty_hours
+
+
+class RetentionTest(TestCase):
+    """Срок хранения истории и агрегатов: DELETE по границе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        object_type = ObjectType.objects.create(name='НПС')
+        template = TagTemplate.objects.create(
+            object_type=object_type, name_template='FLOW_{index}', description_template='Расход',
+        )
+        pipeline_object = PipelineObject.objects.create(object_type=object_type, name='НПС 1', index='001')
+        cls.tag = Tag.objects.create(tag_template=template, pipeline_object=pipeline_object)
+        cls.now = timezone.now()
+
+    def test_history_retention(self):
+        TagValue.objects.bulk_create([
+            TagValue(tag=self.tag, value=float(days), timestamp=self.now - timedelta(days=days))
+            for days in (1, 29, 31, 60)
+        ])
+        self.assertEqual(apply_retention(30, now=self.now), ([], 2))
+        self.assertEqual(sorted(TagValue.objects.values_list('value', flat=True)), [1.0, 29.0])
+        self.assertEqual(apply_retention(0, now=self.now), ([], 0))
+
+    @override_settings(ROLLUP_1M_RETENTION_DAYS=7, ROLLUP_1H_RETENTION_DAYS=0)
+    def test_rollup_retention(self):
+        TagRollup.objects.bulk_create([
+            TagRollup(
+                tag=self.tag, interval=interval, bucket=self.now - timedelta(days=days),
+                min=0.0, max=0.0, avg=0.0, count=1, first=0.0, last=0.0,
+            )
+            for interval in (MINUTE, HOUR) for days in (1, 10)
+        ])
+        self.assertEqual(apply_rollup_retention(now=self.now), 1)
+        self.assertEqual(TagRollup.objects.filter(interval=MINUTE).count(), 1)
+        self.assertEqual(TagRollup.objects.filter(interval=HOUR).count(), 2)
+
+    @override_settings(TAGVALUE_RETENTION_DAYS=30)
+    def test_expired_dirty_hour_not_rebuilt(self):
+        old = align_down(self.now - timedelta(days=40), HOUR)
+        RollupDirtyHour.objects.create(bucket=old)
+        TagValue.objects.create(tag=self.tag, value=1.0, timestamp=old)
+        with self.assertLogs('scada.rollups', 'WARNING'):
+            self.assertEqual(rebuild_dirty_hours(), 0)
+        self.assertFalse(RollupDirtyHour.objects.exists())
+
+
+class RetentionOrderCheckTest(TestCase):
+    """Сроки хранения растут от сырых значений к часовым агрегатам"""
+
+    def ids(self, **retention):
+        with override_settings(**retention):
+            return [error.id for error in check_retention_order(None)]
+
+    def test_order(self):
+        self.assertEqual(self.ids(TAGVALUE_RETENTION_DAYS=0, ROLLUP_1M_RETENTION_DAYS=0, ROLLUP_1H_RETENTION_DAYS=0), [])
+        self.assertEqual(self.ids(TAGVALUE_RETENTION_DAYS=30, ROLLUP_1M_RETENTION_DAYS=90, ROLLUP_1H_RETENTION_DAYS=0), [])
+        self.assertEqual(self.ids(TAGVALUE_RETENTION_DAYS=0, ROLLUP_1M_RETENTION_DAYS=90, ROLLUP_1H_RETENTION_DAYS=0), ['scada.E001'])
+        self.assertEqual(self.ids(TAGVALUE_RETENTION_DAYS=30, ROLLUP_1M_RETENTION_DAYS=90, ROLLUP_1H_RETENTION_DAYS=60), ['scada.E002'])
@@ -0,0 +1,57 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIClient
+
+from scada.models import ObjectType, PipelineObject, Tag, TagCurrentValue, TagTemplate
+
+
+def create_tags(object_type_name, objects, templates):
+    """objects объектов нового типа с templates шаблонами тегов и текущими значениями"""
+    object_type = ObjectType.objects.create(name=object_type_name)
+    tag_templates = [
+        TagTemplate.objects.create(
+            object_type=object_type, name_template=f'T{number}_{{index}}',
+            description_template=f'Тег {number} объекта {{index}}', engineering_units='МПа',
+        )
+        for number in range(templates)
+    ]
+    now = timezone.now()
+    for number in range(objects):
+        pipeline_object = PipelineObject.objects.create(
+            object_type=object_type, name=f'{object_type_name} {number}', index=f'{object_type_name}{number:03d}',
+        )
+        for template in tag_templates:
+            tag = Tag.objects.create(tag_template=template, pipeline_object=pipeline_object)
+            TagCurrentValue.objects.create(tag=tag, value=number, quality=100, timestamp=now)
+
+
+class TagListQueryCountTest(TestCase):
+    """Список /api/tags/: число запросов не зависит от размера страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('operator')
+        create_tags('НПС', objects=10, templates=3)
+        create_tags('Резервуар', objects=5, templates=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_list_queries(self, page_size):
+        with mock.patch.object(PageNumberPagination, 'page_size', page_size):
+            # COUNT для пагинации и один SELECT с объектом, типом и текущим значением
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), page_size)
+        self.assertTrue(all(row['current_value'] is not None for row in results))
+
+    def test_query_count_independent_of_page_size(self):
+        self.assert_list_queries(5)
+        self.assert_list_queries(40)
@@ -0,0 +1,152 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from scada.models import ObjectType, PipelineObject, Tag, TagCurrentValue, TagRollup, TagTemplate, TagValue
+from scada.rollups import HOUR, MINUTE, build_rollups
+from scada.trends import (
+    TrendLimitError, aggregate_buckets, aligned_matrix, lttb, lttb_series, pipeline_profile, range_statistics,
+)
+
+START = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def create_tag(object_type, template, index, km_mark=None):
+    pipeline_object = PipelineObject.objects.create(
+        object_type=object_type, name=f'НПС {index}', index=index, km_mark=km_mark,
+    )
+    return Tag.objects.create(tag_template=template, pipeline_object=pipeline_object)
+
+
+class LttbTest(SimpleTestCase):
+    """Выбор точек LTTB"""
+
+    def test_keeps_edges_and_spike(self):
+        x = np.arange(1000, dtype=np.float64)
+        y = np.zeros(1000)
+        y[437] = 50.0
+        indices = lttb(x, y, 20)
+        self.assertEqual(len(indices), 20)
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
+        self.assertIn(437, indices)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+
+    def test_short_series_unchanged(self):
+        x = np.arange(5, dtype=np.float64)
+        self.assertEqual(lttb(x, x, 10).tolist(), [0, 1, 2, 3, 4])
+
+
+class TrendDataTest(TestCase):
+    """Ряды трендов по сырым значениям и по агрегатам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        object_type = ObjectType.objects.create(name='НПС')
+        template = TagTemplate.objects.create(
+            object_type=object_type, name_template='FLOW_{index}', description_template='Расход',
+        )
+        cls.flow = create_tag(object_type, template, '001')
+        cls.other = create_tag(object_type, template, '002')
+        # Два часа раз в 10 с: пила 0..59 и выброс 500 на 123-м отсчёте
+        values = [
+            TagValue(tag=cls.flow, value=float(index % 60), timestamp=START + timedelta(seconds=10 * index))
+            for index in range(720)
+        ]
+        values[123].value = 500.0
+        TagValue.objects.bulk_create(values)
+        TagValue.objects.bulk_create([
+            TagValue(tag=cls.other, value=float(minute), timestamp=START + timedelta(minutes=minute))
+            for minute in (0, 10, 20)
+        ])
+
+    def raw_statistics(self, start, end):
+        values = list(
+            TagValue.objects.filter(tag=self.flow, timestamp__gte=start, timestamp__lt=end)
+            .order_by('timestamp').values_list('value', flat=True)
+        )
+        return {
+            'min': min(values), 'max': max(values), 'count': len(values),
+            'avg': math.fsum(values) / len(values), 'first': values[0], 'last': values[-1],
+        }
+
+    def test_statistics_from_rollups_match_raw(self):
+        now = START + timedelta(hours=3)
+        build_rollups(MINUTE, now=now)
+        build_rollups(HOUR, now=now)
+        self.assertEqual(TagRollup.objects.filter(tag=self.flow, interval=HOUR).count(), 2)
+        start, end = START + timedelta(seconds=95), START + timedelta(seconds=7005)
+        statistics = range_statistics([self.flow.pk], start, end)[self.flow.pk]
+        expected = self.raw_statistics(start, end)
+        self.assertAlmostEqual(statistics.pop('avg'), expected.pop('avg'))
+        self.assertEqual(statistics, {key: expected[key] for key in statistics})
+
+    def test_aggregate_buckets_use_rollups(self):
+        build_rollups(MINUTE, now=START + timedelta(hours=3))
+        end = START + timedelta(hours=2)
+        series, interval = aggregate_buckets([self.flow.pk], START, end, 12)
+        self.assertEqual(interval, MINUTE)
+        self.assertEqual(sum(series[self.flow.pk]['count']), 720)
+        self.assertEqual(max(series[self.flow.pk]['max']), 500.0)
+        raw_series, raw_interval = aggregate_buckets([self.flow.pk], START, end, 720)
+        self.assertIsNone(raw_interval)
+        self.assertEqual(sum(raw_series[self.flow.pk]['count']), 720)
+
+    @override_settings(TREND_LTTB_OVERSAMPLE=4)
+    def test_lttb_series_keeps_peak(self):
+        series, interval = lttb_series([self.flow.pk, self.other.pk], START, START + timedelta(hours=2), 30)
+        self.assertIsNone(interval)
+        flow = series[self.flow.pk]
+        self.assertLessEqual(len(flow['value']), 30)
+        self.assertIn(500.0, flow['value'])
+        self.assertEqual(flow['timestamp'], sorted(flow['timestamp']))
+        self.assertEqual(series[self.other.pk]['value'], [0.0, 10.0, 20.0])
+
+    def test_aligned_previous_and_linear(self):
+        start = START + timedelta(minutes=5)
+        grid, matrix = aligned_matrix([self.other.pk], start, START + timedelta(minutes=30), 300)
+        self.assertEqual(len(grid), 5)
+        # 5 мин — значение до начала интервала (0), дальше ступенька
+        self.assertEqual(matrix[:, 0].tolist(), [0.0, 10.0, 10.0, 20.0, 20.0])
+        _, linear = aligned_matrix([self.other.pk], start, START + timedelta(minutes=30), 300, fill='linear')
+        self.assertEqual(linear[:3, 0].tolist(), [5.0, 10.0, 15.0])
+        self.assertTrue(np.isnan(linear[4, 0]))
+
+    @override_settings(TREND_ALIGNED_MAX_ROWS=100)
+    def test_aligned_row_limit(self):
+        with self.assertRaises(TrendLimitError):
+            aligned_matrix([self.flow.pk], START, START + timedelta(hours=2), 60)
+
+
+class PipelineProfileTest(TestCase):
+    """Профиль вдоль трассы: порядок по км, текущие и исторические значения"""
+
+    @classmethod
+    def setUpTestData(cls):
+        object_type = ObjectType.objects.create(name='НПС')
+        cls.template = TagTemplate.objects.create(
+            object_type=object_type, name_template='PRESSURE_{index}', description_template='Давление',
+        )
+        cls.far = create_tag(object_type, cls.template, '002', km_mark=120.5)
+        cls.near = create_tag(object_type, cls.template, '001', km_mark=15.0)
+        create_tag(object_type, cls.template, '003')
+        TagCurrentValue.objects.create(tag=cls.near, value=5.0, quality=100, timestamp=START + timedelta(hours=1))
+        TagValue.objects.bulk_create([
+            TagValue(tag=cls.near, value=4.0, timestamp=START),
+            TagValue(tag=cls.near, value=5.0, timestamp=START + timedelta(hours=1)),
+            TagValue(tag=cls.far, value=3.0, timestamp=START + timedelta(minutes=30)),
+        ])
+
+    def test_current_values(self):
+        rows = pipeline_profile([self.template.pk])
+        self.assertEqual([row['tag_id'] for row in rows], [self.near.pk, self.far.pk])
+        self.assertEqual([row['value'] for row in rows], [5.0, None])
+
+    def test_values_at_moment(self):
+        rows = pipeline_profile([self.template.pk], at=START + timedelta(minutes=45))
+        self.assertEqual([row['value'] for row in rows], [4.0, 3.0])
+
+    def test_km_range(self):
+        rows = pipeline_profile([self.template.pk], km_min=100)
+        self.assertEqual([row['km_mark'] for row in rows], [120.5])
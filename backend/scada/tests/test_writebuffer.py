@@ -0,0 +1,46 @@
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from scada.cache import bump_config_version
+from scada.models import ObjectType, PipelineObject, Tag, TagTemplate, TagValue
+from scada.writebuffer import WriteBuffer
+
+
+class ReplayCheckpointTest(TestCase):
+    """Пакет, зафиксированный до обновления файла checkpoint, не переносится повторно"""
+
+    @classmethod
+    def setUpTestData(cls):
+        object_type = ObjectType.objects.create(name='НПС')
+        template = TagTemplate.objects.create(
+            object_type=object_type, name_template='FLOW_{index}', description_template='Расход',
+        )
+        pipeline_object = PipelineObject.objects.create(object_type=object_type, name='НПС 1', index='001')
+        cls.tag = Tag.objects.create(tag_template=template, pipeline_object=pipeline_object)
+
+    def setUp(self):
+        bump_config_version()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.buffer = WriteBuffer(directory.name)
+        self.buffer._start_replayer = lambda: None
+        start = timezone.now()
+        values = [
+            TagValue(tag_id=self.tag.pk, value=float(second), quality=100, timestamp=start + timedelta(seconds=second))
+            for second in range(10)
+        ]
+        self.buffer.append(values, values)
+
+    def test_failure_after_commit_does_not_duplicate(self):
+        with mock.patch.object(WriteBuffer, '_write_checkpoint', side_effect=OSError('диск заполнен')):
+            with self.assertRaises(OSError):
+                self.buffer.replay()
+        self.assertEqual(TagValue.objects.count(), 10)
+
+        self.assertEqual(self.buffer.replay(), 0)
+        self.assertEqual(TagValue.objects.count(), 10)
+        self.assertEqual(self.buffer.depth(), 0)
@@ -0,0 +1,114 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max
+
+from .cache import metadata
+from .models import ObjectType, PipelineObject, Tag, TagCurrentValue
+
+logger = logging.getLogger('scada.tree')
+
+# Структура дерева в общем кэше, по версии конфигурации
+TREE_KEY = 'scada:asset_tree:{}'
+
+_OBJECT_FIELDS = ('id', 'object_type_id', 'name', 'index', 'location', 'km_mark', 'description')
+_TAG_FIELDS = (
+    'id', 'pipeline_object_id', 'name', 'description', 'data_type',
+    'engineering_units', 'min_value', 'max_value',
+)
+
+
+def build_structure():
+    """
+    Дерево тип объекта → объект → тег (неархивный) без текущих значений.
+    Три запроса независимо от размера дерева, в одной транзакции. При READ
+    COMMITTED запросы видят разные снимки: объект или тег, родитель которого
+    создан между запросами, пропускается — изменение конфигурации меняет её
+    версию, и следующий запрос строит дерево заново.
+    """
+    types = []
+    by_type = {}
+    by_object = {}
+    with transaction.atomic():
+        for row in ObjectType.objects.order_by('name').values('id', 'name', 'description'):
+            row['objects'] = by_type[row['id']] = []
+            types.append(row)
+        for row in PipelineObject.objects.order_by(F('km_mark').asc(nulls_last=True), 'index').values(*_OBJECT_FIELDS):
+            objects = by_type.get(row.pop('object_type_id'))
+            if objects is not None:
+                row['tags'] = by_object[row['id']] = []
+                objects.append(row)
+        for row in Tag.objects.filter(is_archived=False).order_by('name').values(*_TAG_FIELDS):
+            tags = by_object.get(row.pop('pipeline_object_id'))
+            if tags is not None:
+                tags.append(row)
+    return types
+
+
+class AssetTree:
+    """
+    Кэш структуры дерева активов. Структура меняется только вместе с
+    конфигурацией, поэтому хранится по её версии (см. cache.py): в памяти
+    процесса и в общем кэше, чтобы другие процессы не строили её заново.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._types = None
+
+    def structure(self):
+        """(версия конфигурации, список типов объектов с объектами и тегами)"""
+        version = metadata.version
+        with self._lock:
+            if self._version == version:
+                return version, self._types
+        key = TREE_KEY.format(version)
+        try:
+            types = cache.get(key)
+        except Exception as exc:
+            logger.warning('Общий кэш недоступен (%s): дерево строится без него', exc)
+            types = None
+        if types is None:
+            types = build_structure()
+            try:
+                cache.set(key, types, timeout=settings.ASSET_TREE_CACHE_SECONDS)
+            except Exception as exc:
+                logger.warning('Общий кэш недоступен (%s): дерево не сохранено', exc)
+        with self._lock:
+            self._version, self._types = version, types
+        return version, types
+
+
+asset_tree = AssetTree()
+
+
+def values_stamp():
+    """
+    Отметка последнего изменения текущих значений: MAX(updated_at) по
+    индексу читает одну запись индекса, а не всю таблицу. Вместе с версией
+    конфигурации образует ETag дерева со значениями.
+    """
+    updated = TagCurrentValue.objects.aggregate(updated=Max('updated_at'))['updated']
+    return int(updated.timestamp() * 1_000_000) if updated else 0
+
+
+def with_current_values(types):
+    """Копия дерева с текущими значениями тегов (один запрос)"""
+    current = {
+        row[0]: row[1:] for row in TagCurrentValue.objects.values_list('tag_id', 'value', 'quality', 'timestamp')
+    }
+    result = []
+    for object_type in types:
+        objects = []
+        for pipeline_object in object_type['objects']:
+            tags = []
+            for tag in pipeline_object['tags']:
+                value, quality, timestamp = current.get(tag['id'], (None, None, None))
+                tags.append({**tag, 'current_value': value, 'current_quality': quality, 'current_timestamp': timestamp})
+            objects.append({**pipeline_object, 'tags': tags})
+        result.append({**object_type, 'objects': objects})
+    return result
@@ -0,0 +1,413 @@
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, F, FloatField, Func, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Floor
+
+from . import rollups
+from .models import Tag, TagRollup, TagValue
+
+# Число граничных моментов в одном запросе (лимит параметров SQLite)
+EDGE_CHUNK_SIZE = 5000
+# Строк за одно чтение курсора при потоковой выборке в массивы NumPy
+ITERATOR_CHUNK_SIZE = 20000
+# Пара (время, значение) — элемент массива np.fromiter
+_POINT = np.dtype((np.float64, 2))
+
+
+class TrendLimitError(ValueError):
+    """Запрос истории превышает допустимый объём данных"""
+
+
+class Epoch(Func):
+    """Unix-время (секунды, с дробной частью) для поля DateTimeField"""
+    output_field = FloatField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='EXTRACT(EPOCH FROM %(expressions)s)', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, template='ROUND((julianday(%(expressions)s) - 2440587.5) * 86400.0, 3)', **extra_context
+        )
+
+
+def _to_datetime(epoch):
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+def bucket_aggregates(tag_ids, start, end, origin, width, interval=None):
+    """
+    Группирует значения [start, end) в корзины ширины width секунд от origin.
+    Источник — сырые TagValue (interval=None) или агрегаты TagRollup данного
+    интервала. tag_ids=None — все теги. Возвращает словарь
+    (tag_id, номер корзины) -> min/max/total/count/first/last.
+    """
+    if interval is None:
+        model, time_field, first_field, last_field = TagValue, 'timestamp', 'value', 'value'
+        queryset = TagValue.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        totals = dict(agg_min=Min('value'), agg_max=Max('value'), agg_total=Sum('value'), agg_count=Count('id'))
+    else:
+        model, time_field, first_field, last_field = TagRollup, 'bucket', 'first', 'last'
+        queryset = TagRollup.objects.filter(interval=interval, bucket__gte=start, bucket__lt=end)
+        totals = dict(
+            agg_min=Min('min'), agg_max=Max('max'),
+            agg_total=Sum(F('avg') * F('count'), output_field=FloatField()), agg_count=Sum('count'),
+        )
+    if tag_ids is not None:
+        queryset = queryset.filter(tag_id__in=tag_ids)
+
+    rows = list(
+        queryset
+        .annotate(bucket_index=Floor((Epoch(time_field) - origin) / width))
+        .values('tag_id', 'bucket_index')
+        .annotate(first_ts=Min(time_field), last_ts=Max(time_field), **totals)
+        .order_by()
+    )
+
+    # Значения на границах корзин — запросами по индексу (tag_id, время)
+    edges = {}
+    edge_times = sorted({row['first_ts'] for row in rows} | {row['last_ts'] for row in rows})
+    for offset in range(0, len(edge_times), EDGE_CHUNK_SIZE):
+        edge_queryset = model.objects.filter(**{f'{time_field}__in': edge_times[offset:offset + EDGE_CHUNK_SIZE]})
+        if interval is not None:
+            edge_queryset = edge_queryset.filter(interval=interval)
+        if tag_ids is not None:
+            edge_queryset = edge_queryset.filter(tag_id__in=tag_ids)
+        for tag_id, moment, first, last in edge_queryset.values_list('tag_id', time_field, first_field, last_field):
+            edges[(tag_id, moment)] = (first, last)
+
+    result = {}
+    for row in rows:
+        tag_id = row['tag_id']
+        result[(tag_id, int(row['bucket_index']))] = {
+            'min': row['agg_min'],
+            'max': row['agg_max'],
+            'total': row['agg_total'],
+            'count': row['agg_count'],
+            'first_ts': row['first_ts'],
+            'first': edges.get((tag_id, row['first_ts']), (None, None))[0],
+            'last_ts': row['last_ts'],
+            'last': edges.get((tag_id, row['last_ts']), (None, None))[1],
+        }
+    return result
+
+
+def merge_aggregates(target, source):
+    """Добавляет корзины source в target, объединяя совпадающие"""
+    for key, row in source.items():
+        known = target.get(key)
+        if known is None:
+            target[key] = row
+            continue
+        known['min'] = min(known['min'], row['min'])
+        known['max'] = max(known['max'], row['max'])
+        known['total'] += row['total']
+        known['count'] += row['count']
+        if row['first_ts'] < known['first_ts']:
+            known['first_ts'], known['first'] = row['first_ts'], row['first']
+        if row['last_ts'] > known['last_ts']:
+            known['last_ts'], known['last'] = row['last_ts'], row['last']
+    return target
+
+
+def _tier_split(interval, start, end):
+    """Граница между агрегатами уровня interval и сырыми значениями"""
+    if interval is None:
+        return start
+    built = rollups.built_until().get(interval)
+    if built is None:
+        return start
+    return max(start, min(rollups.align_down(built, interval), end))
+
+
+def aggregate_buckets(tag_ids, start, end, buckets):
+    """
+    Делит интервал [start, end) на buckets равных корзин и считает для каждой
+    корзины min/max/avg/count/first/last. Группировка выполняется в БД,
+    в Python возвращается не более buckets строк на тег.
+
+    Если корзина не уже минуты или часа, до отметки построения агрегатов
+    данные читаются из самого грубого подходящего уровня TagRollup, после неё —
+    из сырых значений. Возвращает пару (словарь tag_id -> словарь столбцов,
+    использованный интервал агрегатов или None).
+    """
+    width = (end - start).total_seconds() / buckets
+    origin = start.timestamp()
+    interval = rollups.select_tier(width)
+    split = _tier_split(interval, start, end)
+    if split == start:
+        interval = None
+
+    aggregates = {}
+    if interval is not None:
+        aggregates = bucket_aggregates(tag_ids, start, split, origin, width, interval)
+    merge_aggregates(aggregates, bucket_aggregates(tag_ids, split, end, origin, width))
+
+    series = {tag_id: {key: [] for key in ('timestamp', 'min', 'max', 'avg', 'count', 'first', 'last')}
+              for tag_id in tag_ids}
+    for (tag_id, index), row in sorted(aggregates.items()):
+        columns = series[tag_id]
+        columns['timestamp'].append(_to_datetime(origin + index * width))
+        columns['min'].append(row['min'])
+        columns['max'].append(row['max'])
+        columns['avg'].append(row['total'] / row['count'])
+        columns['count'].append(row['count'])
+        columns['first'].append(row['first'])
+        columns['last'].append(row['last'])
+    return series, interval
+
+
+def range_statistics(tag_ids, start, end):
+    """
+    Точные min/max/avg/count/first/last по тегам за [start, end).
+
+    Интервал раскладывается на целые часы из часовых агрегатов, целые минуты
+    по краям из минутных и остатки из сырых значений, поэтому число читаемых
+    строк почти не зависит от длины интервала.
+    """
+    built = rollups.built_until()
+    origin = start.timestamp()
+    width = max((end - start).total_seconds(), 1.0)
+
+    def plan(low, high, tiers):
+        if not tiers:
+            return [(low, high, None)]
+        interval, rest = tiers[0], tiers[1:]
+        until = built.get(interval)
+        inner_low = rollups.align_up(low, interval)
+        inner_high = rollups.align_down(min(high, until), interval) if until else inner_low
+        if inner_low >= inner_high:
+            return plan(low, high, rest)
+        return plan(low, inner_low, rest) + [(inner_low, inner_high, interval)] + plan(inner_high, high, rest)
+
+    aggregates = {}
+    for low, high, interval in plan(start, end, rollups.TIERS):
+        if low < high:
+            merge_aggregates(aggregates, bucket_aggregates(tag_ids, low, high, origin, width, interval))
+
+    statistics = {}
+    for (tag_id, _), row in aggregates.items():
+        statistics[tag_id] = {
+            'min': row['min'],
+            'max': row['max'],
+            'avg': row['total'] / row['count'],
+            'count': row['count'],
+            'first': row['first'],
+            'last': row['last'],
+        }
+    return statistics
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: индексы threshold точек, лучше всего
+    сохраняющих форму ряда. Внутри корзины выбор векторизован, цикл идёт
+    только по корзинам.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    k = threshold - 2
+    bounds = np.linspace(1, n - 1, k + 1).astype(np.int64)
+    counts = np.diff(bounds)
+    avg_x = np.add.reduceat(x[:n - 1], bounds[:-1]) / counts
+    avg_y = np.add.reduceat(y[:n - 1], bounds[:-1]) / counts
+    next_x = np.append(avg_x[1:], x[n - 1])
+    next_y = np.append(avg_y[1:], y[n - 1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    for j in range(k):
+        a = selected[j]
+        lo, hi = bounds[j], bounds[j + 1]
+        area = np.abs(
+            (x[a] - next_x[j]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[j] - y[a])
+        )
+        selected[j + 1] = lo + int(np.argmax(area))
+    return selected
+
+
+def _points(queryset):
+    """Пары (время, значение) запроса в массив (n, 2) без промежуточного списка"""
+    return np.fromiter(queryset.iterator(chunk_size=ITERATOR_CHUNK_SIZE), dtype=_POINT)
+
+
+def _extreme_points(tag_ids, start, end, buckets):
+    """
+    Предварительное прореживание в БД: [start, end) делится на buckets корзин,
+    на корзину — две точки, минимум и максимум (в середине первой и второй
+    половины корзины; первым идёт экстремум, ближе к которому первое значение
+    корзины). Возвращает словарь tag_id -> массив (n, 2).
+    """
+    width = (end - start).total_seconds() / buckets
+    origin = start.timestamp()
+    points = {tag_id: [] for tag_id in tag_ids}
+    for (tag_id, index), row in sorted(bucket_aggregates(tag_ids, start, end, origin, width).items()):
+        low, high = row['min'], row['max']
+        if row['first'] is not None and abs(row['first'] - high) < abs(row['first'] - low):
+            low, high = high, low
+        left = origin + index * width
+        points[tag_id] += ((left + width / 4, low), (left + 3 * width / 4, high))
+    return {tag_id: np.array(rows, dtype=np.float64).reshape(-1, 2) for tag_id, rows in points.items()}
+
+
+def lttb_series(tag_ids, start, end, points):
+    """
+    Прореживание по LTTB: для каждого тега возвращается не более points
+    точек ряда. Временные метки читаются из БД уже в виде чисел, строки
+    идут потоком прямо в массивы NumPy.
+
+    Если на точку приходится не меньше минуты, до отметки построения агрегатов
+    вместо сырых значений берутся средние TagRollup (в середине интервала).
+    Если сырых значений тега больше TREND_LTTB_OVERSAMPLE × points, они
+    предварительно прореживаются в БД до минимума и максимума в
+    TREND_LTTB_OVERSAMPLE × points корзинах: в память не читается весь ряд.
+    Возвращает пару (ряды, использованный интервал агрегатов или None).
+    """
+    interval = rollups.select_tier((end - start).total_seconds() / points)
+    split = _tier_split(interval, start, end)
+    if split == start:
+        interval = None
+
+    raw_limit = settings.TREND_LTTB_OVERSAMPLE * points
+    counts = dict(
+        TagValue.objects
+        .filter(tag_id__in=tag_ids, timestamp__gte=split, timestamp__lt=end)
+        .values('tag_id').annotate(rows=Count('id')).order_by().values_list('tag_id', 'rows')
+    )
+    dense = [tag_id for tag_id in tag_ids if counts.get(tag_id, 0) > raw_limit]
+    extremes = _extreme_points(dense, split, end, max(1, raw_limit // 2)) if dense else {}
+
+    series = {}
+    for tag_id in tag_ids:
+        parts = []
+        if interval is not None:
+            parts.append(_points(
+                TagRollup.objects
+                .filter(tag_id=tag_id, interval=interval, bucket__gte=start, bucket__lt=split)
+                .order_by('bucket')
+                .values_list(Epoch('bucket') + interval / 2, 'avg')
+            ))
+        if tag_id in extremes:
+            parts.append(extremes[tag_id])
+        elif counts.get(tag_id):
+            parts.append(_points(
+                TagValue.objects
+                .filter(tag_id=tag_id, timestamp__gte=split, timestamp__lt=end)
+                .order_by('timestamp')
+                .values_list(Epoch('timestamp'), 'value')
+            ))
+        data = np.concatenate(parts) if parts else np.empty((0, 2))
+        x, y = data[:, 0], data[:, 1]
+        indices = lttb(x, y, points)
+        series[tag_id] = {
+            'timestamp': [_to_datetime(epoch) for epoch in x[indices]],
+            'value': y[indices].tolist(),
+        }
+    return series, interval
+
+
+def _edge_values(tag_ids, start, end):
+    """
+    Последнее значение до start и первое значение начиная с end по каждому тегу —
+    одним запросом с коррелированными подзапросами по индексу (tag_id, timestamp).
+    """
+    before = TagValue.objects.filter(tag_id=OuterRef('pk'), timestamp__lt=start).order_by('-timestamp')
+    after = TagValue.objects.filter(tag_id=OuterRef('pk'), timestamp__gte=end).order_by('timestamp')
+    rows = Tag.objects.filter(pk__in=tag_ids).annotate(
+        before_ts=Subquery(before.values('timestamp')[:1]),
+        before_value=Subquery(before.values('value')[:1]),
+        after_ts=Subquery(after.values('timestamp')[:1]),
+        after_value=Subquery(after.values('value')[:1]),
+    ).values_list('pk', 'before_ts', 'before_value', 'after_ts', 'after_value')
+    return {pk: (before_ts, before_value, after_ts, after_value)
+            for pk, before_ts, before_value, after_ts, after_value in rows}
+
+
+def aligned_matrix(tag_ids, start, end, step, fill='previous'):
+    """
+    Значения тегов на общей сетке start, start + step, ... (< end).
+
+    fill='previous' — последнее известное значение не позже узла сетки
+    (np.searchsorted), fill='linear' — линейная интерполяция между соседними
+    значениями (np.interp). Для краёв учитываются значения до start и после end.
+    Узлы, для которых значения нет, равны NaN.
+    Сырые значения читаются потоком по одному тегу; если их в диапазоне больше
+    TREND_ALIGNED_MAX_ROWS, выбрасывается TrendLimitError.
+    Возвращает пару (массив узлов в секундах Unix, матрица узлы × теги).
+    """
+    origin = start.timestamp()
+    count = int(np.ceil((end.timestamp() - origin) / step))
+    grid = origin + np.arange(count) * step
+
+    values = TagValue.objects.filter(tag_id__in=tag_ids, timestamp__gte=start, timestamp__lt=end)
+    rows = values.aggregate(rows=Count('id'))['rows']
+    if rows > settings.TREND_ALIGNED_MAX_ROWS:
+        raise TrendLimitError(
+            f'В диапазоне {rows} значений, допускается не больше {settings.TREND_ALIGNED_MAX_ROWS}: '
+            'сократите период или число тегов'
+        )
+    edges = _edge_values(tag_ids, start, end)
+
+    matrix = np.full((count, len(tag_ids)), np.nan)
+    for column, tag_id in enumerate(tag_ids):
+        data = _points(values.filter(tag_id=tag_id).order_by('timestamp').values_list(Epoch('timestamp'), 'value'))
+        x, y = data[:, 0], data[:, 1]
+        before_ts, before_value, after_ts, after_value = edges.get(tag_id, (None, None, None, None))
+        if before_ts is not None:
+            x = np.insert(x, 0, before_ts.timestamp())
+            y = np.insert(y, 0, before_value)
+        if fill == 'linear':
+            if after_ts is not None:
+                x = np.append(x, after_ts.timestamp())
+                y = np.append(y, after_value)
+            if len(x):
+                matrix[:, column] = np.interp(grid, x, y, left=np.nan, right=np.nan)
+        else:
+            indices = np.searchsorted(x, grid, side='right') - 1
+            valid = indices >= 0
+            matrix[valid, column] = y[indices[valid]]
+    return grid, matrix
+
+
+def pipeline_profile(template_ids, at=None, km_min=None, km_max=None):
+    """
+    Профиль вдоль трассы: значение тега шаблонов template_ids на каждом
+    объекте с километровой отметкой (в пределах km_min..km_max), по
+    возрастанию км — одним запросом по индексу km_mark.
+
+    at=None — текущие значения; иначе последнее значение не позже at
+    (коррелированные подзапросы по индексу (tag_id, timestamp), как в
+    _edge_values). Теги без значения возвращаются с value=None.
+    """
+    tags = Tag.objects.filter(
+        tag_template_id__in=template_ids, is_archived=False, pipeline_object__km_mark__isnull=False,
+    )
+    if km_min is not None:
+        tags = tags.filter(pipeline_object__km_mark__gte=km_min)
+    if km_max is not None:
+        tags = tags.filter(pipeline_object__km_mark__lte=km_max)
+    if at is None:
+        tags = tags.annotate(
+            value_at=F('current__value'), quality_at=F('current__quality'), timestamp_at=F('current__timestamp'),
+        )
+    else:
+        last = TagValue.objects.filter(tag_id=OuterRef('pk'), timestamp__lte=at).order_by('-timestamp')
+        tags = tags.annotate(
+            value_at=Subquery(last.values('value')[:1]),
+            quality_at=Subquery(last.values('quality')[:1]),
+            timestamp_at=Subquery(last.values('timestamp')[:1]),
+        )
+    rows = tags.order_by('pipeline_object__km_mark', 'pipeline_object__index', 'name').values_list(
+        'pipeline_object__km_mark', 'pipeline_object_id', 'pipeline_object__name', 'pipeline_object__index',
+        'pk', 'name', 'value_at', 'quality_at', 'timestamp_at',
+    )
+    fields = (
+        'km_mark', 'object_id', 'object_name', 'object_index',
+        'tag_id', 'tag_name', 'value', 'quality', 'timestamp',
+    )
+    return [dict(zip(fields, row)) for row in rows]
@@ -10,6 +10,8 @@ router.register(r'tags', views.TagViewSet)
 router.register(r'tag-values', views.TagValueViewSet)
 router.register(r'alarm-definitions', views.AlarmDefinitionViewSet)
 router.register(r'alarms', views.AlarmViewSet)
+router.register(r'modbus-devices', views.ModbusDeviceViewSet)
+router.register(r'modbus-points', views.ModbusPointViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
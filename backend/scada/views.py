@@ -1,15 +1,44 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from django.utils import timezone
-from django.db.models import Q
-from .models import ObjectType, PipelineObject, TagTemplate, Tag, TagValue, AlarmDefinition, Alarm
+from django.db import transaction
+from django.db.models import Count, F, Q
+from .alarms import OPEN_STATES, record_transitions
+from .cache import metadata
+from .export import stream_csv, stream_npz
+from .ingest import IngestError, ingest_values
+from .models import ObjectType, PipelineObject, TagTemplate, Tag, TagCurrentValue, TagValue, AlarmDefinition, Alarm, ModbusDevice, ModbusPoint
+from .pagination import AlarmPagination, TagValuePagination
+from .provisioning import ProvisioningError, provision_tags
 from .serializers import (
     ObjectTypeSerializer, PipelineObjectSerializer, TagTemplateSerializer,
-    TagSerializer, TagValueSerializer, AlarmDefinitionSerializer, AlarmSerializer,
-    AlarmAcknowledgeSerializer
+    TagSerializer, TagValueSerializer, TagValueCreateSerializer, AlarmDefinitionSerializer, AlarmSerializer,
+    AlarmAcknowledgeSerializer, AlarmBulkAcknowledgeSerializer, AlarmShelveSerializer, AlignedQuerySerializer, ExportQuerySerializer, KmRangeQuerySerializer, ProfileQuerySerializer, ProvisionSerializer,
+    ModbusDeviceSerializer, ModbusPointSerializer,
+    TagRangeQuerySerializer, TrendQuerySerializer
 )
+from .tree import asset_tree, values_stamp, with_current_values
+from .trends import TrendLimitError, aggregate_buckets, aligned_matrix, lttb_series, pipeline_profile, range_statistics
+
+def filter_km_range(queryset, params, field):
+    """Фильтр ?km_min=&km_max= по километровой отметке (поле field)"""
+    query = KmRangeQuerySerializer(data=params)
+    query.is_valid(raise_exception=True)
+    if 'km_min' in query.validated_data:
+        queryset = queryset.filter(**{f'{field}__gte': query.validated_data['km_min']})
+    if 'km_max' in query.validated_data:
+        queryset = queryset.filter(**{f'{field}__lte': query.validated_data['km_max']})
+    return queryset
 
 class ObjectTypeViewSet(viewsets.ModelViewSet):
     queryset = ObjectType.objects.all()
@@ -17,7 +46,7 @@ class ObjectTypeViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 class PipelineObjectViewSet(viewsets.ModelViewSet):
-    queryset = PipelineObject.objects.all()
+    queryset = PipelineObject.objects.select_related('object_type')
     serializer_class = PipelineObjectSerializer
     permission_classes = [IsAuthenticated]
     
@@ -26,15 +55,74 @@ class PipelineObjectViewSet(viewsets.ModelViewSet):
         object_type = self.request.query_params.get('object_type')
         if object_type:
             queryset = queryset.filter(object_type_id=object_type)
-        return queryset
+        return filter_km_range(queryset, self.request.query_params, 'km_mark')
+
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """
+        Дерево активов: типы объектов → объекты → теги с текущими
+        значениями, без пагинации. Структура кэшируется по версии
+        конфигурации; ETag — версия конфигурации и отметка изменения
+        текущих значений, при совпадении с If-None-Match ответ 304.
+        values=0 — только структура (ETag меняется лишь с конфигурацией).
+        """
+        include_values = request.query_params.get('values', '1').lower() not in ('0', 'false', 'no')
+        object_type = request.query_params.get('object_type')
+        if object_type is not None and not object_type.isdigit():
+            return Response({'error': 'object_type должен быть числом'}, status=status.HTTP_400_BAD_REQUEST)
+
+        stamp = f'-{values_stamp()}' if include_values else ''
+        etag = f'"tree-{metadata.version}{stamp}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            version, types = asset_tree.structure()
+            etag = f'"tree-{version}{stamp}"'
+            if object_type is not None:
+                types = [item for item in types if item['id'] == int(object_type)]
+            response = Response(with_current_values(types) if include_values else types)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @action(detail=False, methods=['get'])
+    def profile(self, request):
+        """
+        Профиль вдоль трассы: значение тега выбранного шаблона на каждом
+        объекте по возрастанию км, текущее или на момент at.
+        """
+        query = ProfileQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        points = pipeline_profile(
+            params['template'], at=params.get('at'), km_min=params.get('km_min'), km_max=params.get('km_max'),
+        )
+        return Response({
+            'templates': params['template'],
+            'at': params.get('at'),
+            'count': len(points),
+            'points': points,
+        })
 
 class TagTemplateViewSet(viewsets.ModelViewSet):
-    queryset = TagTemplate.objects.all()
+    queryset = TagTemplate.objects.select_related('object_type')
     serializer_class = TagTemplateSerializer
     permission_classes = [IsAuthenticated]
 
+    @action(detail=False, methods=['post'])
+    def provision(self, request):
+        serializer = ProvisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = provision_tags(**serializer.validated_data)
+        except ProvisioningError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(result)
+
 class TagViewSet(viewsets.ModelViewSet):
-    queryset = Tag.objects.filter(is_archived=False)
+    queryset = Tag.objects.filter(is_archived=False).select_related(
+        'pipeline_object__object_type', 'current'
+    )
     serializer_class = TagSerializer
     permission_classes = [IsAuthenticated]
     
@@ -48,15 +136,54 @@ class TagViewSet(viewsets.ModelViewSet):
         if object_type:
             queryset = queryset.filter(pipeline_object__object_type_id=object_type)
         
-        return queryset
+        return filter_km_range(queryset, self.request.query_params, 'pipeline_object__km_mark')
+    
+    @action(detail=False, methods=['get'], url_path='compression-stats')
+    def compression_stats(self, request):
+        stats = TagCurrentValue.objects.filter(
+            tag__in=self.get_queryset()
+        ).order_by('tag__name').values(
+            'tag_id', 'tag__name', 'tag__compression', 'raw_count', 'stored_count'
+        )
+        page = self.paginate_queryset(stats)
+        return self.get_paginated_response([
+            {
+                'tag_id': row['tag_id'],
+                'tag_name': row['tag__name'],
+                'compression': row['tag__compression'],
+                'raw_count': row['raw_count'],
+                'stored_count': row['stored_count'],
+                'ratio': row['raw_count'] / row['stored_count'] if row['stored_count'] else None,
+            }
+            for row in page
+        ])
 
 class TagValueViewSet(viewsets.ModelViewSet):
     queryset = TagValue.objects.all()
     serializer_class = TagValueSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TagValuePagination
+    
+    def perform_create(self, serializer):
+        # Одна строка проходит путь пакета: вычисляемые теги, сжатие, буфер записи
+        data = serializer.validated_data
+        values, stored, rejected = ingest_values([{
+            'tag': data['tag'].pk, 'value': data['value'],
+            'quality': data.get('quality', 100), 'timestamp': data.get('timestamp'),
+        }])
+        if rejected:
+            raise ValidationError({'value': rejected[0]['error']})
+        instance = values[0]
+        instance.stored = any(value is instance for value in stored)
+        serializer.instance = instance
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return TagValueCreateSerializer
+        return super().get_serializer_class()
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('tag')
         tag_id = self.request.query_params.get('tag_id')
         start_time = self.request.query_params.get('start_time')
         end_time = self.request.query_params.get('end_time')
@@ -70,15 +197,131 @@ class TagValueViewSet(viewsets.ModelViewSet):
             
         return queryset.order_by('-timestamp')
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        rows = request.data.get('values') if isinstance(request.data, dict) else request.data
+        try:
+            values, stored, rejected = ingest_values(rows)
+        except IngestError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'created': len(values),
+            'stored': len(stored),
+            'rejected': rejected
+        }, status=status.HTTP_201_CREATED if values else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def trend(self, request):
+        query = TrendQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        tag_ids = params['tag_id']
+        start_time, end_time = params['start_time'], params['end_time']
+
+        if params['mode'] == 'lttb':
+            series, tier = lttb_series(tag_ids, start_time, end_time, params['buckets'])
+        else:
+            series, tier = aggregate_buckets(tag_ids, start_time, end_time, params['buckets'])
+
+        return Response({
+            'start_time': start_time,
+            'end_time': end_time,
+            'mode': params['mode'],
+            'bucket_seconds': (end_time - start_time).total_seconds() / params['buckets'],
+            'rollup_seconds': tier,
+            'series': [{'tag_id': tag_id, **series[tag_id]} for tag_id in tag_ids],
+        })
+
+    @action(detail=False, methods=['get'])
+    def statistics(self, request):
+        query = TagRangeQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        tag_ids = params['tag_id']
+        start_time, end_time = params['start_time'], params['end_time']
+
+        statistics = range_statistics(tag_ids, start_time, end_time)
+        return Response({
+            'start_time': start_time,
+            'end_time': end_time,
+            'statistics': [
+                {'tag_id': tag_id, **statistics.get(tag_id, {'count': 0})} for tag_id in tag_ids
+            ],
+        })
+
+    @action(detail=False, methods=['get'])
+    def aligned(self, request):
+        query = AlignedQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        tag_ids = params['tag_id']
+        start_time, end_time = params['start_time'], params['end_time']
+
+        try:
+            grid, matrix = aligned_matrix(tag_ids, start_time, end_time, params['step'], params['fill'])
+        except TrendLimitError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        values = matrix.astype(object)
+        values[np.isnan(matrix)] = None
+        names = dict(Tag.objects.filter(pk__in=tag_ids).values_list('pk', 'name'))
+        return Response({
+            'start_time': start_time,
+            'end_time': end_time,
+            'step': params['step'],
+            'fill': params['fill'],
+            'tags': [{'tag_id': tag_id, 'name': names.get(tag_id)} for tag_id in tag_ids],
+            'timestamps': [datetime.fromtimestamp(epoch, tz=dt_timezone.utc) for epoch in grid.tolist()],
+            'values': values.tolist(),
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        query = ExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        tag_ids = params['tag_id']
+        start_time, end_time = params['start_time'], params['end_time']
+
+        filename = f"tag_values_{start_time:%Y%m%d%H%M}_{end_time:%Y%m%d%H%M}.{params['output']}"
+        if params['output'] == 'npz':
+            response = StreamingHttpResponse(
+                stream_npz(tag_ids, start_time, end_time), content_type='application/octet-stream'
+            )
+        else:
+            response = StreamingHttpResponse(
+                stream_csv(tag_ids, start_time, end_time), content_type='text/csv; charset=utf-8'
+            )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
 class AlarmDefinitionViewSet(viewsets.ModelViewSet):
     queryset = AlarmDefinition.objects.filter(is_enabled=True)
     serializer_class = AlarmDefinitionSerializer
     permission_classes = [IsAuthenticated]
 
+    @action(detail=True, methods=['post'])
+    def shelve(self, request, pk=None):
+        definition = self.get_object()
+        serializer = AlarmShelveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        duration = serializer.validated_data.get('duration', definition.shelve_duration)
+        definition.shelved_until = timezone.now() + timedelta(seconds=duration)
+        definition.save(update_fields=['shelved_until'])
+        return Response({'id': definition.id, 'shelved_until': definition.shelved_until})
+
+    @action(detail=True, methods=['post'])
+    def unshelve(self, request, pk=None):
+        definition = self.get_object()
+        definition.shelved_until = None
+        definition.save(update_fields=['shelved_until'])
+        return Response({'id': definition.id, 'shelved_until': None})
+
 class AlarmViewSet(viewsets.ModelViewSet):
-    queryset = Alarm.objects.all()
+    queryset = Alarm.objects.select_related('alarm_definition__tag', 'acknowledged_by')
     serializer_class = AlarmSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AlarmPagination
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -94,29 +337,122 @@ class AlarmViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def active(self, request):
-        active_alarms = self.queryset.filter(state='ACTIVE')
+        active_alarms = list(self.queryset.filter(state='ACTIVE'))
         serializer = self.get_serializer(active_alarms, many=True)
         return Response({
             'items': serializer.data,
-            'total': active_alarms.count()
+            'total': len(active_alarms)
+        })
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        queryset = Alarm.objects.all()
+        if request.query_params.get('include_resolved') not in ('1', 'true'):
+            queryset = queryset.filter(state__in=OPEN_STATES)
+        rows = list(
+            queryset.values(
+                'state',
+                severity=F('alarm_definition__severity'),
+                object_type=F('alarm_definition__tag__pipeline_object__object_type__name'),
+            ).annotate(count=Count('id')).order_by('state', 'severity', 'object_type')
+        )
+
+        by_state, by_severity, by_object_type = Counter(), Counter(), Counter()
+        for row in rows:
+            by_state[row['state']] += row['count']
+            by_severity[row['severity']] += row['count']
+            by_object_type[row['object_type']] += row['count']
+        return Response({
+            'total': sum(by_state.values()),
+            'by_state': by_state,
+            'by_severity': by_severity,
+            'by_object_type': by_object_type,
+            'rows': rows,
+        })
+
+    @action(detail=False, methods=['post'], url_path='bulk-acknowledge')
+    def bulk_acknowledge(self, request):
+        serializer = AlarmBulkAcknowledgeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        queryset = Alarm.objects.filter(state='ACTIVE')
+        if params.get('ids'):
+            queryset = queryset.filter(id__in=params['ids'])
+        if params.get('severity'):
+            queryset = queryset.filter(alarm_definition__severity=params['severity'])
+
+        now = timezone.now()
+        with transaction.atomic():
+            alarms = list(queryset.select_for_update().only(
+                'id', 'alarm_definition_id', 'triggered_at', 'resolved_at'
+            ))
+            if alarms:
+                ids = [alarm.id for alarm in alarms]
+                Alarm.objects.filter(id__in=ids).update(
+                    state='ACKNOWLEDGED', acknowledged_at=now, acknowledged_by_id=params['acknowledged_by']
+                )
+                for alarm in alarms:
+                    alarm.state = 'ACKNOWLEDGED'
+                    alarm.acknowledged_at = now
+                record_transitions([(alarm, 'ACKNOWLEDGED') for alarm in alarms])
+
+        return Response({
+            'acknowledged': len(alarms),
+            'ids': [alarm.id for alarm in alarms],
+            'acknowledged_at': now,
         })
     
     @action(detail=True, methods=['post'])
     def acknowledge(self, request, pk=None):
         alarm = self.get_object()
         serializer = AlarmAcknowledgeSerializer(data=request.data)
-        
-        if serializer.is_valid():
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        now = timezone.now()
+        with transaction.atomic():
+            # Состояние проверяется под блокировкой строки: служба аварий
+            # могла сбросить аварию, а оператор — уже квитировать
+            alarm = Alarm.objects.select_for_update().only(
+                'id', 'alarm_definition_id', 'state', 'triggered_at', 'resolved_at'
+            ).get(pk=alarm.pk)
+            if alarm.state != 'ACTIVE':
+                return Response(
+                    {'error': 'Квитировать можно только активную аварию', 'state': alarm.state},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            Alarm.objects.filter(pk=alarm.pk, state='ACTIVE').update(
+                state='ACKNOWLEDGED', acknowledged_at=now,
+                acknowledged_by_id=serializer.validated_data['acknowledged_by'],
+            )
             alarm.state = 'ACKNOWLEDGED'
-            alarm.acknowledged_at = timezone.now()
-            alarm.acknowledged_by_id = serializer.validated_data['acknowledged_by']
-            alarm.save()
-            
-            return Response({
-                'id': alarm.id,
-                'message': 'Авария квитирована',
-                'acknowledged_at': alarm.acknowledged_at,
-                'state': alarm.state
-            })
-        
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            alarm.acknowledged_at = now
+            record_transitions([(alarm, 'ACKNOWLEDGED')])
+
+        return Response({
+            'id': alarm.id,
+            'message': 'Авария квитирована',
+            'acknowledged_at': alarm.acknowledged_at,
+            'state': alarm.state
+        })
+
+class ModbusDeviceViewSet(viewsets.ModelViewSet):
+    queryset = ModbusDevice.objects.annotate(point_count=Count('points')).order_by('name')
+    serializer_class = ModbusDeviceSerializer
+    permission_classes = [IsAuthenticated]
+
+class ModbusPointViewSet(viewsets.ModelViewSet):
+    queryset = ModbusPoint.objects.select_related('device', 'tag')
+    serializer_class = ModbusPointSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        device = self.request.query_params.get('device')
+        scan_class = self.request.query_params.get('scan_class')
+        if device:
+            queryset = queryset.filter(device_id=device)
+        if scan_class:
+            queryset = queryset.filter(scan_class=scan_class)
+        return queryset
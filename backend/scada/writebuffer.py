@@ -0,0 +1,408 @@
+"""
+Буфер записи истории (store-and-forward) перед TagValue.
+
+Принятые значения пакета дописываются в локальный журнал из сегментов
+фиксированного размера, отображённых в память (mmap), и затем переносятся
+в БД большими упорядоченными пакетами (replay). Журнал поглощает всплески
+нагрузки и недоступность БД: при перезапуске PostgreSQL значения не
+теряются, а дописываются, когда база снова доступна.
+
+Формат сегмента: блоки [заголовок 16 байт: magic, число записей, crc32
+данных, 0][записи]. Запись — tag_id, значение, качество, признак записи в
+архив (после сжатия), метка времени в микросекундах UTC. Заголовок пишется
+после данных, поэтому оборванная запись не читается (не совпадает magic или
+crc) и затирается следующим добавлением. Дописывать могут несколько
+процессов (блокировка flock), переносит в БД один (отдельная блокировка).
+Прочитанная позиция записывается в БД (IngestBufferCheckpoint) в той же
+транзакции, что и пакет, и после фиксации — в файл checkpoint. Перенос
+продолжается с большей из двух позиций: пакет, зафиксированный до сбоя
+обновления файла, повторно не переносится. Журнал в БД различается по
+случайному идентификатору из файла buffer.id каталога (новый каталог —
+новая позиция).
+"""
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+
+from .cache import metadata
+from .models import IngestBufferCheckpoint, TagValue
+
+logger = logging.getLogger('scada.writebuffer')
+
+OFF, FALLBACK, ALWAYS = 'off', 'fallback', 'always'
+
+MAGIC = 0x31574253
+HEADER = struct.Struct('<IIII')
+RECORD = np.dtype([
+    ('tag_id', '<i8'), ('value', '<f8'), ('quality', '<i2'), ('stored', 'u1'), ('timestamp', '<i8'),
+])
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+SEGMENT_SUFFIX = '.wal'
+
+
+def _segment_name(number):
+    return f'{number:012d}{SEGMENT_SUFFIX}'
+
+
+class _Segment:
+    """Файл сегмента, отображённый в память целиком"""
+
+    def __init__(self, path, size=None):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o640)
+        try:
+            if size is not None and os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.size = os.fstat(fd).st_size
+            self.map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+
+    def blocks(self, offset, verify=True):
+        """Блоки от offset: пары (смещение данных, число записей)"""
+        while offset + HEADER.size <= self.size:
+            magic, count, crc, _ = HEADER.unpack_from(self.map, offset)
+            start = offset + HEADER.size
+            end = start + count * RECORD.itemsize
+            if magic != MAGIC or end > self.size:
+                return
+            if verify and zlib.crc32(self.map[start:end]) != crc:
+                return
+            yield start, count
+            offset = end
+
+    def end(self, offset):
+        for start, count in self.blocks(offset):
+            offset = start + count * RECORD.itemsize
+        return offset
+
+    def close(self):
+        self.map.close()
+
+
+class WriteBuffer:
+    """
+    Журнал буфера записи в каталоге INGEST_BUFFER_DIR. Перенос в БД выполняет
+    фоновый поток процесса, который дописывал в журнал (запускается при
+    первом добавлении), а также задача Celery replay_ingest_buffer и команда
+    manage.py replay_ingest_buffer.
+    """
+
+    def __init__(self, directory=None):
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._tail = None
+        self._tail_number = None
+        self._offset = 0
+        self._thread = None
+        # В журнале этого процесса есть непереносённые значения
+        self.backlog = False
+        self.appended = 0
+        self.replayed = 0
+        self.replay_errors = 0
+        self.replay_rate = 0.0
+
+    @property
+    def directory(self):
+        path = Path(self._directory or settings.INGEST_BUFFER_DIR)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    @contextmanager
+    def _flock(self, name, blocking=True):
+        with open(self.directory / name, 'a') as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _numbers(self):
+        return sorted(int(path.stem) for path in self.directory.glob('*' + SEGMENT_SUFFIX) if path.stem.isdigit())
+
+    @contextmanager
+    def _segments(self, numbers):
+        """Сегменты журнала для чтения; закрываются по выходу"""
+        opened = {}
+        try:
+            for number in numbers:
+                path = self.directory / _segment_name(number)
+                if path.exists():
+                    opened[number] = _Segment(path)
+            yield opened
+        finally:
+            for segment in opened.values():
+                segment.close()
+
+    # --- добавление ---
+
+    def append(self, values, stored):
+        """Дописывает пакет TagValue; stored — часть пакета, которую нужно записать в архив"""
+        if not values:
+            return 0
+        stored_ids = {id(tv) for tv in stored}
+        records = np.array([
+            (tv.tag_id, tv.value, tv.quality, id(tv) in stored_ids, (tv.timestamp - EPOCH) // MICROSECOND)
+            for tv in values
+        ], dtype=RECORD)
+        with self._lock, self._flock('append.lock'):
+            position = 0
+            while position < len(records):
+                segment = self._open_tail()
+                capacity = (segment.size - self._offset - HEADER.size) // RECORD.itemsize
+                if capacity <= 0:
+                    self._open_tail(self._tail_number + 1)
+                    continue
+                chunk = records[position:position + capacity]
+                payload = chunk.tobytes()
+                start = self._offset + HEADER.size
+                segment.map[start:start + len(payload)] = payload
+                HEADER.pack_into(segment.map, self._offset, MAGIC, len(chunk), zlib.crc32(payload), 0)
+                if settings.INGEST_BUFFER_SYNC:
+                    segment.map.flush()
+                self._offset = start + len(payload)
+                position += len(chunk)
+            self.appended += len(records)
+            self.backlog = True
+        self._start_replayer()
+        return len(records)
+
+    def _open_tail(self, create=None):
+        """
+        Последний сегмент (create — номер нового) и конец данных в нём:
+        сегмент могли дописать или сменить другие процессы.
+        """
+        numbers = self._numbers()
+        newest = create or (numbers[-1] if numbers else 1)
+        if newest != self._tail_number:
+            if self._tail is not None:
+                self._tail.close()
+            self._tail = _Segment(
+                self.directory / _segment_name(newest), settings.INGEST_BUFFER_SEGMENT_MB * 1024 * 1024
+            )
+            self._tail_number = newest
+            self._offset = 0
+        self._offset = self._tail.end(self._offset)
+        return self._tail
+
+    # --- перенос в БД ---
+
+    def _buffer_id(self):
+        """Идентификатор журнала каталога (создаётся при первом обращении)"""
+        path = self.directory / 'buffer.id'
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o640)
+        except FileExistsError:
+            return path.read_text().strip()
+        buffer_id = uuid.uuid4().hex
+        with os.fdopen(fd, 'w') as handle:
+            handle.write(buffer_id + '\n')
+        return buffer_id
+
+    def _read_checkpoint(self):
+        try:
+            number, offset = (self.directory / 'checkpoint').read_text().split()
+            return int(number), int(offset)
+        except (FileNotFoundError, ValueError):
+            numbers = self._numbers()
+            return (numbers[0] if numbers else 1), 0
+
+    def _write_checkpoint(self, number, offset):
+        path = self.directory / 'checkpoint'
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(f'{number} {offset}\n')
+        os.replace(temporary, path)
+
+    def _checkpoint(self, buffer_id):
+        """Позиция переноса: большая из файла checkpoint и записи в БД"""
+        position = self._read_checkpoint()
+        stored = (
+            IngestBufferCheckpoint.objects.filter(buffer=buffer_id).values_list('segment', 'offset').first()
+        )
+        return max(position, stored) if stored else position
+
+    def _collect(self, checkpoint, limit):
+        """
+        Записи от checkpoint (не больше limit) и позиция после них. Сегмент,
+        за которым есть следующий, закрыт для добавления: дочитав его,
+        позиция переходит в начало следующего.
+        """
+        number, offset = checkpoint
+        numbers = [item for item in self._numbers() if item >= number]
+        chunks = []
+        total = 0
+        with self._segments(numbers) as segments:
+            for current in numbers:
+                if current != number:
+                    number, offset = current, 0
+                segment = segments.get(current)
+                if segment is None:
+                    continue
+                for start, count in segment.blocks(offset):
+                    if total and total + count > limit:
+                        return chunks, number, offset
+                    chunks.append(np.frombuffer(segment.map, dtype=RECORD, count=count, offset=start).copy())
+                    total += count
+                    offset = start + count * RECORD.itemsize
+        return chunks, number, offset
+
+    def replay(self, limit=None):
+        """
+        Переносит в БД одну порцию (до INGEST_REPLAY_BATCH_ROWS записей).
+        Возвращает число перенесённых записей; 0 — журнал пуст или перенос
+        уже выполняет другой процесс.
+        """
+        limit = limit or settings.INGEST_REPLAY_BATCH_ROWS
+        with self._flock('replay.lock', blocking=False) as locked:
+            if not locked:
+                return 0
+            buffer_id = self._buffer_id()
+            checkpoint = self._checkpoint(buffer_id)
+            chunks, number, offset = self._collect(checkpoint, limit)
+            records = np.concatenate(chunks) if chunks else np.empty(0, dtype=RECORD)
+            if (number, offset) != checkpoint:
+                began = time.perf_counter()
+                # Пакет и позиция после него фиксируются вместе
+                # (позиция — первой: запись пакета заканчивается событиями
+                # аварий под блокировкой, см. lock_event_sequence)
+                with transaction.atomic():
+                    IngestBufferCheckpoint.objects.update_or_create(
+                        buffer=buffer_id, defaults={'segment': number, 'offset': offset},
+                    )
+                    self._write(records)
+                elapsed = time.perf_counter() - began
+                if len(records):
+                    self.replay_rate = len(records) / elapsed if elapsed else 0.0
+                    self.replayed += len(records)
+            if (number, offset) != self._read_checkpoint():
+                self._write_checkpoint(number, offset)
+            if len(records) < limit:
+                self.backlog = False
+            for old in self._numbers():
+                if old < number:
+                    (self.directory / _segment_name(old)).unlink(missing_ok=True)
+            return len(records)
+
+    def _write(self, records):
+        """Записи журнала в архив, аварии и текущие значения; вызывается в транзакции replay"""
+        from .ingest import insert_values, on_values_written
+
+        # Теги, удалённые после записи в буфер, пропускаются
+        known = metadata.tags(set(np.unique(records['tag_id']).tolist()))
+        # Порядок журнала сохраняется для аварий и текущих значений;
+        # в архив строки пишутся по (тег, время)
+        values = []
+        stored = []
+        skipped = 0
+        for tag_id, value, quality, is_stored, micros in records.tolist():
+            if tag_id not in known:
+                skipped += 1
+                continue
+            tv = TagValue(tag_id=tag_id, value=value, quality=quality, timestamp=EPOCH + micros * MICROSECOND)
+            values.append(tv)
+            if is_stored:
+                stored.append(tv)
+        if skipped:
+            logger.warning('Буфер записи: пропущено %d значений удалённых тегов', skipped)
+        if not values:
+            return
+        insert_values(sorted(stored, key=lambda tv: (tv.tag_id, tv.timestamp)))
+        on_values_written(values, stored)
+
+    def drain(self):
+        """Переносит всё накопленное; возвращает число записей"""
+        total = 0
+        while True:
+            replayed = self.replay()
+            total += replayed
+            if not replayed:
+                return total
+
+    def _start_replayer(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._replay_loop, name='scada-writebuffer', daemon=True)
+                self._thread.start()
+
+    def _replay_loop(self):
+        interval = settings.INGEST_REPLAY_INTERVAL
+        delay = interval
+        while True:
+            try:
+                replayed = self.replay()
+                delay = interval
+            except DatabaseError as exc:
+                self.replay_errors += 1
+                logger.warning('Буфер записи: БД недоступна (%s), повтор через %.1f с', exc, delay)
+                connection.close()
+                replayed = 0
+                delay = min(delay * 2, settings.INGEST_REPLAY_MAX_BACKOFF)
+            except Exception:
+                self.replay_errors += 1
+                logger.exception('Буфер записи: ошибка переноса')
+                replayed = 0
+                delay = min(delay * 2, settings.INGEST_REPLAY_MAX_BACKOFF)
+            finally:
+                close_old_connections()
+            # Полная порция — журнал не разобран, продолжаем без паузы
+            if replayed < settings.INGEST_REPLAY_BATCH_ROWS:
+                time.sleep(delay)
+
+    # --- состояние ---
+
+    def depth(self):
+        """Число записей, ещё не перенесённых в БД"""
+        number, offset = self._read_checkpoint()
+        total = 0
+        with self._segments([item for item in self._numbers() if item >= number]) as segments:
+            for current, segment in segments.items():
+                for _, count in segment.blocks(offset if current == number else 0, verify=False):
+                    total += count
+        return total
+
+    def stats(self):
+        return {
+            'depth': self.depth(),
+            'segments': len(self._numbers()),
+            'appended': self.appended,
+            'replayed': self.replayed,
+            'replay_errors': self.replay_errors,
+            'replay_rate': round(self.replay_rate, 1),
+        }
+
+
+write_buffer = WriteBuffer()
+
+
+def collect_metrics():
+    """Состояние буфера записи для /metrics"""
+    if settings.INGEST_BUFFER == OFF:
+        return []
+    stats = write_buffer.stats()
+    return [
+        ('scada_ingest_buffer_depth', 'gauge', 'Значений в буфере записи, ещё не перенесённых в БД', stats['depth']),
+        ('scada_ingest_buffer_segments', 'gauge', 'Файлов сегментов буфера записи', stats['segments']),
+        ('scada_ingest_buffer_appended_total', 'counter', 'Значений, записанных в буфер этим процессом', stats['appended']),
+        ('scada_ingest_buffer_replayed_total', 'counter', 'Значений, перенесённых из буфера в БД этим процессом', stats['replayed']),
+        ('scada_ingest_buffer_replay_errors_total', 'counter', 'Ошибок переноса из буфера в БД', stats['replay_errors']),
+        ('scada_ingest_buffer_replay_rows_per_second', 'gauge', 'Скорость последнего переноса, значений/с', stats['replay_rate']),
+    ]
@@ -24,6 +24,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'scada.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -53,24 +54,61 @@ TEMPLATES = [
 ]
 
 # Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': config('DB_NAME', default='scada_db'),
-        'USER': config('DB_USER', default='scada_user'),
-        'PASSWORD': config('DB_PASSWORD', default='scada_password'),
-        'HOST': config('DB_HOST', default='localhost'),
-        'PORT': config('DB_PORT', default='5432'),
+# DB_ENGINE=sqlite включает SQLite для разработки (без секционирования истории)
+DB_ENGINE = config('DB_ENGINE', default='postgresql')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='scada_db'),
+            'USER': config('DB_USER', default='scada_user'),
+            'PASSWORD': config('DB_PASSWORD', default='scada_password'),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+        }
+    }
+
+# История значений тегов (PostgreSQL: помесячные секции scada_tagvalue)
+TAGVALUE_PARTITION_MONTHS_AHEAD = config('TAGVALUE_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+# Срок хранения сырых значений в днях (0 — хранить бессрочно)
+TAGVALUE_RETENTION_DAYS = config('TAGVALUE_RETENTION_DAYS', default=0, cast=int)
 
-# SQLite for development (uncomment if needed)
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.sqlite3',
-#         'NAME': BASE_DIR / 'db.sqlite3',
-#     }
-# }
+# Тренды: ограничения запроса /api/tag-values/trend/
+TREND_MAX_BUCKETS = config('TREND_MAX_BUCKETS', default=5000, cast=int)
+TREND_MAX_TAGS = config('TREND_MAX_TAGS', default=20, cast=int)
+# LTTB: при числе сырых значений тега больше TREND_LTTB_OVERSAMPLE × точек ряд
+# предварительно прореживается в БД (минимум и максимум корзины)
+TREND_LTTB_OVERSAMPLE = config('TREND_LTTB_OVERSAMPLE', default=4, cast=int)
+# Значения на общей сетке: не больше строк сырых значений за запрос
+TREND_ALIGNED_MAX_ROWS = config('TREND_ALIGNED_MAX_ROWS', default=2000000, cast=int)
+
+# Выгрузка истории /api/tag-values/export/: тегов за запрос и строк в одной части потока
+EXPORT_MAX_TAGS = config('EXPORT_MAX_TAGS', default=200, cast=int)
+EXPORT_CHUNK_ROWS = config('EXPORT_CHUNK_ROWS', default=20000, cast=int)
+
+# Агрегаты истории (1 минута / 1 час), строятся задачами Celery
+# Задержка построения относительно текущего времени и окно пересчёта опоздавших значений, с
+ROLLUP_DELAY_SECONDS = config('ROLLUP_DELAY_SECONDS', default=60, cast=int)
+ROLLUP_RECOMPUTE_SECONDS = config('ROLLUP_RECOMPUTE_SECONDS', default=300, cast=int)
+# Сколько интервалов обрабатывается в одной транзакции
+ROLLUP_CHUNK_INTERVALS = config('ROLLUP_CHUNK_INTERVALS', default=60, cast=int)
+# Сколько часов с опоздавшими значениями (RollupDirtyHour) пересчитывается за один запуск
+ROLLUP_DIRTY_HOURS_PER_RUN = config('ROLLUP_DIRTY_HOURS_PER_RUN', default=24, cast=int)
+# Сроки хранения агрегатов в днях (0 — бессрочно). Не меньше срока более
+# точного уровня: TAGVALUE_RETENTION_DAYS <= 1M <= 1H (проверка scada.E001/E002)
+ROLLUP_1M_RETENTION_DAYS = config('ROLLUP_1M_RETENTION_DAYS', default=0, cast=int)
+ROLLUP_1H_RETENTION_DAYS = config('ROLLUP_1H_RETENTION_DAYS', default=0, cast=int)
+# Срок хранения событий аварий (поток /ws/alarms/, дочитывание по last_seq) в днях (0 — бессрочно)
+ALARM_EVENT_RETENTION_DAYS = config('ALARM_EVENT_RETENTION_DAYS', default=30, cast=int)
+ALARM_EVENT_DELETE_BATCH = config('ALARM_EVENT_DELETE_BATCH', default=10000, cast=int)
 
 LANGUAGE_CODE = 'ru-ru'
 TIME_ZONE = 'Europe/Moscow'
@@ -91,6 +129,18 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # Change to IsAuthenticated for production
     ],
+    # orjson вместо json; MessagePack по Accept/Content-Type application/msgpack
+    'DEFAULT_RENDERER_CLASSES': [
+        'scada.renderers.ORJSONRenderer',
+        'scada.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'scada.renderers.ORJSONParser',
+        'scada.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 50
 }
@@ -102,16 +152,136 @@ CORS_ALLOW_CREDENTIALS = True
 # Channels (WebSocket)
 ASGI_APPLICATION = 'scada_backend.asgi.application'
 
-# Redis for Channels
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        'CONFIG': {
-            "hosts": [('127.0.0.1', 6379)],
+# Redis for Channels; CHANNEL_LAYER=memory — слой в памяти процесса (тесты, разработка)
+if config('CHANNEL_LAYER', default='redis') == 'memory':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
         },
-    },
-}
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                "hosts": [(config('REDIS_HOST', default='127.0.0.1'), config('REDIS_PORT', default=6379, cast=int))],
+            },
+        },
+    }
+
+# Общий кэш процессов (счётчик версии конфигурации для кэша метаданных);
+# CACHE_BACKEND=memory — кэш в памяти процесса (тесты, разработка, один воркер)
+if config('CACHE_BACKEND', default='redis') == 'memory':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config(
+                'CACHE_URL',
+                default=f"redis://{config('REDIS_HOST', default='127.0.0.1')}:{config('REDIS_PORT', default=6379, cast=int)}/1",
+            ),
+        },
+    }
+
+# Как часто (с) процесс сверяет свою версию кэша метаданных с общей
+METADATA_CACHE_CHECK_SECONDS = config('METADATA_CACHE_CHECK_SECONDS', default=1.0, cast=float)
+# Повтор сверки версии, если общий кэш (Redis) недоступен (с)
+METADATA_CACHE_RETRY_SECONDS = config('METADATA_CACHE_RETRY_SECONDS', default=5.0, cast=float)
+# Срок хранения структуры дерева активов в общем кэше (с); ключ — версия конфигурации
+ASSET_TREE_CACHE_SECONDS = config('ASSET_TREE_CACHE_SECONDS', default=86400, cast=int)
+
+# Метрики /metrics (Prometheus): латентность и SQL по маршрутам API и consumer-ам
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+# Доступ к /metrics: с заголовком Authorization: Bearer <METRICS_TOKEN> (если
+# задан) или с адресов METRICS_ALLOWED_NETWORKS (REMOTE_ADDR; по умолчанию
+# только loopback). METRICS_PUBLIC=True открывает эндпоинт всем
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_ALLOWED_NETWORKS = config(
+    'METRICS_ALLOWED_NETWORKS', default='127.0.0.0/8,::1/128',
+    cast=lambda v: [s.strip() for s in v.split(',') if s.strip()],
+)
+METRICS_PUBLIC = config('METRICS_PUBLIC', default=False, cast=bool)
+# Запросы дольше порога (мс) пишутся в лог scada.metrics с первыми SLOW_REQUEST_LOG_QUERIES SQL
+SLOW_REQUEST_MS = config('SLOW_REQUEST_MS', default=500, cast=int)
+SLOW_REQUEST_LOG_QUERIES = config('SLOW_REQUEST_LOG_QUERIES', default=20, cast=int)
+
+# Максимум id аварий в одном запросе /api/alarms/bulk-acknowledge/
+ALARM_BULK_ACK_MAX = config('ALARM_BULK_ACK_MAX', default=10000, cast=int)
+
+# Служба сбора данных Modbus TCP (manage.py run_acquisition): период и размер
+# пакета записи, максимальный разрыв адресов внутри одного блочного чтения
+ACQUISITION_FLUSH_SECONDS = config('ACQUISITION_FLUSH_SECONDS', default=0.5, cast=float)
+ACQUISITION_BATCH_ROWS = config('ACQUISITION_BATCH_ROWS', default=20000, cast=int)
+MODBUS_MAX_GAP = config('MODBUS_MAX_GAP', default=8, cast=int)
+
+# Буфер записи истории (scada/writebuffer.py): off — запись только в БД,
+# fallback — в буфер при недоступности БД, always — всегда через буфер
+INGEST_BUFFER = config('INGEST_BUFFER', default='off')
+INGEST_BUFFER_DIR = config('INGEST_BUFFER_DIR', default=str(BASE_DIR / 'var' / 'ingest-buffer'))
+INGEST_BUFFER_SEGMENT_MB = config('INGEST_BUFFER_SEGMENT_MB', default=64, cast=int)
+# msync после каждого добавления: сохранность при сбое ОС ценой задержки записи
+INGEST_BUFFER_SYNC = config('INGEST_BUFFER_SYNC', default=False, cast=bool)
+INGEST_REPLAY_BATCH_ROWS = config('INGEST_REPLAY_BATCH_ROWS', default=50000, cast=int)
+INGEST_REPLAY_INTERVAL = config('INGEST_REPLAY_INTERVAL', default=0.5, cast=float)
+INGEST_REPLAY_MAX_BACKOFF = config('INGEST_REPLAY_MAX_BACKOFF', default=10.0, cast=float)
+
+# Интервал (секунды) отправки накопленных обновлений тегов одним кадром
+TAG_PUSH_INTERVAL = config('TAG_PUSH_INTERVAL', default=0.5, cast=float)
+# Наибольшее число значений в одном кадре tag_updates (снимок подписки на
+# все теги делится на несколько кадров)
+TAG_UPDATES_CHUNK = config('TAG_UPDATES_CHUNK', default=500, cast=int)
+# Сколько пропущенных событий аварий досылается при переподключении вместо снимка
+ALARM_RESUME_MAX_EVENTS = config('ALARM_RESUME_MAX_EVENTS', default=5000, cast=int)
+
+# Обнаружение утечек по балансу расхода между НПС (scada/leaks.py):
+# LEAK_DETECTION=True — процессы записи публикуют отсчёты тегов расхода
+# для службы run_leak_detection
+LEAK_DETECTION = config('LEAK_DETECTION', default=False, cast=bool)
+LEAK_STATION_TYPE = config('LEAK_STATION_TYPE', default='НПС')
+LEAK_FLOW_TEMPLATE = config('LEAK_FLOW_TEMPLATE', default='FLOW_{index}')
+LEAK_IMBALANCE_TEMPLATE = config('LEAK_IMBALANCE_TEMPLATE', default='IMBALANCE_{index}')
+# Интервал окна и длина окна баланса, с; период расчёта небаланса, с
+LEAK_BUCKET_SECONDS = config('LEAK_BUCKET_SECONDS', default=1.0, cast=float)
+LEAK_WINDOW_SECONDS = config('LEAK_WINDOW_SECONDS', default=300.0, cast=float)
+LEAK_EVALUATE_SECONDS = config('LEAK_EVALUATE_SECONDS', default=1.0, cast=float)
+# Порог аварии (% входного расхода) и задержка срабатывания, с — для
+# определений аварий, создаваемых run_leak_detection --provision
+LEAK_THRESHOLD_PCT = config('LEAK_THRESHOLD_PCT', default=2.0, cast=float)
+LEAK_ALARM_DELAY = config('LEAK_ALARM_DELAY', default=60.0, cast=float)
+# Участок не считается, если станция молчит дольше LEAK_STALE_SECONDS или
+# средний расход на входе ниже LEAK_MIN_FLOW; отсчёты хуже LEAK_MIN_QUALITY отбрасываются
+LEAK_STALE_SECONDS = config('LEAK_STALE_SECONDS', default=30.0, cast=float)
+LEAK_MIN_FLOW = config('LEAK_MIN_FLOW', default=1.0, cast=float)
+LEAK_MIN_QUALITY = config('LEAK_MIN_QUALITY', default=50, cast=int)
 
 # Celery
-CELERY_BROKER_URL = 'redis://localhost:6379'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379'
\ No newline at end of file
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379')
+CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://localhost:6379')
+# CELERY_TASK_ALWAYS_EAGER=True — задачи выполняются сразу в вызывающем процессе (тесты, разработка)
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_BEAT_SCHEDULE = {
+    'build-minute-rollups': {
+        'task': 'scada.tasks.build_rollups_task',
+        'schedule': 60.0,
+        'args': (60,),
+    },
+    'build-hour-rollups': {
+        'task': 'scada.tasks.build_rollups_task',
+        'schedule': 600.0,
+        'args': (3600,),
+    },
+    'maintain-history': {
+        'task': 'scada.tasks.maintain_history',
+        'schedule': 3600.0,
+    },
+    'replay-ingest-buffer': {
+        'task': 'scada.tasks.replay_ingest_buffer',
+        'schedule': 30.0,
+    },
+}
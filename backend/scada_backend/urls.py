@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse
+from scada.metrics import metrics_view
 
 def api_root(request):
     return JsonResponse({
@@ -11,6 +12,7 @@ def api_root(request):
             'tags': '/api/tags/',
             'alarms': '/api/alarms/',
             'pipeline_objects': '/api/pipeline-objects/',
+            'metrics': '/metrics',
         }
     })
 
@@ -18,4 +20,5 @@ urlpatterns = [
     path('', api_root, name='home'),
     path('admin/', admin.site.urls),
     path('api/', include('scada.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -5,6 +5,7 @@ interface WebSocketMessage {
   data?: any
   message?: string
   action?: string
+  last_seq?: number
 }
 
 export function useWebSocket() {
@@ -61,10 +62,11 @@ export function useWebSocket() {
     })
   }
 
-  const subscribeToAlarms = () => {
+  const subscribeToAlarms = (lastSeq?: number) => {
     send({
       type: 'subscribe_alarms',
-      action: 'subscribe_alarms'
+      action: 'subscribe_alarms',
+      last_seq: lastSeq
     })
   }
 
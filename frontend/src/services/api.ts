@@ -76,6 +76,33 @@ export interface PipelineObject {
   description: string
 }
 
+export interface ObjectType {
+  id: number
+  name: string
+  description: string
+}
+
+export interface AssetTreeTag {
+  id: number
+  name: string
+  description: string
+  data_type: string
+  engineering_units: string
+  min_value: number
+  max_value: number
+  current_value: number | null
+  current_quality: number | null
+  current_timestamp: string | null
+}
+
+export interface AssetTreeObject extends Omit<PipelineObject, 'object_type_name'> {
+  tags: AssetTreeTag[]
+}
+
+export interface AssetTreeType extends ObjectType {
+  objects: AssetTreeObject[]
+}
+
 export interface TagValue {
   id: number
   tag: number
@@ -85,6 +112,45 @@ export interface TagValue {
   timestamp: string
 }
 
+export interface TrendSeries {
+  tag_id: number
+  timestamp: string[]
+  min?: number[]
+  max?: number[]
+  avg?: number[]
+  count?: number[]
+  first?: number[]
+  last?: number[]
+  value?: number[]
+}
+
+export interface TrendResponse {
+  start_time: string
+  end_time: string
+  mode: 'aggregate' | 'lttb'
+  bucket_seconds: number
+  rollup_seconds: 60 | 3600 | null
+  series: TrendSeries[]
+}
+
+export interface AlignedResponse {
+  start_time: string
+  end_time: string
+  step: number
+  fill: 'previous' | 'linear'
+  tags: { tag_id: number, name: string | null }[]
+  timestamps: string[]
+  values: (number | null)[][]
+}
+
+export interface AlarmSummary {
+  total: number
+  by_state: Record<string, number>
+  by_severity: Record<string, number>
+  by_object_type: Record<string, number>
+  rows: { state: string, severity: string, object_type: string, count: number }[]
+}
+
 export interface ApiResponse<T> {
   count?: number
   next?: string
@@ -106,6 +172,28 @@ export const apiService = {
       params: { tag_id: tagId, start_time: startTime, end_time: endTime }
     }).then(res => res.data),
 
+  getTagTrend: (
+    tagIds: number[],
+    startTime?: string,
+    endTime?: string,
+    buckets = 500,
+    mode: 'aggregate' | 'lttb' = 'aggregate'
+  ): Promise<TrendResponse> =>
+    api.get('/tag-values/trend/', {
+      params: { tag_id: tagIds.join(','), start_time: startTime, end_time: endTime, buckets, mode }
+    }).then(res => res.data),
+
+  getAlignedValues: (
+    tagIds: number[],
+    startTime?: string,
+    endTime?: string,
+    step = 60,
+    fill: 'previous' | 'linear' = 'previous'
+  ): Promise<AlignedResponse> =>
+    api.get('/tag-values/aligned/', {
+      params: { tag_id: tagIds.join(','), start_time: startTime, end_time: endTime, step, fill }
+    }).then(res => res.data),
+
   // Alarms
   getAlarms: (params?: any): Promise<ApiResponse<Alarm>> =>
     api.get('/alarms/', { params }).then(res => res.data),
@@ -116,12 +204,27 @@ export const apiService = {
   acknowledgeAlarm: (alarmId: number, userId: number): Promise<any> =>
     api.post(`/alarms/${alarmId}/acknowledge/`, { acknowledged_by: userId }),
 
+  bulkAcknowledgeAlarms: (
+    userId: number,
+    options: { ids?: number[], all_active?: boolean, severity?: string }
+  ): Promise<{ acknowledged: number, ids: number[], acknowledged_at: string }> =>
+    api.post('/alarms/bulk-acknowledge/', { acknowledged_by: userId, ...options }).then(res => res.data),
+
+  getAlarmSummary: (includeResolved = false): Promise<AlarmSummary> =>
+    api.get('/alarms/summary/', { params: { include_resolved: includeResolved ? 1 : undefined } })
+      .then(res => res.data),
+
   // Pipeline Objects
   getPipelineObjects: (params?: any): Promise<ApiResponse<PipelineObject>> =>
     api.get('/pipeline-objects/', { params }).then(res => res.data),
 
-  getObjectTypes: (): Promise<ApiResponse<any>> =>
+  getObjectTypes: (): Promise<ApiResponse<ObjectType>> =>
     api.get('/object-types/').then(res => res.data),
+
+  // Дерево активов одним запросом; повторные запросы браузер
+  // подтверждает по ETag (304 без тела)
+  getAssetTree: (params?: { object_type?: number, values?: 0 | 1 }): Promise<AssetTreeType[]> =>
+    api.get('/pipeline-objects/tree/', { params }).then(res => res.data),
 }
 
 export default api
\ No newline at end of file